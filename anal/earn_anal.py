@@ -1,7 +1,9 @@
 import pandas as pd
 import concurrent.futures
+import llm_telemetry
 from openaicall import get_predictions
-from fetcherv6 import net_income_direction, get_company_name, fetch_datx_y
+from evaluation import running_metrics
+from fetcherv6 import net_income_direction, get_company_name, fetch_datx_y, fetch_scope
 import logging
 import time
 
@@ -34,28 +36,10 @@ def process_year(year_data, company_name, actual_earnings):
         return None
 
 def calculate_metrics(df):
-    df['Correct'] = df['Actual Earnings Direction'] == df['Predicted Earnings Direction']
-    
-    df['TP'] = ((df['Actual Earnings Direction'] == 'increase') & (df['Predicted Earnings Direction'] == 'increase')).astype(int)
-    df['FP'] = ((df['Actual Earnings Direction'] == 'decrease') & (df['Predicted Earnings Direction'] == 'increase')).astype(int)
-    df['TN'] = ((df['Actual Earnings Direction'] == 'decrease') & (df['Predicted Earnings Direction'] == 'decrease')).astype(int)
-    df['FN'] = ((df['Actual Earnings Direction'] == 'increase') & (df['Predicted Earnings Direction'] == 'decrease')).astype(int)
-
-    df['Cumulative Accuracy'] = df['Correct'].expanding().mean()
-    
-    df['Cumulative Precision'] = (df['TP'].expanding().sum() /
-                                  (df['TP'].expanding().sum() + 
-                                   df['FP'].expanding().sum()))
-    
-    df['Cumulative Recall'] = (df['TP'].expanding().sum() /
-                               (df['TP'].expanding().sum() + 
-                                df['FN'].expanding().sum()))
-    
-    df['Cumulative F1-Score'] = (2 * df['Cumulative Precision'] * df['Cumulative Recall'] / 
-                                 (df['Cumulative Precision'] + df['Cumulative Recall']))
-
-    return df
+    return running_metrics(df, by=None)
 
+# Share the statement fetches of get_predictions, net_income_direction and fetch_datx_y
+@fetch_scope()
 def analyze_earnings(cvm_code):
     start_time = time.time()
 
@@ -121,3 +105,6 @@ if __name__ == "__main__":
     cvm_code = input("Enter the CVM code: ")
     result_df = analyze_earnings(cvm_code)
     print(result_df)
+    # Where the LLM time and money went
+    llm_telemetry.telemetry.write_report()
+    logging.info(f"LLM calls: {llm_telemetry.telemetry.summary()}")
@@ -1,7 +1,8 @@
 import pandas as pd
 import concurrent.futures
 from openaicall import get_predictions
-from fetcherv6 import net_income_direction, get_company_name, fetch_datx_y
+from evaluation import running_metrics
+from fetcherv6 import net_income_direction, get_company_name, fetch_datx_y, fetch_scope
 import logging
 import time
 
@@ -34,28 +35,10 @@ def process_year(year_data, company_name, actual_earnings):
         return None
 
 def calculate_metrics(df, window_size=3):
-    df['Correct'] = df['Actual Earnings Direction'] == df['Predicted Earnings Direction']
-    
-    df['TP'] = ((df['Actual Earnings Direction'] == 'increase') & (df['Predicted Earnings Direction'] == 'increase')).astype(int)
-    df['FP'] = ((df['Actual Earnings Direction'] == 'decrease') & (df['Predicted Earnings Direction'] == 'increase')).astype(int)
-    df['TN'] = ((df['Actual Earnings Direction'] == 'decrease') & (df['Predicted Earnings Direction'] == 'decrease')).astype(int)
-    df['FN'] = ((df['Actual Earnings Direction'] == 'increase') & (df['Predicted Earnings Direction'] == 'decrease')).astype(int)
-
-    df['Rolling Accuracy'] = df['Correct'].rolling(window=window_size, min_periods=1).mean()
-    
-    df['Rolling Precision'] = (df['TP'].rolling(window=window_size, min_periods=1).sum() /
-                               (df['TP'].rolling(window=window_size, min_periods=1).sum() + 
-                                df['FP'].rolling(window=window_size, min_periods=1).sum()))
-    
-    df['Rolling Recall'] = (df['TP'].rolling(window=window_size, min_periods=1).sum() /
-                            (df['TP'].rolling(window=window_size, min_periods=1).sum() + 
-                             df['FN'].rolling(window=window_size, min_periods=1).sum()))
-    
-    df['Rolling F1-Score'] = (2 * df['Rolling Precision'] * df['Rolling Recall'] / 
-                              (df['Rolling Precision'] + df['Rolling Recall']))
-
-    return df
+    return running_metrics(df, by=None, window=window_size)
 
+# Share the statement fetches of get_predictions, net_income_direction and fetch_datx_y
+@fetch_scope()
 def analyze_earnings(cvm_code):
     start_time = time.time()
 
@@ -0,0 +1,183 @@
+# async_fetcher.py
+import asyncio
+import importlib.util
+import logging
+import os
+import weakref
+import pandas as pd
+import fetcherv6
+from fetcherv6 import (_to_native, _text, _statement_query, _projected_columns, _resolve_accounts,
+                       _resolve_aggregate, _scope_key, current_scope, get_database_url, get_dialect_name, fetch_data,
+                       STATEMENT_SHAPERS)
+
+# Async connection pool settings
+ASYNC_POOL_SIZE = int(os.getenv("FINLLM_ASYNC_POOL_SIZE", "20"))
+ASYNC_MAX_OVERFLOW = int(os.getenv("FINLLM_ASYNC_MAX_OVERFLOW", "10"))
+ASYNC_POOL_RECYCLE = int(os.getenv("FINLLM_POOL_RECYCLE", "1800"))
+
+# Queries allowed in flight at once on a loop; the rest wait (backpressure)
+MAX_IN_FLIGHT = int(os.getenv("FINLLM_MAX_IN_FLIGHT", "200"))
+
+# Seconds before a single query (including waiting for a pooled connection) is abandoned
+QUERY_TIMEOUT = float(os.getenv("FINLLM_QUERY_TIMEOUT", "30"))
+
+_async_engine = None
+_limiters = weakref.WeakKeyDictionary()
+
+
+def async_driver_available():
+    """True when the backend is Postgres and asyncpg is installed, so the native async engine can be used."""
+    return get_dialect_name() == "postgresql" and importlib.util.find_spec("asyncpg") is not None
+
+
+def get_async_engine():
+    """Return the shared async engine, creating it on first use."""
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        _async_engine = create_async_engine(
+            get_database_url("postgresql+asyncpg"),
+            pool_size=ASYNC_POOL_SIZE,
+            max_overflow=ASYNC_MAX_OVERFLOW,
+            pool_recycle=ASYNC_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+    return _async_engine
+
+
+async def dispose_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+
+def _limiter():
+    # asyncio primitives belong to one loop, so keep one semaphore per running loop
+    loop = asyncio.get_running_loop()
+    semaphore = _limiters.get(loop)
+    if semaphore is None:
+        semaphore = _limiters[loop] = asyncio.Semaphore(MAX_IN_FLIGHT)
+    return semaphore
+
+
+async def _execute_async(query, params):
+    async with get_async_engine().connect() as conn:
+        result = await conn.execute(_text(query, params), params)
+        return pd.DataFrame(result.fetchall(), columns=result.keys())
+
+
+async def fetch_data_async(query, params=None, timeout=None, use_sync=False):
+    """Async counterpart of fetch_data.
+
+    Runs on the pooled async engine when asyncpg is available; otherwise (or with
+    use_sync=True) the sync fetch_data runs in a worker thread. Returns an empty
+    DataFrame on database errors and timeouts, like fetch_data. A worker thread
+    cannot be interrupted, so a timed-out one keeps its MAX_IN_FLIGHT slot
+    until its query ends.
+    """
+    from sqlalchemy.exc import SQLAlchemyError
+    if params:
+        params = {key: _to_native(value) for key, value in params.items()}
+    timeout = QUERY_TIMEOUT if timeout is None else timeout
+    semaphore = _limiter()
+    await semaphore.acquire()
+    worker = None
+    try:
+        async with asyncio.timeout(timeout):
+            if use_sync or not async_driver_available():
+                worker = asyncio.ensure_future(asyncio.to_thread(fetch_data, query, params))
+                return await asyncio.shield(worker)
+            return await _execute_async(query, params or {})
+    except TimeoutError:
+        logging.error(f"Query timed out after {timeout:.1f} seconds")
+    except SQLAlchemyError as e:
+        logging.error(f"Error fetching data: {e}")
+    finally:
+        if worker is not None and not worker.done():
+            worker.add_done_callback(lambda _: semaphore.release())
+        else:
+            semaphore.release()
+    return pd.DataFrame()
+
+
+def _build_query(table, aggregate_in_db):
+    # The column lists are read from the schema once per process and cached
+    return _statement_query(table, aggregate_in_db, _projected_columns(table, _resolve_accounts(table, None)))
+
+
+async def _fetch_statement_async(table, cvm_code, timeout=None, use_sync=False, aggregate_in_db=None):
+    """Shaped statement of one company, as the sync fetch_<table> returns it.
+
+    Inside a fetch_scope() the result is shared with every sync and async
+    fetch of the same statement.
+    """
+    aggregate = _resolve_aggregate(aggregate_in_db)
+
+    async def fetch():
+        if fetcherv6.DATA_SOURCE == "snapshot":
+            df = await asyncio.to_thread(fetcherv6._fetch_statement_rows, table, [cvm_code], None, None,
+                                         _resolve_accounts(table, None), aggregate)
+        else:
+            query = await asyncio.to_thread(_build_query, table, aggregate)
+            df = await fetch_data_async(query, {'cvm_code': cvm_code}, timeout, use_sync)
+        return STATEMENT_SHAPERS[table](df)
+
+    scope = current_scope()
+    if scope is None:
+        return await fetch()
+    key = _scope_key(f"fetch_{table}", cvm_code, aggregate, None)
+    # Callers reshape the frames they get, so each one receives its own copy
+    return (await scope.get_or_fetch_async(key, fetch)).copy()
+
+
+async def fetch_balance_sheet_async(cvm_code, timeout=None, use_sync=False, aggregate_in_db=None):
+    return await _fetch_statement_async('balance_sheet', cvm_code, timeout, use_sync, aggregate_in_db)
+
+
+async def fetch_income_statement_async(cvm_code, timeout=None, use_sync=False, aggregate_in_db=None):
+    return await _fetch_statement_async('income_statement', cvm_code, timeout, use_sync, aggregate_in_db)
+
+
+async def fetch_cash_flow_async(cvm_code, timeout=None, use_sync=False, aggregate_in_db=None):
+    return await _fetch_statement_async('cash_flow', cvm_code, timeout, use_sync, aggregate_in_db)
+
+
+async def fetch_financials_async(cvm_code, timeout=None, use_sync=False, aggregate_in_db=None):
+    """Fetch the three statements of one company concurrently."""
+    return await asyncio.gather(
+        fetch_balance_sheet_async(cvm_code, timeout, use_sync, aggregate_in_db),
+        fetch_income_statement_async(cvm_code, timeout, use_sync, aggregate_in_db),
+        fetch_cash_flow_async(cvm_code, timeout, use_sync, aggregate_in_db),
+    )
+
+
+async def fetch_many_financials_async(cvm_codes, timeout=None, use_sync=False, aggregate_in_db=None):
+    """Fetch statements for many companies on one event loop, keyed by cvm_code.
+
+    Every query is scheduled at once; MAX_IN_FLIGHT and the pool size bound how
+    many actually run. A company whose fetch fails gets empty frames.
+    """
+    codes = list(dict.fromkeys(int(code) for code in _to_native(cvm_codes)))
+    results = await asyncio.gather(
+        *(fetch_financials_async(code, timeout, use_sync, aggregate_in_db) for code in codes),
+        return_exceptions=True,
+    )
+    financials = {}
+    for code, result in zip(codes, results):
+        if isinstance(result, Exception):
+            logging.error(f"Error fetching financials for cvm_code {code}: {result}")
+            result = (pd.DataFrame(), pd.DataFrame(), pd.DataFrame())
+        financials[code] = tuple(result)
+    return financials
+
+
+def fetch_many_financials(cvm_codes, timeout=None, use_sync=False, aggregate_in_db=None):
+    """Blocking wrapper around fetch_many_financials_async for scripts and notebooks."""
+    async def run():
+        try:
+            return await fetch_many_financials_async(cvm_codes, timeout, use_sync, aggregate_in_db)
+        finally:
+            # Pooled connections are tied to this loop, which asyncio.run closes
+            await dispose_async_engine()
+    return asyncio.run(run())
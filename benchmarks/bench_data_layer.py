@@ -0,0 +1,144 @@
+# bench_data_layer.py
+# Throughput and peak-memory benchmarks of the fetcherv6 hot paths against a
+# synthetic dataset loaded into an embedded SQLite database.
+#
+#   python -m benchmarks.bench_data_layer --companies 5000 --years 20
+#   python -m benchmarks.bench_data_layer --save baseline.json
+#   python -m benchmarks.bench_data_layer --baseline baseline.json --tolerance 0.25
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fetcherv6
+from fetcherv6 import (fetch_balance_sheet, fetch_datx_y, fetch_balance_sheets, fetch_income_statements,
+                       fetch_financials_bulk, iter_statements, process_yearly_data)
+from financial_panel import build_panels
+from local_backend import build_local_database, use_local_backend
+from synthetic_data import generate_dataset, write_dataset
+
+
+def _measure(fn, repeat):
+    """Best wall time over `repeat` runs, then one traced run for peak Python allocations."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak
+
+
+def _cases(dataset, sample_codes, all_codes):
+    income_rows = dataset['income_statement']
+    n_rows = len(dataset['balance_sheet'])
+
+    def single_balance_sheets():
+        for code in sample_codes:
+            fetch_balance_sheet(code)
+
+    def datx_y():
+        for code in sample_codes:
+            fetch_datx_y(code)
+
+    def yearly():
+        process_yearly_data(income_rows.copy(), 'period_end')
+
+    def streamed():
+        for _ in iter_statements('balance_sheet'):
+            pass
+
+    # name -> (function, units processed per run, unit)
+    return {
+        'fetch_balance_sheet': (single_balance_sheets, len(sample_codes), 'companies'),
+        'fetch_datx_y': (datx_y, len(sample_codes), 'companies'),
+        'process_yearly_data': (yearly, len(income_rows), 'rows'),
+        'fetch_balance_sheets': (lambda: fetch_balance_sheets(all_codes), n_rows, 'rows'),
+        'fetch_income_statements': (lambda: fetch_income_statements(all_codes), len(income_rows), 'rows'),
+        'fetch_income_statements[aggregate_in_db]':
+            (lambda: fetch_income_statements(all_codes, aggregate_in_db=True), len(income_rows), 'rows'),
+        'fetch_financials_bulk': (lambda: fetch_financials_bulk(all_codes), len(all_codes), 'companies'),
+        'iter_statements': (streamed, n_rows, 'rows'),
+        'build_panels': (lambda: build_panels(all_codes), len(all_codes), 'companies'),
+    }
+
+
+def run_benchmarks(n_companies=500, n_years=20, frequency='quarterly', sample=50, repeat=3, seed=0, only=None):
+    """Build a synthetic SQLite database, run each benchmark and return {name: result dict}."""
+    dataset = generate_dataset(n_companies, n_years, frequency, seed=seed)
+    all_codes = dataset['company']['cvm_code'].tolist()
+    sample_codes = all_codes[:sample]
+    previous_url = fetcherv6.DATABASE_URL
+    with tempfile.TemporaryDirectory() as directory:
+        write_dataset(dataset, directory)
+        path = os.path.join(directory, 'bench.db')
+        build_local_database(path, directory)
+        use_local_backend(path)
+        try:
+            results = {}
+            for name, (fn, units, unit) in _cases(dataset, sample_codes, all_codes).items():
+                if only and name not in only:
+                    continue
+                seconds, peak = _measure(fn, repeat)
+                results[name] = {
+                    'seconds': seconds,
+                    'throughput': units / seconds if seconds else float('inf'),
+                    'unit': f"{unit}/s",
+                    'peak_mb': peak / 2**20,
+                }
+        finally:
+            fetcherv6.set_database_url(previous_url)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the benchmarks whose throughput fell more than `tolerance` below the baseline."""
+    regressions = {}
+    for name, result in results.items():
+        if name in baseline and result['throughput'] < baseline[name]['throughput'] * (1 - tolerance):
+            regressions[name] = (baseline[name]['throughput'], result['throughput'])
+    return regressions
+
+
+def _report(results):
+    print(f"{'benchmark':<42}{'seconds':>10}{'throughput':>16}  {'unit':<12}{'peak MB':>9}")
+    for name, result in results.items():
+        print(f"{name:<42}{result['seconds']:>10.3f}{result['throughput']:>16,.0f}  "
+              f"{result['unit']:<12}{result['peak_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark the fetcherv6 data layer on synthetic data.")
+    parser.add_argument('--companies', type=int, default=500)
+    parser.add_argument('--years', type=int, default=20)
+    parser.add_argument('--frequency', choices=['annual', 'quarterly'], default='quarterly')
+    parser.add_argument('--sample', type=int, default=50, help="Companies used by the per-company benchmarks")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='*', help="Run only these benchmarks")
+    parser.add_argument('--save', help="Write the results as JSON")
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed throughput drop vs the baseline")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.companies, args.years, args.frequency, args.sample, args.repeat, args.seed, args.only)
+    _report(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, (before, after) in regressions.items():
+            print(f"REGRESSION {name}: {before:,.0f} -> {after:,.0f}")
+        sys.exit(1 if regressions else 0)
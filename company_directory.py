@@ -0,0 +1,97 @@
+# company_directory.py
+import logging
+import os
+import threading
+import time
+from fetcherv6 import fetch_company_data
+
+# Seconds a loaded company table stays valid before the next lookup reloads it
+COMPANY_DIRECTORY_TTL = float(os.getenv("FINLLM_COMPANY_DIRECTORY_TTL", "3600"))
+
+
+class CompanyDirectory:
+    """In-process copy of the company table indexed by cvm_code, b3_issuer_code and sector.
+
+    The table is loaded on the first lookup and reused until the TTL expires or
+    invalidate() is called, so each lookup after that is a dict access.
+    """
+
+    def __init__(self, loader=None, ttl=COMPANY_DIRECTORY_TTL):
+        self._loader = loader or fetch_company_data
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._frame = None
+        self._by_cvm_code = {}
+        self._by_issuer_code = {}
+        self._by_sector = {}
+
+    def _expired(self):
+        return self._loaded_at is None or (self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl)
+
+    def _ensure_loaded(self):
+        if not self._expired():
+            return
+        with self._lock:
+            if not self._expired():
+                return
+            df = self._loader()
+            if df.empty:
+                # Leave the directory unloaded so the next lookup retries
+                logging.warning("Company directory not loaded: company table is empty.")
+                return
+            by_cvm_code = {int(code): row for code, row in df.to_dict('index').items()}
+            by_issuer_code = {}
+            by_sector = {}
+            for code, row in by_cvm_code.items():
+                issuer_code = row.get('b3_issuer_code')
+                if isinstance(issuer_code, str) and issuer_code:
+                    by_issuer_code.setdefault(issuer_code.upper(), code)
+                by_sector.setdefault(row.get('b3_sector'), []).append(code)
+            self._frame = df
+            self._by_cvm_code = by_cvm_code
+            self._by_issuer_code = by_issuer_code
+            self._by_sector = by_sector
+            self._loaded_at = time.monotonic()
+            logging.info(f"Company directory loaded with {len(by_cvm_code)} companies.")
+
+    def invalidate(self):
+        """Drop the loaded table; the next lookup reloads it."""
+        with self._lock:
+            self._loaded_at = None
+
+    @property
+    def frame(self):
+        """The company table as returned by the loader (indexed by cvm_code)."""
+        self._ensure_loaded()
+        return self._frame
+
+    def get(self, cvm_code):
+        """Return the company's row as a dict, or None if the cvm_code is unknown."""
+        self._ensure_loaded()
+        return self._by_cvm_code.get(int(cvm_code))
+
+    def name(self, cvm_code):
+        """Return the company's name (first column of the company table)."""
+        row = self.get(cvm_code)
+        if row is None:
+            raise KeyError(int(cvm_code))
+        return next(iter(row.values()))
+
+    def cvm_code_for_issuer(self, b3_issuer_code):
+        """Return the cvm_code for a B3 issuer code such as 'ABEV', or None."""
+        self._ensure_loaded()
+        return self._by_issuer_code.get(b3_issuer_code.upper())
+
+    def sector(self, b3_sector):
+        """Return the cvm_codes of every company in a B3 sector."""
+        self._ensure_loaded()
+        return list(self._by_sector.get(b3_sector, []))
+
+    def sectors(self):
+        self._ensure_loaded()
+        return sorted(sector for sector in self._by_sector if isinstance(sector, str))
+
+
+# Shared directory used by fetcherv6.get_company_name
+directory = CompanyDirectory()
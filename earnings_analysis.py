@@ -1,11 +1,13 @@
 import pandas as pd
 from openaicall import get_predictions
-from fetcherv6 import net_income_direction, get_company_name
+from fetcherv6 import net_income_direction, get_company_name, fetch_scope
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Share the statement fetches of get_predictions and net_income_direction
+@fetch_scope()
 def analyze_earnings(cvm_code):
     # Get predictions
     predictions = get_predictions(cvm_code)
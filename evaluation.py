@@ -0,0 +1,257 @@
+# evaluation.py
+# Evaluation of earnings direction predictions for any number of companies at
+# once: running (cumulative or rolling) metrics per company from grouped
+# cumulative sums, and per-company, per-sector and global accuracy, precision,
+# recall, F1 and confidence calibration from grouped totals. Evaluator keeps
+# the totals so new predictions update them without recomputing history.
+# Companies are told apart by cvm_code when the rows carry it: trade names are
+# not unique.
+import json
+import numpy as np
+import pandas as pd
+
+COMPANY = 'Company Name'
+CODE = 'cvm_code'
+ACTUAL = 'Actual Earnings Direction'
+PREDICTED = 'Predicted Earnings Direction'
+CONFIDENCE = 'Confidence Score'
+SECTOR = 'b3_sector'
+
+# Confidence bins for the calibration table and expected calibration error
+CALIBRATION_BINS = 10
+
+_OUTCOMES = ['Correct', 'TP', 'FP', 'TN', 'FN']
+_TOTALS = ['predictions', 'correct', 'tp', 'fp', 'fn', 'scored', 'confidence', 'squared_error']
+
+
+def outcome_columns(df):
+    """Correct, TP, FP, TN and FN indicators of every row ('increase' is the positive class)."""
+    actual_up = df[ACTUAL] == 'increase'
+    actual_down = df[ACTUAL] == 'decrease'
+    predicted_up = df[PREDICTED] == 'increase'
+    predicted_down = df[PREDICTED] == 'decrease'
+    return pd.DataFrame({
+        'Correct': df[ACTUAL] == df[PREDICTED],
+        'TP': (actual_up & predicted_up).astype(int),
+        'FP': (actual_down & predicted_up).astype(int),
+        'TN': (actual_down & predicted_down).astype(int),
+        'FN': (actual_up & predicted_down).astype(int),
+    }, index=df.index)
+
+
+def _group_keys(df, by):
+    return df[by] if by is not None else pd.Series(0, index=df.index)
+
+
+def running_metrics(df, by=COMPANY, window=None, offsets=None):
+    """Add outcome columns and running accuracy, precision, recall and F1 to `df` and return it.
+
+    Rows are taken in their current order within each `by` group (None: the
+    whole frame is one group), so sort by year first. Metrics are cumulative
+    ('Cumulative ...' columns) or over the last `window` rows of the group
+    ('Rolling ...'). `offsets` holds the counts each group had before these
+    rows (see Evaluator) and only applies to cumulative metrics.
+    """
+    outcomes = outcome_columns(df)
+    for column in _OUTCOMES:
+        df[column] = outcomes[column]
+    counts = outcomes.astype(int).assign(n=1)
+    keys = _group_keys(df, by)
+    running = counts.groupby(keys).cumsum()
+    if window is not None:
+        # Rolling sums as differences of cumulative sums, still one grouped pass
+        running = running - running.groupby(keys).shift(window, fill_value=0)
+    elif offsets is not None:
+        running = running + offsets.reindex(keys.to_numpy()).fillna(0).to_numpy()
+
+    label = 'Cumulative' if window is None else 'Rolling'
+    precision = running['TP'] / (running['TP'] + running['FP'])
+    recall = running['TP'] / (running['TP'] + running['FN'])
+    df[f'{label} Accuracy'] = running['Correct'] / running['n']
+    df[f'{label} Precision'] = precision
+    df[f'{label} Recall'] = recall
+    df[f'{label} F1-Score'] = 2 * precision * recall / (precision + recall)
+    return df
+
+
+def _indicators(df):
+    """Per-row terms whose grouped sums give every metric of metrics_from_totals."""
+    outcomes = outcome_columns(df)
+    if CONFIDENCE in df:
+        confidence = pd.to_numeric(df[CONFIDENCE], errors='coerce')
+    else:
+        confidence = pd.Series(np.nan, index=df.index)
+    scored = confidence.notna()
+    correct = outcomes['Correct'].astype(int)
+    return pd.DataFrame({
+        'predictions': 1,
+        'correct': correct,
+        'tp': outcomes['TP'],
+        'fp': outcomes['FP'],
+        'fn': outcomes['FN'],
+        'scored': scored.astype(int),
+        'scored_correct': correct.where(scored, 0),
+        'confidence': confidence.fillna(0),
+        'squared_error': ((confidence - correct) ** 2).fillna(0),
+        'bin': np.minimum((confidence.fillna(0) * CALIBRATION_BINS).astype(int), CALIBRATION_BINS - 1),
+    }, index=df.index)
+
+
+def metrics_from_totals(totals, calibration=None):
+    """Accuracy, precision, recall, F1, mean confidence, Brier score and ECE from summed indicators.
+
+    `calibration` holds the scored/scored_correct/confidence sums per (group,
+    bin); without it ece is left out.
+    """
+    metrics = pd.DataFrame(index=totals.index)
+    metrics['predictions'] = totals['predictions'].astype(int)
+    metrics['accuracy'] = totals['correct'] / totals['predictions']
+    precision = totals['tp'] / (totals['tp'] + totals['fp']).replace(0, np.nan)
+    recall = totals['tp'] / (totals['tp'] + totals['fn']).replace(0, np.nan)
+    metrics['precision'] = precision
+    metrics['recall'] = recall
+    metrics['f1'] = 2 * precision * recall / (precision + recall).replace(0, np.nan)
+    scored = totals['scored'].replace(0, np.nan)
+    metrics['mean_confidence'] = totals['confidence'] / scored
+    metrics['brier'] = totals['squared_error'] / scored
+    if calibration is not None:
+        # ECE: sum over bins of |accuracy - confidence| weighted by the bin's share of scored rows
+        gaps = (calibration['scored_correct'] - calibration['confidence']).abs()
+        metrics['ece'] = gaps.groupby(level=0).sum().reindex(metrics.index) / scored
+    return metrics
+
+
+def company_key(df):
+    """The column identifying a row's company: cvm_code when present, else the company name."""
+    return CODE if CODE in df else COMPANY
+
+
+def sector_column(df, companies=None):
+    """Sector of every row: its b3_sector column, else looked up in the company table by cvm_code or name."""
+    if SECTOR in df:
+        return df[SECTOR].fillna('unknown')
+    if companies is not None and CODE in df:
+        sectors = companies.drop_duplicates(CODE).set_index(CODE)[SECTOR]
+        return df[CODE].map(sectors).fillna('unknown')
+    if companies is not None:
+        sectors = companies.drop_duplicates('trade_name').set_index('trade_name')[SECTOR]
+        return df[COMPANY].map(sectors).fillna('unknown')
+    return pd.Series('unknown', index=df.index)
+
+
+class Evaluator:
+    """Running totals per company, updated as predictions arrive.
+
+    update() adds new rows (with cumulative metrics continuing each company's
+    history) in one grouped pass over those rows only; report() derives
+    per-company, per-sector and global metrics from the totals. Companies are
+    keyed by company_key(), so rows should all carry cvm_code or none should.
+    """
+
+    def __init__(self, companies=None):
+        self.companies = companies
+        self.totals = pd.DataFrame(columns=_TOTALS + ['scored_correct'], dtype=float)
+        # Scored rows, correct scored rows and summed confidence per (company, confidence bin)
+        self.bins = pd.DataFrame(columns=['scored', 'scored_correct', 'confidence'], dtype=float,
+                                 index=pd.MultiIndex.from_arrays([[], []], names=[COMPANY, 'bin']))
+        self.sectors = {}
+        # Company name of every cvm_code key, for by_company
+        self.names = {}
+
+    def update(self, rows):
+        """Add prediction rows, in year order within each company; return them with cumulative metrics."""
+        key = company_key(rows)
+        rows = running_metrics(rows.copy(), key, offsets=self._offsets())
+        indicators = _indicators(rows)
+        keys = rows[key].rename(COMPANY)
+        self.totals = self.totals.add(indicators.drop(columns='bin').groupby(keys).sum(), fill_value=0)
+        scored = (indicators['scored'] == 1).to_numpy()
+        binned = indicators[scored].groupby([keys[scored], indicators['bin'][scored]])
+        binned = binned[['scored', 'scored_correct', 'confidence']].sum()
+        self.bins = self.bins.add(binned, fill_value=0)
+        self.sectors.update(zip(keys, sector_column(rows, self.companies)))
+        if key == CODE and COMPANY in rows:
+            self.names.update(zip(keys, rows[COMPANY]))
+        return rows
+
+    def _offsets(self):
+        """Counts per company before the rows of an update, in running_metrics' column names."""
+        totals = self.totals
+        return pd.DataFrame({
+            'Correct': totals['correct'],
+            'TP': totals['tp'],
+            'FP': totals['fp'],
+            'TN': totals['correct'] - totals['tp'],
+            'FN': totals['fn'],
+            'n': totals['predictions'],
+        }, index=totals.index)
+
+    def report(self):
+        """{'overall': dict, 'by_company': DataFrame, 'by_sector': DataFrame, 'calibration': DataFrame}.
+
+        by_company is indexed by the company key, with the company name as a
+        column when that key is cvm_code.
+        """
+        totals = self.totals[_TOTALS]
+        bins = self.bins
+        by_company = metrics_from_totals(totals, bins)
+        if self.names:
+            by_company.insert(0, COMPANY, pd.Series(self.names).reindex(by_company.index))
+
+        sectors = pd.Series(self.sectors).reindex(totals.index).fillna('unknown')
+        sector_bins = bins.groupby([sectors.reindex(bins.index.get_level_values(0)).to_numpy(),
+                                    bins.index.get_level_values(1)]).sum()
+        by_sector = metrics_from_totals(totals.groupby(sectors).sum(), sector_bins)
+
+        overall_bins = bins.groupby(level=1).sum()
+        overall = metrics_from_totals(totals.sum().to_frame('all').T,
+                                      pd.concat({'all': overall_bins}))
+        calibration = pd.DataFrame({
+            'predictions': overall_bins['scored'].astype(int),
+            'mean_confidence': overall_bins['confidence'] / overall_bins['scored'],
+            'accuracy': overall_bins['scored_correct'] / overall_bins['scored'],
+        })
+        calibration.index = [f"{b / CALIBRATION_BINS:.1f}-{(b + 1) / CALIBRATION_BINS:.1f}" for b in calibration.index]
+        return {'overall': _records(overall)['all'], 'by_company': by_company, 'by_sector': by_sector,
+                'calibration': calibration}
+
+
+def _records(frame):
+    """{index: {column: value}} with NaN as None, for JSON."""
+    return {key: {column: (None if pd.isna(value) else value.item() if hasattr(value, 'item') else value)
+                  for column, value in row.items()}
+            for key, row in frame.to_dict('index').items()}
+
+
+def evaluate(df, companies=None):
+    """Evaluate a combined prediction table of any number of companies; see Evaluator.report.
+
+    Rows are ordered by company and year before the running metrics are added;
+    the returned report also holds them under 'rows'.
+    """
+    evaluator = Evaluator(companies)
+    order = [column for column in (company_key(df), 'Year') if column in df]
+    rows = evaluator.update(df.sort_values(order, kind='stable'))
+    return dict(evaluator.report(), rows=rows)
+
+
+def report_json(report):
+    """The report's metrics as JSON-serialisable dicts (NaN as null)."""
+    return {
+        'overall': report['overall'],
+        'by_company': _records(report['by_company']),
+        'by_sector': _records(report['by_sector']),
+        'calibration': _records(report['calibration']),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Evaluate earnings direction predictions of many companies.")
+    parser.add_argument('csv', nargs='+', help="Prediction tables, e.g. a run's earnings_analysis.csv or "
+                                               "per-company *_earnings_analysis.csv files")
+    parser.add_argument('--companies', help="Company table for sectors (e.g. extended_company_data.csv)")
+    args = parser.parse_args()
+    table = pd.concat([pd.read_csv(path) for path in args.csv], ignore_index=True)
+    company_table = pd.read_csv(args.companies) if args.companies else None
+    print(json.dumps(report_json(evaluate(table, company_table)), indent=2, ensure_ascii=False))
@@ -1,50 +1,204 @@
 # Fetcherv6.py
 import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import SQLAlchemyError
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
 import logging
 import os
+import threading
 import numpy as np
+from statement_schema import accounts_for, project
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Supabase credentials are read when the engine is first needed, so importing
+# this module never touches the network or requires credentials.
+SUPABASE_ENV_VARS = ["SUPABASE_USER", "SUPABASE_PASSWORD", "SUPABASE_HOST", "SUPABASE_PORT", "SUPABASE_DBNAME"]
 
-# Supabase credentials
-SUPABASE_USER = os.getenv("SUPABASE_USER")
-SUPABASE_PASSWORD = os.getenv("SUPABASE_PASSWORD")
-SUPABASE_HOST = os.getenv("SUPABASE_HOST")
-SUPABASE_PORT = os.getenv("SUPABASE_PORT")
-SUPABASE_DBNAME = os.getenv("SUPABASE_DBNAME")
+# SQLAlchemy URL of another backend, e.g. an embedded copy built by local_backend
+# (sqlite:///finllm.db or duckdb:///finllm.duckdb); unset means Supabase
+DATABASE_URL = os.getenv("FINLLM_DATABASE_URL")
 
-# Check if all environment variables are set
-if not all([SUPABASE_USER, SUPABASE_PASSWORD, SUPABASE_HOST, SUPABASE_PORT, SUPABASE_DBNAME]):
-    logging.error("One or more environment variables are missing.")
-    raise EnvironmentError("Missing environment variables")
+# Connection pool settings
+POOL_SIZE = int(os.getenv("FINLLM_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("FINLLM_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = int(os.getenv("FINLLM_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("FINLLM_POOL_RECYCLE", "1800"))
 
-# Construct database URL
-database_url = f"postgresql://{SUPABASE_USER}:{SUPABASE_PASSWORD}@{SUPABASE_HOST}:{SUPABASE_PORT}/{SUPABASE_DBNAME}"
-logging.info(f"Connecting to database with URL: {database_url}")
+# Date column each statement table is ordered by
+STATEMENT_DATE_COLUMNS = {
+    'balance_sheet': 'reference_date',
+    'income_statement': 'period_end',
+    'cash_flow': 'period_end',
+}
 
-# Create engine with exception handling
-try:
-    engine = create_engine(database_url)
-except SQLAlchemyError as e:
-    logging.error(f"Error connecting to the database: {e}")
-    raise
+# "remote" queries Supabase; "snapshot" serves statements from the local Parquet snapshots
+DATA_SOURCE = os.getenv("FINLLM_DATA_SOURCE", "remote")
+
+# Default for the aggregate_in_db option of the fetch_* functions: select year-end
+# balance sheets and sum income/cash flow periods per year on the database server
+AGGREGATE_IN_DB = os.getenv("FINLLM_AGGREGATE_IN_DB", "0") == "1"
+
+# Project default statement queries (accounts=None) onto the accounts registered in
+# statement_schema; off by default, so they select every column of the live table
+PROJECT_COLUMNS = os.getenv("FINLLM_PROJECT_COLUMNS", "0") == "1"
+
+# Rows per chunk when streaming query results through a server-side cursor
+STREAM_CHUNK_SIZE = int(os.getenv("FINLLM_STREAM_CHUNK_SIZE", "10000"))
+
+_engine = None
+_engine_lock = threading.Lock()
+_table_columns = {}
+_warned_missing = set()
+
+def get_database_url(driver="postgresql"):
+    """Return DATABASE_URL if set, else build the Supabase URL from the SUPABASE_* environment variables."""
+    if DATABASE_URL:
+        return DATABASE_URL
+    values = {var: os.getenv(var) for var in SUPABASE_ENV_VARS}
+    missing = [var for var, value in values.items() if not value]
+    if missing:
+        logging.error(f"Missing environment variables: {missing}")
+        raise EnvironmentError("Missing environment variables")
+    return (f"{driver}://{values['SUPABASE_USER']}:{values['SUPABASE_PASSWORD']}"
+            f"@{values['SUPABASE_HOST']}:{values['SUPABASE_PORT']}/{values['SUPABASE_DBNAME']}")
+
+def set_database_url(url):
+    """Point every query at another backend (None goes back to Supabase); the next query reconnects."""
+    global DATABASE_URL
+    dispose_engine()
+    DATABASE_URL = url
+    _table_columns.clear()
+
+def get_dialect_name():
+    """Name of the configured backend's SQL dialect, known without connecting."""
+    if DATABASE_URL:
+        from sqlalchemy.engine import make_url
+        return make_url(DATABASE_URL).get_backend_name()
+    return "postgresql"
+
+def get_engine():
+    """Return the shared SQLAlchemy engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from sqlalchemy import create_engine
+                from sqlalchemy.engine import make_url
+                from sqlalchemy.exc import SQLAlchemyError
+                database_url = get_database_url()
+                logging.info(f"Connecting to database with URL: {make_url(database_url).render_as_string(hide_password=True)}")
+                # Embedded backends keep their dialect's default pooling
+                pool_settings = {}
+                if get_dialect_name() == "postgresql":
+                    pool_settings = dict(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT,
+                                         pool_recycle=POOL_RECYCLE, pool_pre_ping=True)
+                # Create engine with exception handling
+                try:
+                    _engine = create_engine(database_url, **pool_settings)
+                except SQLAlchemyError as e:
+                    logging.error(f"Error connecting to the database: {e}")
+                    raise
+    return _engine
+
+def dispose_engine():
+    """Close pooled connections, e.g. after forking worker processes."""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+def __getattr__(name):
+    # Keep `fetcherv6.engine` working for existing callers without building it at import time
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _to_native(value):
+    if isinstance(value, (list, tuple, np.ndarray, pd.Index)):
+        return [_to_native(item) for item in value]
+    return int(value) if isinstance(value, (np.integer, np.int64)) else value
+
+def _text(query, params):
+    from sqlalchemy import bindparam, text
+    # Lists bound with "IN :name" expand to one placeholder per item; "= ANY(:name)" binds a Postgres array
+    expanding = [bindparam(key, expanding=True) for key, value in (params or {}).items()
+                 if isinstance(value, list) and f"IN :{key}" in query]
+    return text(query).bindparams(*expanding) if expanding else text(query)
 
 def fetch_data(query, params=None):
     # Convert numpy types to native Python types
     if params:
-        params = {key: int(value) if isinstance(value, (np.integer, np.int64)) else value for key, value in params.items()}
+        params = {key: _to_native(value) for key, value in params.items()}
+    from sqlalchemy.exc import SQLAlchemyError
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text(query), params or {})
+        with get_engine().connect() as conn:
+            result = conn.execute(_text(query, params), params or {})
             df = pd.DataFrame(result.fetchall(), columns=result.keys())
             return df
     except SQLAlchemyError as e:
         logging.error(f"Error fetching data: {e}")
         return pd.DataFrame()
 
+def fetch_data_chunks(query, params=None, chunk_size=None):
+    """Yield a query's result as DataFrames of at most chunk_size rows.
+
+    Rows come from a server-side cursor, so memory stays bounded by one chunk
+    however large the result is. Unlike fetch_data, database errors are logged
+    and re-raised: a silently truncated stream would corrupt whatever is built
+    from it.
+    """
+    from sqlalchemy.exc import SQLAlchemyError
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    if params:
+        params = {key: _to_native(value) for key, value in params.items()}
+    try:
+        with get_engine().connect() as conn:
+            conn = conn.execution_options(stream_results=True, max_row_buffer=chunk_size)
+            result = conn.execute(_text(query, params), params or {})
+            columns = list(result.keys())
+            for rows in result.partitions(chunk_size):
+                yield pd.DataFrame(rows, columns=columns)
+    except SQLAlchemyError as e:
+        logging.error(f"Error streaming data: {e}")
+        raise
+
+def set_data_source(source):
+    """Switch the fetch_* statement functions between "remote" and "snapshot"."""
+    global DATA_SOURCE
+    if source not in ("remote", "snapshot"):
+        raise ValueError(f"Unknown data source: {source}")
+    DATA_SOURCE = source
+
+def _fetch_statement_rows(table, cvm_codes, build_query, params, accounts=None, aggregate_in_db=False):
+    """Raw rows of a statement from the active data source.
+
+    `build_query` (_statement_query or _bulk_statement_query) is only called for
+    remote reads, so snapshot reads need neither the database nor its schema;
+    their aggregate_in_db totals are computed in pandas instead.
+    """
+    if DATA_SOURCE == "snapshot":
+        from snapshot_cache import load_snapshot
+        rows = load_snapshot(table, cvm_codes)
+        columns = project(table, list(rows.columns), accounts) if accounts is not None else None
+        rows = rows[columns] if columns else rows
+        return _aggregate_rows(table, rows) if aggregate_in_db else rows
+    return fetch_data(build_query(table, aggregate_in_db, _projected_columns(table, accounts)), params)
+
+def _aggregate_rows(table, rows):
+    """The rows an aggregate_in_db query returns: year-end balance sheets, yearly income and cash flow sums."""
+    if rows.empty:
+        return rows
+    date_column = STATEMENT_DATE_COLUMNS[table]
+    dates = pd.to_datetime(rows[date_column])
+    if table == 'balance_sheet':
+        return rows[dates.dt.is_year_end.to_numpy()].reset_index(drop=True)
+    # Same totals as resample('YE').sum(), which treats missing values as 0
+    numeric = rows.drop(columns=['cvm_code']).select_dtypes(include='number')
+    year_start = dates.dt.to_period('Y').dt.start_time.rename(date_column)
+    return numeric.groupby([rows['cvm_code'], year_start]).sum().reset_index()
+
 def process_yearly_data(df, date_column):
     if not df.empty:
         df[date_column] = pd.to_datetime(df[date_column])
@@ -68,59 +222,331 @@ def clean_dataframe(df, drop_columns=None, drop_index=None, rename_columns=None)
         df.rename(columns={old: new for old, new in rename_columns.items() if old in df.columns}, inplace=True)
     return df
 
-def fetch_balance_sheet(cvm_code):
-    query = """
-        SELECT *
-        FROM balance_sheet
-        WHERE cvm_code = :cvm_code
-        ORDER BY reference_date ASC
-    """
-    df = fetch_data(query, {'cvm_code': cvm_code})
-    if not df.empty:
-        df['reference_date'] = pd.to_datetime(df['reference_date'])
-        year_end_df = df[df['reference_date'].dt.is_year_end]
-        year_end_df = year_end_df.set_index('reference_date').transpose()
-        year_end_df.columns = year_end_df.columns.year  # Change columns to year only
-        
-        year_end_df = clean_dataframe(year_end_df, drop_index=['cvm_code', 'statement_type'])
-        
-        # Add a row for the result of assets - equity - liabilities
-        year_end_df.loc['check'] = year_end_df.loc['assets'] - year_end_df.loc['liabilities']
-        year_end_df.reset_index(inplace=True)
-        year_end_df.rename(columns={'index': 'acc_entry'}, inplace=True)
-        year_end_df.set_index('acc_entry', inplace=True)
+def _shape_balance_sheet(df):
+    if df.empty:
+        return pd.DataFrame()
+    df['reference_date'] = pd.to_datetime(df['reference_date'])
+    year_end_df = df[df['reference_date'].dt.is_year_end]
+    year_end_df = year_end_df.set_index('reference_date').transpose()
+    year_end_df.columns = year_end_df.columns.year  # Change columns to year only
+
+    year_end_df = clean_dataframe(year_end_df, drop_index=['cvm_code', 'statement_type'])
+
+    # Add a row for the result of assets - equity - liabilities
+    year_end_df.loc['check'] = year_end_df.loc['assets'] - year_end_df.loc['liabilities']
+    year_end_df.reset_index(inplace=True)
+    year_end_df.rename(columns={'index': 'acc_entry'}, inplace=True)
+    year_end_df.set_index('acc_entry', inplace=True)
     return year_end_df
 
-def fetch_income_statement(cvm_code):
-    query = """
-        SELECT *
-        FROM income_statement
-        WHERE cvm_code = :cvm_code
-        ORDER BY period_end ASC
-    """
-    df = fetch_data(query, {'cvm_code': cvm_code})
+def _shape_income_statement(df):
     yearly_df = process_yearly_data(df, 'period_end')
-    
-    if not yearly_df.empty:
-        yearly_df = clean_dataframe(yearly_df, drop_columns=['period_end'], drop_index='cvm_code')
+    if yearly_df.empty:
+        return pd.DataFrame()
     yearly_df.rename(columns={'index': 'acc_entry'}, inplace=True)
     yearly_df.set_index('acc_entry', inplace=True)
-    return yearly_df
+    # cvm_code is numeric and gets summed with the accounts; it is not an account
+    return clean_dataframe(yearly_df, drop_index=['cvm_code'])
 
-def fetch_cash_flow(cvm_code):
-    query = """
-        SELECT *
-        FROM cash_flow
-        WHERE cvm_code = :cvm_code
-        ORDER BY period_end ASC
-    """
-    df = fetch_data(query, {'cvm_code': cvm_code})
+def _shape_cash_flow(df):
     yearly_df = process_yearly_data(df, 'period_end')
-    
-    if not yearly_df.empty:
-        yearly_df.rename(columns={'index': 'acc_entry'}, inplace=True)
-        yearly_df.set_index('acc_entry', inplace=True)
-        return yearly_df
+    if yearly_df.empty:
+        return pd.DataFrame()
+    yearly_df.rename(columns={'index': 'acc_entry'}, inplace=True)
+    yearly_df.set_index('acc_entry', inplace=True)
+    return clean_dataframe(yearly_df, drop_index=['cvm_code'])
+
+def get_table_columns(table):
+    """Return the columns of a table (name and type, in table order), read once from the database schema."""
+    if table not in _table_columns:
+        from sqlalchemy import inspect
+        _table_columns[table] = inspect(get_engine()).get_columns(table)
+    return _table_columns[table]
+
+def get_numeric_columns(table):
+    """Return the numeric account columns of a table."""
+    from sqlalchemy.types import Integer, Numeric
+    return [col['name'] for col in get_table_columns(table)
+            if isinstance(col['type'], (Integer, Numeric)) and col['name'] != 'cvm_code']
+
+def _projected_columns(table, accounts):
+    """Columns to select for the given accounts, or None to select all of them."""
+    if accounts is None:
+        return None
+    from sqlalchemy.exc import SQLAlchemyError
+    try:
+        table_columns = [col['name'] for col in get_table_columns(table)]
+    except (SQLAlchemyError, EnvironmentError) as e:
+        logging.warning(f"Could not read the columns of {table}, selecting all of them: {e}")
+        return None
+    missing = tuple(account for account in accounts if account not in table_columns)
+    if missing and (table, missing) not in _warned_missing:
+        # Account names are checked against the live schema; warn once per table and set of names
+        _warned_missing.add((table, missing))
+        logging.warning(f"Requested {table} accounts not in the table: {list(missing)}")
+    columns = project(table, table_columns, accounts)
+    if columns is None:
+        logging.warning(f"None of the registered {table} accounts exist in the table, selecting all columns")
+    return columns
+
+def _year_end_filter(date_column):
+    if get_dialect_name() == "sqlite":
+        return f"strftime('%m-%d', {date_column}) = '12-31'"
+    return f"""EXTRACT(MONTH FROM {date_column}) = 12
+          AND EXTRACT(DAY FROM {date_column}) = 31"""
+
+def _year_start(date_column):
+    if get_dialect_name() == "sqlite":
+        return f"strftime('%Y', {date_column}) || '-01-01'"
+    return f"date_trunc('year', {date_column})"
+
+def _codes_filter():
+    # Postgres binds the whole list as one array; other backends expand it into IN (...)
+    return "cvm_code = ANY(:codes)" if get_dialect_name() == "postgresql" else "cvm_code IN :codes"
+
+def _build_statement_query(table, where, order_by, aggregate_in_db=False, columns=None):
+    date_column = STATEMENT_DATE_COLUMNS[table]
+    select_list = "*" if columns is None else ", ".join(f'"{col}"' for col in columns)
+    if not aggregate_in_db:
+        return f"""
+        SELECT {select_list}
+        FROM {table}
+        WHERE {where}
+        ORDER BY {order_by}
+    """
+    if table == 'balance_sheet':
+        # Same rows as dt.is_year_end on the client
+        return f"""
+        SELECT {select_list}
+        FROM {table}
+        WHERE {where}
+          AND {_year_end_filter(date_column)}
+        ORDER BY {order_by}
+    """
+    # Same totals as resample('YE').sum(), which treats missing values as 0
+    sum_columns = [col for col in get_numeric_columns(table) if columns is None or col in columns]
+    sums = ",\n               ".join(f'COALESCE(SUM("{col}"), 0) AS "{col}"' for col in sum_columns)
+    return f"""
+        SELECT cvm_code,
+               {_year_start(date_column)} AS {date_column},
+               {sums}
+        FROM {table}
+        WHERE {where}
+        GROUP BY cvm_code, {_year_start(date_column)}
+        ORDER BY {order_by}
+    """
+
+def _statement_query(table, aggregate_in_db=False, columns=None):
+    date_column = STATEMENT_DATE_COLUMNS[table]
+    return _build_statement_query(table, "cvm_code = :cvm_code", f"{date_column} ASC", aggregate_in_db, columns)
+
+def _bulk_statement_query(table, aggregate_in_db=False, columns=None):
+    date_column = STATEMENT_DATE_COLUMNS[table]
+    return _build_statement_query(table, _codes_filter(), f"cvm_code ASC, {date_column} ASC",
+                                  aggregate_in_db, columns)
+
+class FetchScope:
+    """Shares statement fetches among the callers inside one fetch_scope().
+
+    The first caller for a key runs the query; concurrent callers for the same
+    key wait for that result instead of issuing their own (single-flight).
+    Failed and empty fetches are not kept (fetch_data turns database errors
+    into empty frames), so a later caller retries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _claim(self, key):
+        """The future of a key and whether this caller owns (runs) its fetch."""
+        with self._lock:
+            future = self._results.get(key)
+            if future is not None:
+                self.hits += 1
+                return future, False
+            future = self._results[key] = concurrent.futures.Future()
+            self.misses += 1
+            return future, True
+
+    def _settle(self, key, future, result=None, error=None):
+        if error is not None or getattr(result, 'empty', False):
+            # Callers already waiting share it, later ones query again
+            with self._lock:
+                self._results.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def get_or_fetch(self, key, fetch):
+        future, owner = self._claim(key)
+        if owner:
+            try:
+                result = fetch()
+            except BaseException as e:
+                self._settle(key, future, error=e)
+            else:
+                self._settle(key, future, result)
+        return future.result()
+
+    async def get_or_fetch_async(self, key, fetch):
+        """get_or_fetch for a coroutine function; shares results with the sync callers of the scope."""
+        future, owner = self._claim(key)
+        if owner:
+            try:
+                result = await fetch()
+            except BaseException as e:
+                self._settle(key, future, error=e)
+            else:
+                self._settle(key, future, result)
+        return await asyncio.wrap_future(future)
+
+_current_scope = contextvars.ContextVar("fetch_scope", default=None)
+
+@contextlib.contextmanager
+def fetch_scope():
+    """Reuse statement fetches for the same cvm_code within the block (also usable as a decorator).
+
+    Nested scopes join the outer one. asyncio tasks inherit the scope; worker
+    threads see it when run through contextvars.copy_context().run.
+    """
+    scope = _current_scope.get()
+    if scope is not None:
+        yield scope
+        return
+    scope = FetchScope()
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+        logging.debug(f"Fetch scope closed: {scope.misses} queries, {scope.hits} reused")
+
+def _scope_key(name, cvm_code, aggregate_in_db, accounts):
+    return name, int(cvm_code), _resolve_aggregate(aggregate_in_db), None if accounts is None else tuple(accounts)
+
+def current_scope():
+    """The active FetchScope, or None outside fetch_scope()."""
+    return _current_scope.get()
+
+def _scoped(fetch):
+    """Route a per-company statement fetch through the active fetch_scope, if any."""
+    @functools.wraps(fetch)
+    def wrapper(cvm_code, aggregate_in_db=None, accounts=None):
+        scope = _current_scope.get()
+        if scope is None:
+            return fetch(cvm_code, aggregate_in_db, accounts)
+        key = _scope_key(fetch.__name__, cvm_code, aggregate_in_db, accounts)
+        # Callers reshape the frames they get, so each one receives its own copy
+        return scope.get_or_fetch(key, lambda: fetch(cvm_code, aggregate_in_db, accounts)).copy()
+    return wrapper
+
+def _resolve_aggregate(aggregate_in_db):
+    return AGGREGATE_IN_DB if aggregate_in_db is None else aggregate_in_db
+
+def _resolve_accounts(table, accounts):
+    # Every column by default (all registered accounts with FINLLM_PROJECT_COLUMNS=1);
+    # otherwise the requested accounts plus those shaping needs
+    if accounts is None:
+        return accounts_for(table) if PROJECT_COLUMNS else None
+    return list(dict.fromkeys(accounts_for(table, []) + list(accounts)))
+
+def _fetch_statement(table, cvm_code, aggregate_in_db=None, accounts=None):
+    accounts = _resolve_accounts(table, accounts)
+    df = _fetch_statement_rows(table, [cvm_code], _statement_query, {'cvm_code': cvm_code}, accounts,
+                               _resolve_aggregate(aggregate_in_db))
+    return STATEMENT_SHAPERS[table](df)
+
+@_scoped
+def fetch_balance_sheet(cvm_code, aggregate_in_db=None, accounts=None):
+    return _fetch_statement('balance_sheet', cvm_code, aggregate_in_db, accounts)
+
+@_scoped
+def fetch_income_statement(cvm_code, aggregate_in_db=None, accounts=None):
+    return _fetch_statement('income_statement', cvm_code, aggregate_in_db, accounts)
+
+@_scoped
+def fetch_cash_flow(cvm_code, aggregate_in_db=None, accounts=None):
+    return _fetch_statement('cash_flow', cvm_code, aggregate_in_db, accounts)
+
+# Per-company shaping applied to raw statement rows
+STATEMENT_SHAPERS = {
+    'balance_sheet': _shape_balance_sheet,
+    'income_statement': _shape_income_statement,
+    'cash_flow': _shape_cash_flow,
+}
+
+def _fetch_bulk(table, cvm_codes, chunk_size=None, aggregate_in_db=None, accounts=None):
+    """Run one set-based query per chunk of cvm_codes and shape each company's rows."""
+    codes = list(dict.fromkeys(int(code) for code in _to_native(cvm_codes)))
+    chunk_size = chunk_size or len(codes) or 1
+    accounts = _resolve_accounts(table, accounts)
+    aggregate = _resolve_aggregate(aggregate_in_db)
+    shape = STATEMENT_SHAPERS[table]
+    frames = {}
+    for start in range(0, len(codes), chunk_size):
+        chunk = codes[start:start + chunk_size]
+        df = _fetch_statement_rows(table, chunk, _bulk_statement_query, {'codes': chunk}, accounts, aggregate)
+        if df.empty:
+            continue
+        for cvm_code, group in df.groupby('cvm_code', sort=False):
+            frames[int(cvm_code)] = shape(group.reset_index(drop=True))
+    missing = [code for code in codes if code not in frames]
+    if missing:
+        logging.warning(f"No {table} rows found for {len(missing)} of {len(codes)} cvm_codes")
+    return {code: frames.get(code, pd.DataFrame()) for code in codes}
+
+def fetch_statement_rows(table, cvm_codes, aggregate_in_db=None, accounts=None):
+    """Return the unshaped rows of a statement table for many companies with one query."""
+    codes = list(dict.fromkeys(int(code) for code in _to_native(cvm_codes)))
+    accounts = _resolve_accounts(table, accounts)
+    return _fetch_statement_rows(table, codes, _bulk_statement_query, {'codes': codes}, accounts,
+                                 _resolve_aggregate(aggregate_in_db))
+
+def iter_statement_rows(table, chunk_size=None, aggregate_in_db=None, accounts=None):
+    """Stream a whole statement table in cvm_code order, yielding (cvm_code, rows) per company.
+
+    A company split across two chunks is held back until its last row arrives,
+    so each yielded frame is complete while memory stays bounded by one chunk
+    plus one company.
+    """
+    date_column = STATEMENT_DATE_COLUMNS[table]
+    accounts = _resolve_accounts(table, accounts)
+    columns = _projected_columns(table, accounts)
+    query = _build_statement_query(table, "1 = 1", f"cvm_code ASC, {date_column} ASC",
+                                   _resolve_aggregate(aggregate_in_db), columns)
+    pending = None
+    for chunk in fetch_data_chunks(query, chunk_size=chunk_size):
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        last_code = chunk['cvm_code'].iloc[-1]
+        is_last = (chunk['cvm_code'] == last_code).to_numpy()
+        pending = chunk[is_last].reset_index(drop=True)
+        for cvm_code, group in chunk[~is_last].groupby('cvm_code', sort=False):
+            yield int(cvm_code), group.reset_index(drop=True)
+    if pending is not None and not pending.empty:
+        yield int(pending['cvm_code'].iloc[0]), pending
+
+def iter_statements(table, chunk_size=None, aggregate_in_db=None, accounts=None):
+    """Stream a whole statement table, yielding (cvm_code, shaped frame) per company."""
+    shape = STATEMENT_SHAPERS[table]
+    for cvm_code, rows in iter_statement_rows(table, chunk_size, aggregate_in_db, accounts):
+        yield cvm_code, shape(rows)
+
+def fetch_balance_sheets(cvm_codes, chunk_size=None, aggregate_in_db=None, accounts=None):
+    """Fetch balance sheets for many companies, keyed by cvm_code."""
+    return _fetch_bulk('balance_sheet', cvm_codes, chunk_size, aggregate_in_db, accounts)
+
+def fetch_income_statements(cvm_codes, chunk_size=None, aggregate_in_db=None, accounts=None):
+    """Fetch income statements for many companies, keyed by cvm_code."""
+    return _fetch_bulk('income_statement', cvm_codes, chunk_size, aggregate_in_db, accounts)
+
+def fetch_cash_flows(cvm_codes, chunk_size=None, aggregate_in_db=None, accounts=None):
+    """Fetch cash flow statements for many companies, keyed by cvm_code."""
+    return _fetch_bulk('cash_flow', cvm_codes, chunk_size, aggregate_in_db, accounts)
 
 def fetch_company_data():
     """Fetch all data from the company table."""
@@ -137,14 +563,21 @@ def fetch_company_data():
     return df
 
 
-def fetch_financials(cvm_code):
+def fetch_financials(cvm_code, aggregate_in_db=None):
     """Fetch balance sheet, income statement, and cash flow data for a given cvm_code."""
-    balance_sheet_df = fetch_balance_sheet(cvm_code)
-    income_statement_df = fetch_income_statement(cvm_code)
-    cash_flow_df = fetch_cash_flow(cvm_code)
+    balance_sheet_df = fetch_balance_sheet(cvm_code, aggregate_in_db)
+    income_statement_df = fetch_income_statement(cvm_code, aggregate_in_db)
+    cash_flow_df = fetch_cash_flow(cvm_code, aggregate_in_db)
 
     return balance_sheet_df, income_statement_df, cash_flow_df
 
+def fetch_financials_bulk(cvm_codes, chunk_size=None, aggregate_in_db=None):
+    """Fetch all three statements for many companies with one query per statement type."""
+    balance_sheets = fetch_balance_sheets(cvm_codes, chunk_size, aggregate_in_db)
+    income_statements = fetch_income_statements(cvm_codes, chunk_size, aggregate_in_db)
+    cash_flows = fetch_cash_flows(cvm_codes, chunk_size, aggregate_in_db)
+    return {code: (balance_sheets[code], income_statements[code], cash_flows[code]) for code in balance_sheets}
+
 def fetch_datx_y(cvm_code):
     balance_sheet = fetch_balance_sheet(cvm_code)
     income_statement = fetch_income_statement(cvm_code)
@@ -189,12 +622,15 @@ def net_income_direction(cvm_code):
     return earnings_direction
 
 def get_company_name(cvm_code):
-    f = fetch_company_data()
-    selected_row = f.loc[int(cvm_code)]
-    return selected_row.iloc[0]
+    """Return the company's name from the shared, TTL-cached company directory."""
+    from company_directory import directory
+    return directory.name(cvm_code)
 
 
 if __name__ == "__main__":
+    # Set up logging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
     # Example usage
     cvm_code = "example_cvm_code"
     balance_sheet_df, income_statement_df, cash_flow_df = fetch_financials(cvm_code)
@@ -0,0 +1,120 @@
+# financial_panel.py
+import numpy as np
+import pandas as pd
+from fetcherv6 import fetch_statement_rows, STATEMENT_DATE_COLUMNS
+
+# Columns of the statement tables that are not accounts
+METADATA_COLUMNS = {'cvm_code', 'statement_type', 'reference_date', 'period_end'}
+
+
+def _account_name(column):
+    return column.lower().replace(" ", "_")
+
+
+class FinancialPanel:
+    """Dense company × account × year float64 array for one statement type.
+
+    values[c, a, y] holds the yearly figure of account a for company c; cells
+    with no filing are NaN and False in mask. Index maps translate cvm_codes,
+    account names and years to positions, and the accessors return views.
+    Balance sheets keep year-end rows and gain a 'check' account (assets -
+    liabilities), as in fetch_balance_sheet; income statements and cash flows
+    are summed per year. Unlike process_yearly_data, whose resample gives 0 for
+    a year or account with no rows, such cells stay NaN (masked) here.
+    """
+
+    def __init__(self, statement, values, mask, cvm_codes, accounts, years):
+        self.statement = statement
+        self.values = values
+        self.mask = mask
+        self.cvm_codes = np.asarray(cvm_codes, dtype=np.int64)
+        self.accounts = list(accounts)
+        self.years = np.asarray(years, dtype=np.int64)
+        self.company_index = {int(code): i for i, code in enumerate(self.cvm_codes)}
+        self.account_index = {account: i for i, account in enumerate(self.accounts)}
+        self.year_index = {int(year): i for i, year in enumerate(self.years)}
+
+    @classmethod
+    def from_rows(cls, statement, rows):
+        """Build a panel from raw statement rows (e.g. fetch_statement_rows output)."""
+        date_column = STATEMENT_DATE_COLUMNS[statement]
+        account_columns = [col for col in rows.columns if col not in METADATA_COLUMNS]
+        accounts = [_account_name(col) for col in account_columns]
+        if rows.empty:
+            empty = np.empty((0, len(accounts), 0))
+            return cls(statement, empty, empty.astype(bool), [], accounts, [])
+
+        dates = pd.to_datetime(rows[date_column])
+        if statement == 'balance_sheet':
+            year_end = dates.dt.is_year_end.to_numpy()
+            rows, dates = rows[year_end], dates[year_end]
+
+        codes = rows['cvm_code'].to_numpy(dtype=np.int64)
+        row_years = dates.dt.year.to_numpy(dtype=np.int64)
+        data = rows[account_columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        present = ~np.isnan(data)
+
+        cvm_codes = np.unique(codes)
+        years = np.arange(row_years.min(), row_years.max() + 1) if len(row_years) else np.empty(0, np.int64)
+        company_pos = np.searchsorted(cvm_codes, codes)
+        year_pos = row_years - (years[0] if len(years) else 0)
+
+        shape = (len(cvm_codes), len(accounts), len(years))
+        values = np.zeros(shape, dtype=np.float64)
+        mask = np.zeros(shape, dtype=bool)
+        index = (company_pos, slice(None), year_pos)
+        if statement == 'balance_sheet':
+            # Later rows for the same company and year win, as in the transposed frame
+            values[index] = np.where(present, data, 0.0)
+            mask[index] = present
+        else:
+            np.add.at(values, index, np.where(present, data, 0.0))
+            np.logical_or.at(mask, index, present)
+
+        if statement == 'balance_sheet' and 'assets' in accounts and 'liabilities' in accounts:
+            assets = values[:, accounts.index('assets'), :]
+            liabilities = values[:, accounts.index('liabilities'), :]
+            check_mask = mask[:, accounts.index('assets'), :] & mask[:, accounts.index('liabilities'), :]
+            values = np.concatenate([values, (assets - liabilities)[:, None, :]], axis=1)
+            mask = np.concatenate([mask, check_mask[:, None, :]], axis=1)
+            accounts = accounts + ['check']
+
+        values[~mask] = np.nan
+        return cls(statement, values, mask, cvm_codes, accounts, years)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.mask.nbytes
+
+    def company(self, cvm_code):
+        """account × year view of one company."""
+        return self.values[self.company_index[int(cvm_code)]]
+
+    def account(self, account):
+        """company × year view of one account."""
+        return self.values[:, self.account_index[account], :]
+
+    def window(self, cvm_code, end_year, length=5):
+        """account × year view of the `length` years up to and excluding end_year."""
+        stop = self.year_index[int(end_year)]
+        return self.company(cvm_code)[:, max(stop - length, 0):stop]
+
+    def available_years(self, cvm_code):
+        """Years in which the company has at least one reported account."""
+        company_mask = self.mask[self.company_index[int(cvm_code)]]
+        return self.years[company_mask.any(axis=0)]
+
+    def to_frame(self, cvm_code):
+        """year × account DataFrame of one company, oriented like fetch_datx_y."""
+        i = self.company_index[int(cvm_code)]
+        has_data = self.mask[i].any(axis=0)
+        return pd.DataFrame(self.values[i][:, has_data].T, index=self.years[has_data], columns=self.accounts)
+
+
+def build_panels(cvm_codes, statements=('balance_sheet', 'income_statement'), aggregate_in_db=None):
+    """Fetch each statement for all cvm_codes with one query and build its panel."""
+    panels = {}
+    for statement in statements:
+        rows = fetch_statement_rows(statement, cvm_codes, aggregate_in_db)
+        panels[statement] = FinancialPanel.from_rows(statement, rows)
+    return panels
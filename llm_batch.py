@@ -0,0 +1,230 @@
+# llm_batch.py
+# Whole-universe predictions through the OpenAI Batch API: every (cvm_code, window)
+# prompt goes into one JSONL file, submitted as a single asynchronous job whose
+# results are mapped back to companies and years.
+import asyncio
+import json
+import logging
+import os
+import time
+import pandas as pd
+import llm_cache
+import llm_dispatch
+import llm_telemetry
+from fetcherv6 import fetch_scope
+from openaicall import (openai, create_prompt, predict_window, prediction_request, prediction_windows,
+                        reask_request)
+from prediction_parser import parse_prediction_text
+
+BATCH_DIR = os.getenv("FINLLM_BATCH_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "batches"))
+BATCH_ENDPOINT = "/v1/chat/completions"
+POLL_INTERVAL = float(os.getenv("FINLLM_BATCH_POLL_INTERVAL", "60"))
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+
+def custom_id(cvm_code, year):
+    return f"{int(cvm_code)}-{int(year)}"
+
+
+def parse_custom_id(value):
+    cvm_code, year = value.rsplit('-', 1)
+    return int(cvm_code), int(year)
+
+
+def _client(client):
+    return client or openai.OpenAI()
+
+
+@fetch_scope()
+def build_batch_requests(cvm_codes):
+    """Return (batch lines, cached) for every prediction window of the companies.
+
+    Windows whose request is already in the response cache are returned in
+    `cached` (custom_id -> completion) instead of being sent again.
+    """
+    cache = llm_cache.get_cache()
+    lines = []
+    cached = {}
+    for cvm_code in cvm_codes:
+        windows = prediction_windows(cvm_code)
+        if isinstance(windows, dict):
+            logging.warning(f"Skipping cvm_code {cvm_code}: {windows['error']}")
+            continue
+        for year, income, balance in windows:
+            request = prediction_request(create_prompt(income, balance))
+            request_id = custom_id(cvm_code, year)
+            hit = cache.get(llm_cache.cache_key('openai', request)) if cache is not None else None
+            if hit is not None:
+                cached[request_id] = hit
+                continue
+            lines.append({'custom_id': request_id, 'method': 'POST', 'url': BATCH_ENDPOINT, 'body': request})
+    logging.info(f"Built {len(lines)} batch requests; {len(cached)} windows served from the cache")
+    return lines, cached
+
+
+def _read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _write_job(job):
+    with open(os.path.join(job['job_dir'], 'job.json'), 'w') as f:
+        json.dump(job, f, indent=2)
+
+
+def submit_batch(lines, job_dir=None, client=None):
+    """Write the requests to <job_dir>/requests.jsonl, upload and submit them; return the job record."""
+    client = _client(client)
+    job_dir = job_dir or os.path.join(BATCH_DIR, time.strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(job_dir, exist_ok=True)
+    path = os.path.join(job_dir, 'requests.jsonl')
+    with open(path, 'w') as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + '\n')
+    with open(path, 'rb') as f:
+        input_file = client.files.create(file=f, purpose='batch')
+    batch = client.batches.create(input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window='24h')
+    job = {
+        'job_dir': job_dir,
+        'batch_id': batch.id,
+        'input_file_id': input_file.id,
+        'requests': len(lines),
+        'submitted_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    _write_job(job)
+    logging.info(f"Submitted batch {batch.id} with {len(lines)} requests")
+    return job
+
+
+def wait_for_batch(batch_id, client=None, poll_interval=POLL_INTERVAL, timeout=None):
+    """Poll the batch until it reaches a terminal status and return it."""
+    client = _client(client)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts is not None:
+            logging.info(f"Batch {batch_id} {batch.status}: {counts.completed}/{counts.total} done, {counts.failed} failed")
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"Batch {batch_id} still {batch.status} after {timeout} seconds")
+        time.sleep(poll_interval)
+
+
+def download_results(batch, client=None):
+    """Result lines of the batch's output and error files."""
+    client = _client(client)
+    results = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            text = client.files.content(file_id).text
+            results.extend(json.loads(line) for line in text.splitlines() if line.strip())
+    return results
+
+
+async def _reask_all(reasks):
+    calls = []
+    for request_id, request in reasks.items():
+        cvm_code, year = parse_custom_id(request_id)
+        calls.append(llm_telemetry.tagged(predict_window(request), cvm_code=cvm_code, year=year, mode='batch'))
+    return await asyncio.gather(*calls, return_exceptions=True)
+
+
+def ingest_results(results, requests_by_id=None, cached=None):
+    """Map batch results (plus cached completions) back to a prediction frame per cvm_code.
+
+    Each frame has the rows get_predictions returns for that company, in year
+    order. Completed requests are stored in the response cache. Replies that
+    are not valid predictions are re-asked individually through the regular
+    concurrent path.
+    """
+    cache = llm_cache.get_cache()
+    completions = dict(cached or {})
+    for result in results:
+        response = result.get('response') or {}
+        if response.get('status_code') != 200:
+            logging.error(f"Batch request {result.get('custom_id')} failed: {result.get('error') or response.get('body')}")
+            continue
+        completions[result['custom_id']] = response['body']
+        request = (requests_by_id or {}).get(result['custom_id'])
+        if cache is not None and request is not None:
+            cache.put(llm_cache.cache_key('openai', request), 'openai', request['model'], response['body'])
+
+    predictions = {}
+    reasks = {}
+    for request_id, completion in completions.items():
+        content = completion['choices'][0]['message']['content']
+        prediction, error = parse_prediction_text(content)
+        request = (requests_by_id or {}).get(request_id)
+        if error is None:
+            predictions[request_id] = prediction
+        elif request is not None:
+            reasks[request_id] = reask_request(request, content, error)
+        else:
+            logging.error(f"Batch reply for {request_id} is not a valid prediction: {error}")
+    if reasks:
+        logging.warning(f"Re-asking {len(reasks)} windows whose batch reply was not a valid prediction")
+        for request_id, result in zip(reasks, llm_dispatch.run(_reask_all(reasks))):
+            if isinstance(result, Exception):
+                logging.error(f"Re-ask for {request_id} failed: {result}")
+            elif result[1] is not None:
+                predictions[request_id] = result[1]
+
+    rows = {}
+    for request_id in sorted(predictions, key=parse_custom_id):
+        cvm_code, year = parse_custom_id(request_id)
+        prediction = predictions[request_id]
+        # The window's year comes from the custom_id; the model's Year is only its echo of it
+        if prediction.get('Year') != year:
+            logging.warning(f"Batch reply for {request_id} names year {prediction.get('Year')}; using {year}")
+        rows.setdefault(cvm_code, []).append(dict(prediction, Year=year))
+    return {cvm_code: pd.DataFrame(frame_rows) for cvm_code, frame_rows in rows.items()}
+
+
+def collect_batch(job_dir, client=None, poll_interval=POLL_INTERVAL, timeout=None, cached=None):
+    """Wait for a submitted job (e.g. after a restart) and ingest its results."""
+    with open(os.path.join(job_dir, 'job.json')) as f:
+        job = json.load(f)
+    batch = wait_for_batch(job['batch_id'], client, poll_interval, timeout)
+    job['status'] = batch.status
+    _write_job(job)
+    if batch.status != 'completed':
+        logging.error(f"Batch {job['batch_id']} ended with status {batch.status}")
+    requests_by_id = {line['custom_id']: line['body'] for line in _read_jsonl(os.path.join(job_dir, 'requests.jsonl'))}
+    return ingest_results(download_results(batch, client), requests_by_id, cached)
+
+
+def get_batch_predictions(cvm_codes, client=None, job_dir=None, poll_interval=POLL_INTERVAL, timeout=None):
+    """Predict every window of every company with one batch job; returns {cvm_code: predictions}."""
+    lines, cached = build_batch_requests(cvm_codes)
+    if not lines:
+        return ingest_results([], cached=cached)
+    job = submit_batch(lines, job_dir, client)
+    return collect_batch(job['job_dir'], client, poll_interval, timeout, cached)
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Run earnings predictions through the OpenAI Batch API.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    submit = subparsers.add_parser('submit', help="Build and submit a batch")
+    submit.add_argument('cvm_codes', nargs='*', type=int, help="Companies to predict (default: all)")
+    collect = subparsers.add_parser('collect', help="Wait for a submitted batch and save its predictions")
+    collect.add_argument('job_dir')
+    args = parser.parse_args()
+
+    if args.command == 'submit':
+        cvm_codes = args.cvm_codes
+        if not cvm_codes:
+            from company_directory import directory
+            cvm_codes = list(directory.frame.index)
+        lines, _ = build_batch_requests(cvm_codes)
+        print(submit_batch(lines)['job_dir'] if lines else "Every window is already cached.")
+    else:
+        predictions = collect_batch(args.job_dir)
+        frame = pd.concat(predictions, names=['cvm_code']) if predictions else pd.DataFrame()
+        path = os.path.join(args.job_dir, 'predictions.csv')
+        frame.to_csv(path)
+        print(path)
@@ -0,0 +1,178 @@
+# llm_cache.py
+# Disk-backed cache of LLM responses keyed by a hash of everything that determines
+# the response: provider, model, messages (system and user prompt) and sampling
+# parameters. Entries live in one SQLite file in WAL mode, so concurrent readers
+# and writers (threads or processes) do not block each other.
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_ENABLED = os.getenv("FINLLM_LLM_CACHE", "1") == "1"
+CACHE_PATH = os.getenv("FINLLM_LLM_CACHE_PATH",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache", "responses.db"))
+
+# Least recently used entries are evicted above this size
+MAX_BYTES = int(float(os.getenv("FINLLM_LLM_CACHE_MAX_MB", "512")) * 2**20)
+
+# Entries older than this are treated as misses and evicted
+MAX_AGE_DAYS = float(os.getenv("FINLLM_LLM_CACHE_MAX_AGE_DAYS", "90"))
+
+# Eviction runs after this many writes
+EVICT_EVERY = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    model TEXT,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses (accessed_at);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def cache_key(provider, request):
+    """sha256 of the provider and the request (model, messages, sampling parameters) as canonical JSON."""
+    payload = json.dumps({'provider': provider, 'request': request}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Content-addressed response store with age and size based eviction."""
+
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_BYTES, max_age_days=MAX_AGE_DAYS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        # sqlite3 connections must stay on the thread that opened them
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, conn, name):
+        conn.execute("INSERT INTO stats (name, value) VALUES (?, 1) "
+                     "ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key):
+        """Return the cached response (decoded JSON) or None."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self._count(conn, 'misses')
+                with self._lock:
+                    self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET accessed_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._count(conn, 'hits')
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, provider, model, response):
+        """Store a JSON-serialisable response."""
+        data = json.dumps(response, ensure_ascii=False, default=str)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, data, len(data), now, now),
+            )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until the cache fits max_bytes."""
+        with self._connect() as conn:
+            expired = conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            evicted = 0
+            if total > self.max_bytes:
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+                    evicted += 1
+        if expired or evicted:
+            logging.info(f"LLM cache evicted {expired} expired and {evicted} least recently used entries")
+        return expired + evicted
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+            conn.execute("DELETE FROM stats")
+
+    def stats(self):
+        """Entry count and size, plus hits/misses of this process and of all runs."""
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            totals = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+        return {
+            'entries': entries,
+            'bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'total_hits': totals.get('hits', 0),
+            'total_misses': totals.get('misses', 0),
+        }
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    """The shared cache at CACHE_PATH, or None when FINLLM_LLM_CACHE=0."""
+    global _default_cache
+    if not CACHE_ENABLED:
+        return None
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = ResponseCache()
+    return _default_cache
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Inspect or trim the LLM response cache.")
+    parser.add_argument('command', choices=['stats', 'evict', 'clear'])
+    args = parser.parse_args()
+    cache = ResponseCache()
+    if args.command == 'evict':
+        cache.evict()
+    elif args.command == 'clear':
+        cache.clear()
+    print(json.dumps(cache.stats(), indent=2))
@@ -0,0 +1,200 @@
+# llm_dispatch.py
+# Concurrent dispatch of LLM requests under requests-per-minute and
+# tokens-per-minute quotas. Rate limiting is shared by every thread and event
+# loop in the process; concurrency is bounded per event loop.
+import asyncio
+import concurrent.futures
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+# Provider quotas (defaults are gpt-4-turbo tier-1 limits)
+REQUESTS_PER_MINUTE = float(os.getenv("FINLLM_LLM_RPM", "500"))
+TOKENS_PER_MINUTE = float(os.getenv("FINLLM_LLM_TPM", "30000"))
+
+# Requests in flight at once on an event loop
+MAX_CONCURRENCY = int(os.getenv("FINLLM_LLM_CONCURRENCY", "16"))
+
+# Attempts per request after a 429 or a transient server error
+MAX_RETRIES = int(os.getenv("FINLLM_LLM_MAX_RETRIES", "5"))
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, capacity, rate, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount):
+        """Take `amount` tokens, going into debt if needed; return the seconds to wait before using them."""
+        # Requests larger than the bucket would never fit, so they wait for a full bucket
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill(self._clock())
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self, amount):
+        """Give back tokens that were reserved but not used."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets plus a shared pause for 429 responses."""
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 clock=time.monotonic):
+        self._clock = clock
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60, clock)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60, clock)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    async def acquire(self, tokens):
+        """Wait until one request of `tokens` estimated tokens fits both quotas."""
+        delay = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        delay = max(delay, self._paused_until - self._clock())
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # A 429 received while waiting pauses this request too
+        while (remaining := self._paused_until - self._clock()) > 0:
+            await asyncio.sleep(remaining)
+
+    def settle(self, reserved, used):
+        """Refund the difference between estimated and reported token usage."""
+        if used is not None and used < reserved:
+            self.tokens.refund(reserved - used)
+
+    def pause(self, seconds):
+        """Hold every request until `seconds` from now (the server's retry-after)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+# Shared by every caller in the process, whatever thread or loop it runs on
+limiter = RateLimiter()
+
+
+def _semaphore():
+    # asyncio primitives belong to one loop, so keep one semaphore per running loop
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return semaphore
+
+
+def estimate_tokens(messages, max_tokens=0):
+    """Rough prompt size (4 characters per token) plus the completion budget, as the quota counts it."""
+    characters = sum(len(message.get('content') or '') for message in messages)
+    return characters // 4 + len(messages) * 4 + (max_tokens or 0)
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, from retry-after-ms / retry-after headers, or None."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    for header, scale in (('retry-after-ms', 1000), ('retry-after', 1)):
+        value = headers.get(header)
+        if value is not None:
+            try:
+                return float(value) / scale
+            except ValueError:
+                pass
+    return None
+
+
+def _status_code(error):
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+
+def _is_transient(error, status):
+    # Network failures (connection errors, timeouts) carry no status code
+    if status is None:
+        return isinstance(error, (OSError, TimeoutError))
+    return status == 429 or status >= 500
+
+
+def _total_tokens(response):
+    usage = response.get('usage') if isinstance(response, dict) else getattr(response, 'usage', None)
+    if isinstance(usage, dict):
+        return usage.get('total_tokens')
+    return getattr(usage, 'total_tokens', None)
+
+
+def _backoff(attempt):
+    return min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+async def dispatch(call, request, tokens=None, rate_limiter=None, max_retries=None, record=None):
+    """Run `await call(**request)` under the concurrency bound and rate limits.
+
+    A 429 pauses every request for the server's retry-after (or a jittered
+    exponential backoff) and retries; 5xx responses, connection errors and
+    timeouts are retried with backoff; other errors propagate. Failed attempts
+    refund their token reservation. Retries are counted on `record` (an
+    llm_telemetry.CallRecord) when one is given.
+    """
+    rate_limiter = rate_limiter or limiter
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    if tokens is None:
+        tokens = estimate_tokens(request.get('messages', []), request.get('max_tokens'))
+    async with _semaphore():
+        for attempt in range(max_retries + 1):
+            await rate_limiter.acquire(tokens)
+            if record is not None:
+                record.sent()
+            try:
+                response = await call(**request)
+            except Exception as e:
+                # A failed attempt consumed nothing; give its reservation back before retrying
+                rate_limiter.settle(tokens, 0)
+                status = _status_code(e)
+                if attempt == max_retries or not _is_transient(e, status):
+                    raise
+                if record is not None:
+                    record.retries += 1
+                wait = retry_after(e)
+                wait = _backoff(attempt) if wait is None else wait
+                if status == 429:
+                    logging.warning(f"Rate limited; pausing requests for {wait:.1f} seconds")
+                    rate_limiter.pause(wait)
+                else:
+                    logging.warning(f"Transient error ({status or type(e).__name__}); retrying in {wait:.1f} seconds")
+                    await asyncio.sleep(wait)
+                continue
+            rate_limiter.settle(tokens, _total_tokens(response))
+            return response
+
+
+async def dispatch_all(call, requests, rate_limiter=None):
+    """Dispatch every request at once; return responses (or the raised exceptions) in order."""
+    return await asyncio.gather(*(dispatch(call, request, rate_limiter=rate_limiter) for request in requests),
+                                return_exceptions=True)
+
+
+def run(coro):
+    """Run a coroutine to completion from sync code, even when this thread already runs a loop (notebooks)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
@@ -0,0 +1,162 @@
+# llm_providers.py
+# One client for every chat-completion provider: OpenAI, Perplexity or any
+# OpenAI-compatible endpoint. Each provider keeps a pooled keep-alive HTTP
+# session; requests go through llm_dispatch for rate limiting and retries.
+import asyncio
+import json
+import os
+import threading
+import llm_dispatch
+from prediction_parser import JSONObjectScanner
+
+# (connect, read) seconds per request
+CONNECT_TIMEOUT = float(os.getenv("FINLLM_LLM_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("FINLLM_LLM_READ_TIMEOUT", "120"))
+
+
+class Provider:
+    """An OpenAI-compatible chat completions endpoint with its credentials and pooled session."""
+
+    def __init__(self, name, base_url, api_key_env, timeout=None, pool_size=None, rate_limiter=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.api_key_env = api_key_env
+        self.timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+        self.pool_size = pool_size or llm_dispatch.MAX_CONCURRENCY
+        # Quotas are per provider account
+        self.rate_limiter = rate_limiter or llm_dispatch.RateLimiter()
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _api_key(self):
+        api_key = os.getenv(self.api_key_env)
+        if not api_key:
+            raise EnvironmentError(f"Missing environment variable {self.api_key_env} for provider {self.name}")
+        return api_key
+
+    @property
+    def session(self):
+        """Keep-alive session whose pool holds a connection per concurrent request."""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers.update({'accept': 'application/json', 'content-type': 'application/json'})
+                    self._session = session
+        return self._session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def post(self, request, api_key=None, stream=False, record=None):
+        """One POST to /chat/completions; raises requests.HTTPError on 4xx/5xx. Returns the decoded JSON.
+
+        With stream=True the reply is read as server-sent events and assembled
+        into the same completion shape; the first token's arrival is marked on
+        `record`.
+        """
+        response = self.session.post(
+            f"{self.base_url}/chat/completions",
+            json=dict(request, stream=True) if stream else request,
+            headers={'authorization': f"Bearer {api_key or self._api_key()}"},
+            timeout=self.timeout,
+            stream=stream,
+        )
+        response.raise_for_status()
+        if not stream:
+            return response.json()
+        with response:
+            return _read_stream(response, record)
+
+    async def complete(self, request, tokens=None, stream=False, record=None):
+        """Chat completion under llm_dispatch's concurrency bound, rate limits and retries."""
+        # Read the key up front: a missing credential is not worth retrying
+        api_key = self._api_key()
+
+        async def call(**kwargs):
+            return await asyncio.to_thread(self.post, kwargs, api_key, stream, record)
+        return await llm_dispatch.dispatch(call, request, tokens, self.rate_limiter, record=record)
+
+    def complete_sync(self, request, stream=False):
+        return llm_dispatch.run(self.complete(request, stream=stream))
+
+
+def _read_stream(response, record=None):
+    """Assemble a streamed completion, stopping as soon as the reply's first JSON object is complete.
+
+    The rest of the stream is still read (unless the call was cancelled):
+    abandoning it part-way closes the connection instead of returning it to
+    the keep-alive pool.
+    """
+    scanner = JSONObjectScanner()
+    parts = []
+    completion = {'object': 'chat.completion', 'usage': None}
+    finish_reason = None
+    lines = response.iter_lines(decode_unicode=True)
+    for line in lines:
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]' or (record is not None and record.cancelled):
+            break
+        chunk = json.loads(data)
+        completion.setdefault('id', chunk.get('id'))
+        completion.setdefault('model', chunk.get('model'))
+        completion['usage'] = chunk.get('usage') or completion['usage']
+        for choice in chunk.get('choices') or []:
+            content = (choice.get('delta') or {}).get('content') or ''
+            if content and record is not None:
+                record.first_token()
+            parts.append(content)
+            finish_reason = choice.get('finish_reason') or finish_reason
+            if scanner.feed(content):
+                # The rest of the reply is commentary we would discard anyway
+                finish_reason = finish_reason or 'stop'
+                break
+        if scanner.complete:
+            break
+    if record is None or not record.cancelled:
+        for _ in lines:
+            pass
+    completion['choices'] = [{'index': 0, 'finish_reason': finish_reason,
+                              'message': {'role': 'assistant', 'content': ''.join(parts)}}]
+    return completion
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def register_provider(name, base_url, api_key_env, timeout=None, rate_limiter=None):
+    """Add or replace a provider, e.g. a self-hosted OpenAI-compatible server."""
+    provider = Provider(name, base_url, api_key_env, timeout, rate_limiter=rate_limiter)
+    with _providers_lock:
+        previous = _providers.pop(name, None)
+        _providers[name] = provider
+    if previous is not None:
+        previous.close()
+    return provider
+
+
+def get_provider(name):
+    try:
+        return _providers[name]
+    except KeyError:
+        raise ValueError(f"Unknown LLM provider: {name}") from None
+
+
+register_provider('openai', os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"), 'OPENAI_API_KEY',
+                  rate_limiter=llm_dispatch.limiter)
+register_provider('perplexity', os.getenv("PERPLEXITY_BASE_URL", "https://api.perplexity.ai"), 'PERPLEXITY_API_KEY')
+
+# Any OpenAI-compatible endpoint configured through the environment
+if os.getenv("FINLLM_LLM_BASE_URL"):
+    register_provider('custom', os.getenv("FINLLM_LLM_BASE_URL"), 'FINLLM_LLM_API_KEY')
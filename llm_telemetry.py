@@ -0,0 +1,356 @@
+# llm_telemetry.py
+# Per-call telemetry of the LLM requests made from openaicall: prompt and
+# completion tokens, time to first token, latency, retries, cache hits and
+# estimated cost, tagged by cvm_code, window year and model. Calls are
+# aggregated into histograms exported as OpenMetrics text, plus a run summary.
+import asyncio
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+import llm_dispatch
+
+ENABLED = os.getenv("FINLLM_TELEMETRY", "1") == "1"
+TELEMETRY_DIR = os.getenv("FINLLM_TELEMETRY_DIR",
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), "telemetry"))
+
+# USD per million (prompt, completion) tokens; calls to other models have no cost estimate
+PRICES = {
+    'gpt-4-turbo': (10.0, 30.0),
+    'gpt-4o': (2.5, 10.0),
+    'gpt-4o-mini': (0.15, 0.6),
+    'mixtral-8x7b-instruct': (0.6, 0.6),
+}
+
+# Recent service times kept per (provider, model) for latency_quantile
+LATENCY_WINDOW = 500
+
+# Histogram bucket upper bounds
+SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+_tags = contextvars.ContextVar('llm_telemetry_tags', default={})
+
+
+@contextlib.contextmanager
+def tags(**values):
+    """Tag the calls made inside the block, and in tasks started from it, e.g. with cvm_code and year."""
+    token = _tags.set({**_tags.get(), **values})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+async def tagged(awaitable, **values):
+    """Await `awaitable` with its calls tagged; for one task of an asyncio.gather."""
+    with tags(**values):
+        return await awaitable
+
+
+_send_event = contextvars.ContextVar('llm_telemetry_send_event', default=None)
+
+
+async def watch_send(awaitable, event):
+    """Await `awaitable` in its own task, setting the asyncio.Event `event` once a call of it is sent.
+
+    A call counts as sent when llm_dispatch has cleared the concurrency bound
+    and rate limits for it, not when it is queued behind them.
+    """
+    _send_event.set(event)
+    return await awaitable
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    prices = PRICES.get(model)
+    if prices is None or prompt_tokens is None or completion_tokens is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1e6
+
+
+class CallRecord:
+    """Measurements of one completion request, filled in as it goes through the cache, dispatch and stream."""
+
+    def __init__(self, provider, request):
+        self.provider = provider
+        self.request = request
+        self.model = request.get('model')
+        self.tags = dict(_tags.get())
+        self.started = time.monotonic()
+        self.sent_at = None
+        self._send_event = _send_event.get()
+        self.time_to_first_token = None
+        self.latency = None
+        self.service_time = None
+        self.retries = 0
+        self.cache_hit = False
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.tokens_estimated = False
+        self.error = None
+        self.cancelled = False
+        self.response = None
+
+    def sent(self):
+        """Mark an attempt as sent to the provider; service_time runs from the last one."""
+        self.sent_at = time.monotonic()
+        if self._send_event is not None:
+            self._send_event.set()
+
+    def first_token(self):
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.monotonic() - self.started
+
+    def finish(self, response=None, error=None):
+        self.latency = time.monotonic() - self.started
+        if self.sent_at is not None:
+            self.service_time = time.monotonic() - self.sent_at
+        self.error = None if error is None else type(error).__name__
+        # A stream being read for a cancelled call stops at its next line
+        self.cancelled = isinstance(error, asyncio.CancelledError)
+        if response is None:
+            return
+        usage = response.get('usage') or {}
+        self.prompt_tokens = usage.get('prompt_tokens')
+        self.completion_tokens = usage.get('completion_tokens')
+        if self.prompt_tokens is None or self.completion_tokens is None:
+            # Streams read up to the prediction object carry no usage; estimate it like the rate limiter does
+            content = response['choices'][0]['message'].get('content') or ''
+            self.prompt_tokens = llm_dispatch.estimate_tokens(self.request.get('messages', []))
+            self.completion_tokens = len(content) // 4
+            self.tokens_estimated = True
+
+    @property
+    def cost(self):
+        """Estimated USD billed for the call; a cache hit costs nothing."""
+        if self.cache_hit:
+            return 0.0
+        return estimate_cost(self.model, self.prompt_tokens, self.completion_tokens)
+
+    def as_dict(self):
+        return {
+            **self.tags,
+            'provider': self.provider,
+            'model': self.model,
+            'cache_hit': self.cache_hit,
+            'error': self.error,
+            'retries': self.retries,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'tokens_estimated': self.tokens_estimated,
+            'time_to_first_token': self.time_to_first_token,
+            'latency': self.latency,
+            'service_time': self.service_time,
+            'cost_usd': self.cost,
+        }
+
+
+def records_frame(records):
+    """Call records as a DataFrame, with every column present even when no call set it."""
+    frame = pd.DataFrame(records)
+    for column in ('mode', 'provider', 'model', 'cache_hit', 'error'):
+        if column not in frame:
+            frame[column] = pd.Series(dtype=object)
+    for column in ('cvm_code', 'year', 'retries', 'prompt_tokens', 'completion_tokens', 'time_to_first_token',
+                   'latency', 'service_time', 'cost_usd'):
+        if column not in frame:
+            frame[column] = pd.Series(dtype=float)
+    return frame
+
+
+class Telemetry:
+    """Every call record of the run, with the metrics and summary derived from them."""
+
+    def __init__(self):
+        self._records = []
+        self._latencies = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self._records.append(record.as_dict())
+            if record.error is None and not record.cache_hit and record.service_time is not None:
+                self._latencies[record.provider, record.model].append(record.service_time)
+
+    def reset(self):
+        with self._lock:
+            self._records = []
+            self._latencies.clear()
+
+    def latency_quantile(self, provider, model, q, min_samples=20):
+        """The q-quantile send-to-response time of a model's recent successful calls, or None with too few."""
+        with self._lock:
+            latencies = list(self._latencies.get((provider, model), ()))
+        if len(latencies) < min_samples:
+            return None
+        return float(np.quantile(latencies, q))
+
+    def frame(self):
+        with self._lock:
+            return records_frame(list(self._records))
+
+    def openmetrics(self):
+        return to_openmetrics(self.frame())
+
+    def summary(self):
+        return summarize(self.frame())
+
+    def write_report(self, directory=None):
+        """Write calls.jsonl, metrics.prom and summary.json to a new run directory and return its path."""
+        return write_report(self.frame(), directory)
+
+
+telemetry = Telemetry()
+
+
+def write_report(frame, directory=None):
+    """Write the call records, their OpenMetrics export and summary to `directory` and return its path."""
+    directory = directory or os.path.join(TELEMETRY_DIR, time.strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(directory, exist_ok=True)
+    frame.to_json(os.path.join(directory, 'calls.jsonl'), orient='records', lines=True)
+    with open(os.path.join(directory, 'metrics.prom'), 'w') as f:
+        f.write(to_openmetrics(frame))
+    with open(os.path.join(directory, 'summary.json'), 'w') as f:
+        json.dump(summarize(frame), f, indent=2)
+    logging.info(f"LLM telemetry for {len(frame)} calls written to {directory}")
+    return directory
+
+
+@contextlib.contextmanager
+def track(provider, request):
+    """Time one completion request; the block sets record.response (and record.cache_hit) before leaving."""
+    record = CallRecord(provider, request)
+    try:
+        yield record
+    except BaseException as e:
+        # Includes cancellation, e.g. the losing request of a hedged pair
+        record.finish(error=e)
+        if ENABLED:
+            telemetry.add(record)
+        raise
+    record.finish(record.response)
+    if ENABLED:
+        telemetry.add(record)
+
+
+def _labels(**labels):
+    return ",".join(f'{key}="{str(value)}"' for key, value in labels.items())
+
+
+def _histogram(lines, name, unit, help_text, frame, column, buckets):
+    lines += [f"# TYPE {name} histogram"] + ([f"# UNIT {name} {unit}"] if unit else []) + [f"# HELP {name} {help_text}"]
+    for (provider, model), group in frame.groupby(['provider', 'model']):
+        values = group[column].dropna().astype(float).to_numpy()
+        labels = _labels(provider=provider, model=model)
+        for bound in buckets:
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {int((values <= bound).sum())}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {len(values)}')
+        lines.append(f"{name}_count{{{labels}}} {len(values)}")
+        lines.append(f"{name}_sum{{{labels}}} {values.sum():.6g}")
+
+
+def _counter(lines, name, help_text, samples):
+    lines += [f"# TYPE {name} counter", f"# HELP {name} {help_text}"]
+    lines += [f"{name}_total{{{_labels(**labels)}}} {value:.6g}" for labels, value in samples]
+
+
+def to_openmetrics(frame):
+    """OpenMetrics text exposition of the call records, labelled by provider and model."""
+    lines = []
+    frame = frame.dropna(subset=['model'])
+    calls = frame.assign(cache=np.where(frame['cache_hit'].astype(bool), 'hit', 'miss'),
+                         outcome=np.select([frame['error'].isna(), frame['error'] == 'CancelledError'],
+                                           ['ok', 'cancelled'], 'error'))
+    billed = frame[~frame['cache_hit'].astype(bool)]
+    by_model = billed.groupby(['provider', 'model'])
+
+    _counter(lines, 'finllm_llm_requests', "Completion requests", [
+        (dict(zip(('provider', 'model', 'cache', 'outcome'), key)), len(group))
+        for key, group in calls.groupby(['provider', 'model', 'cache', 'outcome'])])
+    _counter(lines, 'finllm_llm_retries', "Retries after rate limits and transient errors", [
+        (dict(provider=provider, model=model), group['retries'].sum()) for (provider, model), group in by_model])
+    _counter(lines, 'finllm_llm_tokens', "Tokens billed, estimated when the provider reported no usage", [
+        (dict(provider=provider, model=model, kind=kind), group[f'{kind}_tokens'].fillna(0).sum())
+        for (provider, model), group in by_model for kind in ('prompt', 'completion')])
+    _counter(lines, 'finllm_llm_cost_usd', "Estimated cost in USD", [
+        (dict(provider=provider, model=model), group['cost_usd'].fillna(0).sum())
+        for (provider, model), group in by_model])
+    _histogram(lines, 'finllm_llm_request_duration_seconds', 'seconds', "Latency of completion requests",
+               billed, 'latency', SECONDS_BUCKETS)
+    _histogram(lines, 'finllm_llm_time_to_first_token_seconds', 'seconds', "Time to the first streamed token",
+               billed, 'time_to_first_token', SECONDS_BUCKETS)
+    _histogram(lines, 'finllm_llm_prompt_tokens', None, "Prompt tokens per request",
+               billed, 'prompt_tokens', TOKEN_BUCKETS)
+    return "\n".join(lines + ["# EOF"]) + "\n"
+
+
+def _quantiles(series):
+    values = series.dropna().astype(float)
+    if values.empty:
+        return None
+    return {'p50': round(values.quantile(0.5), 3), 'p95': round(values.quantile(0.95), 3),
+            'max': round(values.max(), 3)}
+
+
+def summarize(frame, top=10):
+    """Totals, latency quantiles, per-model and per-mode breakdowns and the companies that cost the most."""
+    billed = frame[~frame['cache_hit'].astype(bool)]
+    summary = {
+        'calls': len(frame),
+        'cache_hits': int(frame['cache_hit'].astype(bool).sum()),
+        'errors': int((frame['error'].notna() & (frame['error'] != 'CancelledError')).sum()),
+        'cancelled': int((frame['error'] == 'CancelledError').sum()),
+        'retries': int(frame['retries'].fillna(0).sum()),
+        'prompt_tokens': int(billed['prompt_tokens'].fillna(0).sum()),
+        'completion_tokens': int(billed['completion_tokens'].fillna(0).sum()),
+        'cost_usd': round(float(frame['cost_usd'].fillna(0).sum()), 4),
+        'latency_seconds': _quantiles(billed['latency']),
+        'time_to_first_token_seconds': _quantiles(billed['time_to_first_token']),
+        'by_model': {},
+        'by_mode': {},
+        'by_company': [],
+    }
+    for model, group in frame.dropna(subset=['model']).groupby('model'):
+        summary['by_model'][model] = {
+            'calls': len(group),
+            'cost_usd': round(float(group['cost_usd'].fillna(0).sum()), 4),
+            'latency_seconds': _quantiles(group.loc[~group['cache_hit'].astype(bool), 'latency']),
+        }
+    for mode, group in frame.dropna(subset=['mode']).groupby('mode'):
+        billed_group = group[~group['cache_hit'].astype(bool)]
+        summary['by_mode'][mode] = {
+            'calls': len(group),
+            'companies': int(group['cvm_code'].nunique()),
+            'prompt_tokens': int(billed_group['prompt_tokens'].fillna(0).sum()),
+            'completion_tokens': int(billed_group['completion_tokens'].fillna(0).sum()),
+            'cost_usd': round(float(group['cost_usd'].fillna(0).sum()), 4),
+            'latency_seconds': _quantiles(billed_group['latency']),
+        }
+    if 'hedge' in frame:
+        secondary = frame[frame['hedge'] == 'secondary']
+        summary['hedges'] = {'sent': len(secondary), 'completed': int(secondary['error'].isna().sum())}
+    companies = frame.dropna(subset=['cvm_code'])
+    if not companies.empty:
+        per_company = companies.groupby('cvm_code').agg(
+            calls=('latency', 'size'), seconds=('latency', 'sum'), cost_usd=('cost_usd', 'sum'))
+        per_company = per_company.sort_values(['seconds', 'cost_usd'], ascending=False).head(top)
+        summary['by_company'] = [
+            {'cvm_code': int(cvm_code), 'calls': int(row.calls), 'seconds': round(float(row.seconds), 3),
+             'cost_usd': round(float(row.cost_usd), 4)}
+            for cvm_code, row in per_company.iterrows()]
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Summarise the LLM calls of a telemetry run directory.")
+    parser.add_argument('run_dir')
+    args = parser.parse_args()
+    calls = pd.read_json(os.path.join(args.run_dir, 'calls.jsonl'), lines=True)
+    print(json.dumps(summarize(records_frame(calls.to_dict('records'))), indent=2))
@@ -0,0 +1,85 @@
+# local_backend.py
+import logging
+import os
+import pandas as pd
+from fetcherv6 import fetch_company_data, set_database_url, STATEMENT_DATE_COLUMNS
+from snapshot_cache import SNAPSHOT_DIR
+
+# Tables an embedded backend holds, with the same names and columns as on Supabase
+LOCAL_TABLES = ['company', 'balance_sheet', 'income_statement', 'cash_flow']
+
+DEFAULT_LOCAL_DATABASE = os.path.join(SNAPSHOT_DIR, "finllm.db")
+
+
+def local_database_url(path):
+    """SQLAlchemy URL of an embedded database file: DuckDB for *.duckdb, SQLite otherwise."""
+    if path.endswith(".duckdb"):
+        return f"duckdb:///{os.path.abspath(path)}"
+    return f"sqlite:///{os.path.abspath(path)}"
+
+
+def export_company_table(source_dir=SNAPSHOT_DIR):
+    """Save the remote company table next to the statement snapshots."""
+    os.makedirs(source_dir, exist_ok=True)
+    path = os.path.join(source_dir, "company.parquet")
+    fetch_company_data().reset_index().to_parquet(path, index=False)
+    return path
+
+
+def _read_source(source_dir, table):
+    for extension, reader in (('.parquet', pd.read_parquet), ('.csv', pd.read_csv)):
+        path = os.path.join(source_dir, f"{table}{extension}")
+        if os.path.exists(path):
+            return reader(path)
+    return None
+
+
+def build_local_database(path=DEFAULT_LOCAL_DATABASE, source_dir=SNAPSHOT_DIR, tables=None):
+    """Load the company and statement tables from Parquet/CSV files into an embedded database.
+
+    Files are looked up as <source_dir>/<table>.parquet or .csv, so the statement
+    snapshots from snapshot_cache plus export_company_table() are enough. Each
+    table gets a (cvm_code, date) index for the per-company queries. Returns the
+    database URL.
+    """
+    from sqlalchemy import create_engine
+    url = local_database_url(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    engine = create_engine(url)
+    try:
+        with engine.begin() as conn:
+            for table in tables or LOCAL_TABLES:
+                df = _read_source(source_dir, table)
+                if df is None:
+                    logging.warning(f"No {table}.parquet or {table}.csv in {source_dir}; table not loaded.")
+                    continue
+                date_column = STATEMENT_DATE_COLUMNS.get(table)
+                if date_column:
+                    df[date_column] = pd.to_datetime(df[date_column])
+                df.to_sql(table, conn, if_exists='replace', index=False, chunksize=10000)
+                index_columns = f"cvm_code, {date_column}" if date_column else "cvm_code"
+                conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS idx_{table}_cvm_code ON {table} ({index_columns})")
+                logging.info(f"Loaded {len(df)} rows into local {table}.")
+    finally:
+        engine.dispose()
+    return url
+
+
+def use_local_backend(path=DEFAULT_LOCAL_DATABASE):
+    """Run fetch_data, and so every fetch_* function, against an embedded database file."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No local database at {path}; run build_local_database() first.")
+    set_database_url(local_database_url(path))
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Build an embedded copy of the Supabase tables.")
+    parser.add_argument('--path', default=DEFAULT_LOCAL_DATABASE, help="Database file (.db for SQLite, .duckdb for DuckDB)")
+    parser.add_argument('--source-dir', default=SNAPSHOT_DIR, help="Directory with <table>.parquet or .csv files")
+    parser.add_argument('--export-company', action='store_true', help="Download the company table first")
+    args = parser.parse_args()
+    if args.export_company:
+        export_company_table(args.source_dir)
+    print(build_local_database(args.path, args.source_dir))
@@ -0,0 +1,276 @@
+# pipeline_runner.py
+# Whole-universe earnings analysis as a pipeline: fetch -> render -> predict ->
+# score -> persist, each stage a pool of asyncio workers connected to the next
+# by a bounded queue. Slow LLM calls only fill the predict stage's queue, while
+# fetching and scoring keep running; per-stage throughput and queue depths are
+# reported as the run goes.
+import asyncio
+import json
+import logging
+import os
+import time
+import pandas as pd
+import evaluation
+import llm_dispatch
+import llm_telemetry
+import openaicall
+import sharding
+from anal.earn_anal import calculate_metrics, process_year
+from fetcherv6 import fetch_scope, get_company_name, net_income_direction
+
+COMPANY_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extended_company_data.csv")
+RUNS_DIR = os.getenv("FINLLM_RUNS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "runs"))
+
+# Items each queue holds before the stage feeding it waits
+QUEUE_SIZE = int(os.getenv("FINLLM_PIPELINE_QUEUE_SIZE", "16"))
+
+# Workers per stage; predict workers are companies in flight, whose windows
+# llm_dispatch bounds further
+STAGE_WORKERS = {
+    'fetch': int(os.getenv("FINLLM_PIPELINE_FETCH_WORKERS", "4")),
+    'render': 2,
+    'predict': int(os.getenv("FINLLM_PIPELINE_LLM_WORKERS", "8")),
+    'score': 2,
+    'persist': 1,
+}
+
+# Seconds between progress reports and between queue depth samples
+REPORT_INTERVAL = float(os.getenv("FINLLM_PIPELINE_REPORT_INTERVAL", "30"))
+SAMPLE_INTERVAL = 0.5
+
+_DONE = object()
+
+
+def select_companies(path=COMPANY_TABLE, min_years=None, sectors=None, cvm_codes=None, limit=None, shard=None,
+                     strategy='hash'):
+    """cvm_codes from the company table, optionally filtered by available_years, b3_sector and code.
+
+    With shard=(index, count) only that shard of the filtered companies is
+    returned (see sharding.shard_companies).
+    """
+    # The table repeats some companies (one row per listing); analyse each once
+    companies = pd.read_csv(path).drop_duplicates('cvm_code')
+    if min_years is not None:
+        companies = companies[companies['available_years'] >= min_years]
+    if sectors:
+        companies = companies[companies['b3_sector'].isin(sectors)]
+    if cvm_codes:
+        companies = companies[companies['cvm_code'].isin(cvm_codes)]
+    if limit is not None:
+        companies = companies.head(limit)
+    if shard is not None:
+        companies = sharding.shard_companies(companies, *shard, strategy=strategy)
+    return [int(code) for code in companies['cvm_code']]
+
+
+class Stage:
+    """`workers` tasks taking jobs from `inbox`, awaiting `func(job)` and putting the result on `outbox`.
+
+    A result of None drops the job. Errors are logged and counted; the job is
+    dropped and the pipeline carries on.
+    """
+
+    def __init__(self, name, func, workers, inbox, outbox=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.inbox = inbox
+        self.outbox = outbox
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.started = None
+        self.finished = None
+
+    async def _worker(self):
+        while True:
+            job = await self.inbox.get()
+            if job is _DONE:
+                # Let the sibling workers see the end of the input too
+                self.inbox.put_nowait(_DONE)
+                return
+            started = time.monotonic()
+            try:
+                result = await self.func(job)
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Stage {self.name} failed for cvm_code {job['cvm_code']}: {e}")
+                continue
+            finally:
+                self.busy_seconds += time.monotonic() - started
+            if result is None:
+                self.dropped += 1
+                continue
+            self.processed += 1
+            if self.outbox is not None:
+                await self.outbox.put(result)
+
+    async def run(self):
+        self.started = time.monotonic()
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
+        self.finished = time.monotonic()
+        if self.outbox is not None:
+            await self.outbox.put(_DONE)
+
+    def stats(self):
+        elapsed = ((self.finished or time.monotonic()) - self.started) if self.started else 0.0
+        return {
+            'workers': self.workers,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'seconds': round(elapsed, 3),
+            'per_second': round(self.processed / elapsed, 3) if elapsed else 0.0,
+            # Share of the workers' time spent working rather than waiting on their queues
+            'utilisation': round(self.busy_seconds / (elapsed * self.workers), 3) if elapsed else 0.0,
+        }
+
+
+@fetch_scope()
+def fetch_company(cvm_code):
+    """Prediction windows, actual earnings directions and name of a company, sharing its statement fetches."""
+    windows = openaicall.prediction_windows(cvm_code)
+    if isinstance(windows, dict):
+        logging.warning(f"Skipping cvm_code {cvm_code}: {windows['error']}")
+        return None
+    return {'cvm_code': cvm_code, 'name': get_company_name(cvm_code), 'windows': windows,
+            'actual': net_income_direction(cvm_code)}
+
+
+def score_company(job):
+    """The analyze_earnings rows of a company (with its cvm_code): predicted vs actual direction per year."""
+    rows = [process_year(row, job['name'], job['actual']) for _, row in job['predictions'].iterrows()]
+    df = pd.DataFrame([row for row in rows if row is not None])
+    if not df.empty:
+        df = calculate_metrics(df.sort_values('Year'))
+        # Trade names are not unique; merge_runs and evaluation key companies by cvm_code
+        df.insert(0, 'cvm_code', job['cvm_code'])
+    return df
+
+
+def save_company(scores, cvm_code, name, output_dir):
+    path = os.path.join(output_dir, f"{cvm_code}_{name.replace(' ', '_')}_earnings_analysis.csv")
+    scores.to_csv(path, index=False)
+    return path
+
+
+async def run_pipeline(cvm_codes, provider='openai', output_dir=None, queue_size=QUEUE_SIZE, workers=None,
+                       shard=None, companies=None):
+    """Analyse every company through the pipeline; return (all score rows, per-stage stats).
+
+    Each company's scores are written to <output_dir>/<cvm_code>_<name>_earnings_analysis.csv
+    as soon as they are ready, and added to the run's evaluation, written to
+    metrics.json at the end (sectors from the `companies` table). `shard`
+    (index, count) is recorded in the stats for sharding.merge_runs.
+    """
+    workers = dict(STAGE_WORKERS, **(workers or {}))
+    suffix = f"-shard-{shard[0]}-of-{shard[1]}" if shard else ""
+    output_dir = output_dir or os.path.join(RUNS_DIR, time.strftime('%Y%m%d-%H%M%S') + suffix)
+    os.makedirs(output_dir, exist_ok=True)
+    scored = []
+    evaluator = evaluation.Evaluator(companies)
+
+    async def fetch(job):
+        return await asyncio.to_thread(fetch_company, job['cvm_code'])
+
+    async def render(job):
+        job['requests'] = await asyncio.to_thread(openaicall.window_requests, job['windows'], provider)
+        return job
+
+    async def predict(job):
+        results = await openaicall.predict_requests(job['cvm_code'], job['windows'], job['requests'], provider)
+        job['predictions'] = openaicall.predictions_frame(results)
+        return job
+
+    async def score(job):
+        job['scores'] = await asyncio.to_thread(score_company, job)
+        return job
+
+    async def persist(job):
+        await asyncio.to_thread(save_company, job['scores'], job['cvm_code'], job['name'], output_dir)
+        scored.append(job['scores'])
+        if not job['scores'].empty:
+            evaluator.update(job['scores'])
+        return job
+
+    names = ['fetch', 'render', 'predict', 'score', 'persist']
+    funcs = [fetch, render, predict, score, persist]
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in names]
+    stages = [Stage(name, func, workers[name], queues[i], queues[i + 1] if i + 1 < len(queues) else None)
+              for i, (name, func) in enumerate(zip(names, funcs))]
+    depths = {name: [] for name in names}
+
+    async def feed():
+        for code in cvm_codes:
+            await queues[0].put({'cvm_code': int(code)})
+        await queues[0].put(_DONE)
+
+    async def monitor():
+        last_report = time.monotonic()
+        while True:
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            for name, queue in zip(names, queues):
+                depths[name].append(queue.qsize())
+            if time.monotonic() - last_report >= REPORT_INTERVAL:
+                last_report = time.monotonic()
+                logging.info("Pipeline: " + ", ".join(
+                    f"{stage.name} {stage.processed} done, {queue.qsize()}/{queue_size} queued"
+                    for stage, queue in zip(stages, queues)))
+
+    start = time.monotonic()
+    monitor_task = asyncio.create_task(monitor())
+    try:
+        await asyncio.gather(feed(), *(stage.run() for stage in stages))
+    finally:
+        monitor_task.cancel()
+
+    stats = {'companies': len(cvm_codes), 'seconds': round(time.monotonic() - start, 3), 'stages': {}}
+    if shard:
+        stats['shard'] = {'index': shard[0], 'count': shard[1]}
+    for name, stage in zip(names, stages):
+        samples = depths[name] or [0]
+        stats['stages'][name] = dict(stage.stats(), queue_max=max(samples),
+                                     queue_mean=round(sum(samples) / len(samples), 2))
+    results = pd.concat(scored, ignore_index=True) if scored else pd.DataFrame()
+    results.to_csv(os.path.join(output_dir, 'earnings_analysis.csv'), index=False)
+    with open(os.path.join(output_dir, 'pipeline_stats.json'), 'w') as f:
+        json.dump(stats, f, indent=2)
+    with open(os.path.join(output_dir, 'metrics.json'), 'w') as f:
+        json.dump(evaluation.report_json(evaluator.report()), f, indent=2)
+    llm_telemetry.telemetry.write_report(os.path.join(output_dir, 'telemetry'))
+    logging.info(f"Analysed {len(scored)} of {len(cvm_codes)} companies in {stats['seconds']:.1f} seconds; "
+                 f"results in {output_dir}")
+    return results, stats
+
+
+def analyze_universe(cvm_codes, provider='openai', output_dir=None, queue_size=QUEUE_SIZE, workers=None, shard=None,
+                     companies=None):
+    """Blocking wrapper around run_pipeline."""
+    return llm_dispatch.run(run_pipeline(cvm_codes, provider, output_dir, queue_size, workers, shard, companies))
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Run analyze_earnings for many companies as a pipeline.")
+    parser.add_argument('cvm_codes', nargs='*', type=int, help="Companies to analyse (default: the whole table)")
+    parser.add_argument('--companies', default=COMPANY_TABLE, help="Company table CSV")
+    parser.add_argument('--min-years', type=int, help="Only companies with at least this many available_years")
+    parser.add_argument('--sector', action='append', help="Only companies of this b3_sector (repeatable)")
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--provider', default='openai')
+    parser.add_argument('--output-dir')
+    parser.add_argument('--llm-workers', type=int, default=STAGE_WORKERS['predict'])
+    parser.add_argument('--shard', type=sharding.parse_shard, help="Run only shard i of N (e.g. 0/4); "
+                                                                    "merge the shard outputs with sharding.py")
+    parser.add_argument('--shard-strategy', choices=sharding.STRATEGIES, default='hash',
+                        help="hash: by cvm_code; balanced: even total available_years per shard")
+    args = parser.parse_args()
+
+    codes = select_companies(args.companies, args.min_years, args.sector, args.cvm_codes, args.limit, args.shard,
+                             args.shard_strategy)
+    _, run_stats = asyncio.run(run_pipeline(codes, args.provider, args.output_dir,
+                                            workers={'predict': args.llm_workers}, shard=args.shard,
+                                            companies=pd.read_csv(args.companies)))
+    print(json.dumps(run_stats, indent=2))
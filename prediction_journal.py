@@ -0,0 +1,119 @@
+# prediction_journal.py
+# Append-only journal of completed predictions, one JSON line per (cvm_code,
+# target year, model, mode), fsynced as each one completes. A run that dies
+# halfway keeps every prediction it paid for; with resume, the next run skips
+# them instead of asking the model again.
+import json
+import logging
+import os
+import threading
+import time
+import pandas as pd
+
+# Journal file; journaling is off when unset
+JOURNAL_PATH = os.getenv("FINLLM_JOURNAL")
+
+# Serve predictions already in the journal instead of requesting them again
+RESUME = os.getenv("FINLLM_RESUME", "1") == "1"
+
+
+class PredictionJournal:
+    """JSONL file of prediction entries; the last entry of a key wins."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+        self._torn = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @staticmethod
+    def key(cvm_code, year, model, mode):
+        return int(cvm_code), int(year), model, mode
+
+    def _load(self):
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line torn by a crash mid-write; its prediction is requested again
+                    logging.warning(f"Skipping unreadable line {number} of journal {self.path}")
+                    continue
+                entries[self.key(entry['cvm_code'], entry['year'], entry['model'], entry['mode'])] = entry
+        return entries
+
+    def entries(self):
+        """Every journaled entry by key, read from disk once."""
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            return dict(self._entries)
+
+    def append(self, cvm_code, year, model, mode, provider, prediction):
+        """Write one completed prediction and fsync it before returning."""
+        entry = {'cvm_code': int(cvm_code), 'year': int(year), 'model': model, 'mode': mode,
+                 'provider': provider, 'prediction': prediction, 'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            if self._torn is None:
+                # A previous run that died mid-write leaves a partial last line; start after it
+                self._torn = (os.path.exists(self.path) and os.path.getsize(self.path) > 0
+                              and not self._ends_with_newline())
+                line = ('\n' if self._torn else '') + line
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            if self._entries is not None:
+                self._entries[self.key(cvm_code, year, model, mode)] = entry
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def completed(self, cvm_code, model, mode):
+        """Journaled entries of one company, model and mode, keyed by target year."""
+        return {year: entry for (code, year, entry_model, entry_mode), entry in self.entries().items()
+                if code == int(cvm_code) and entry_model == model and entry_mode == mode}
+
+    def frame(self):
+        """One row per journaled prediction."""
+        rows = [{'cvm_code': entry['cvm_code'], 'year': entry['year'], 'model': entry['model'], 'mode': entry['mode'],
+                 'provider': entry['provider'], **entry['prediction']} for entry in self.entries().values()]
+        return pd.DataFrame(rows)
+
+
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal():
+    """The journal at JOURNAL_PATH, or None when FINLLM_JOURNAL is not set."""
+    if not JOURNAL_PATH:
+        return None
+    with _journals_lock:
+        if JOURNAL_PATH not in _journals:
+            _journals[JOURNAL_PATH] = PredictionJournal(JOURNAL_PATH)
+        return _journals[JOURNAL_PATH]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Summarise or export a prediction journal.")
+    parser.add_argument('path')
+    parser.add_argument('--csv', help="Write the journaled predictions to this CSV file")
+    args = parser.parse_args()
+    frame = PredictionJournal(args.path).frame()
+    if frame.empty:
+        print("The journal is empty.")
+    else:
+        print(frame.groupby(['model', 'mode']).agg(companies=('cvm_code', 'nunique'), predictions=('year', 'size')))
+        if args.csv:
+            frame.to_csv(args.csv, index=False)
@@ -0,0 +1,196 @@
+# prediction_parser.py
+# Schema of the earnings prediction object and a tolerant parser for model output:
+# it finds the first complete JSON object in a (possibly streamed) reply, repairs
+# the usual defects and validates the result against the schema.
+import json
+import re
+
+PREDICTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "Year": {"type": "integer", "description": "The predicted year"},
+        "earnings direction": {"type": "string", "enum": ["increase", "decrease"]},
+        "magnitude": {"type": "string", "enum": ["large", "moderate", "small"]},
+        "confidence score": {"type": "number", "description": "0 to 1"},
+        "summary of rationale": {"type": "string", "description": "Brief rationale for the prediction"},
+    },
+    "required": ["Year", "earnings direction", "magnitude", "confidence score", "summary of rationale"],
+    "additionalProperties": False,
+}
+
+# One prediction per target year, for a company's whole history in one request
+HISTORY_SCHEMA = {
+    "type": "object",
+    "properties": {"predictions": {"type": "array", "items": PREDICTION_SCHEMA}},
+    "required": ["predictions"],
+    "additionalProperties": False,
+}
+
+# OpenAI structured-output request parameters for the prediction objects
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "earnings_prediction", "strict": True, "schema": PREDICTION_SCHEMA},
+}
+HISTORY_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "earnings_predictions", "strict": True, "schema": HISTORY_SCHEMA},
+}
+
+
+class JSONObjectScanner:
+    """Incrementally scan text for the first complete top-level JSON object.
+
+    feed() returns True once the object's closing brace has been seen, so a
+    streamed reply can be abandoned at that point. Braces inside strings and
+    escaped quotes are handled; text before the object (prose, code fences) is
+    skipped.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.started = False
+        self.complete = False
+
+    def feed(self, text):
+        for char in text:
+            if self.complete:
+                break
+            if not self.started:
+                if char != '{':
+                    continue
+                self.started = True
+            self._parts.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    self.complete = True
+        return self.complete
+
+    @property
+    def text(self):
+        """The object text so far (complete or truncated)."""
+        return ''.join(self._parts)
+
+    def close_truncated(self):
+        """The text with an open string and open braces closed, for replies cut off mid-object."""
+        text = self.text
+        if self._in_string:
+            text += '"'
+        return text + '}' * max(self._depth, 0)
+
+
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+_SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'"})
+
+
+def repair_json(text):
+    """Fix defects models commonly produce: smart quotes, raw newlines in strings, trailing commas."""
+    text = text.translate(_SMART_QUOTES)
+    # Raw newlines are only legal between tokens; inside strings they break json.loads
+    repaired = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif char in '\r\n':
+                char = ' '
+        elif char == '"':
+            in_string = True
+        repaired.append(char)
+    return _TRAILING_COMMA.sub(r'\1', ''.join(repaired))
+
+
+def validate_prediction(obj):
+    """Normalise a decoded prediction; return (prediction, errors) where errors lists schema violations."""
+    if not isinstance(obj, dict):
+        return None, ["reply is not a JSON object"]
+    errors = [f"missing '{key}'" for key in PREDICTION_SCHEMA['required'] if key not in obj]
+    prediction = dict(obj)
+    for key in ('earnings direction', 'magnitude'):
+        if isinstance(prediction.get(key), str):
+            prediction[key] = prediction[key].strip().lower()
+            if prediction[key] not in PREDICTION_SCHEMA['properties'][key]['enum']:
+                errors.append(f"'{key}' must be one of {PREDICTION_SCHEMA['properties'][key]['enum']}")
+    if 'Year' in prediction:
+        try:
+            prediction['Year'] = int(str(prediction['Year']).strip())
+        except ValueError:
+            errors.append("'Year' must be an integer")
+    if 'confidence score' in prediction:
+        try:
+            prediction['confidence score'] = float(prediction['confidence score'])
+        except (TypeError, ValueError):
+            errors.append("'confidence score' must be a number between 0 and 1")
+    return prediction, errors
+
+
+def _decode(content):
+    """The first JSON object of a reply, repaired if needed: (obj, error)."""
+    scanner = JSONObjectScanner()
+    scanner.feed(content or '')
+    if not scanner.started:
+        return None, "reply contains no JSON object"
+    text = scanner.text if scanner.complete else scanner.close_truncated()
+    for candidate in (text, repair_json(text)):
+        try:
+            return json.loads(candidate), None
+        except json.JSONDecodeError as e:
+            error = f"invalid JSON: {e}"
+    return None, error
+
+
+def parse_prediction_text(content):
+    """Return (prediction, error) for a model reply; error is None when the reply is a valid prediction."""
+    obj, error = _decode(content)
+    if error is not None:
+        return None, error
+    prediction, errors = validate_prediction(obj)
+    return (prediction, None) if not errors else (prediction, "; ".join(errors))
+
+
+def parse_history_text(content, years):
+    """Return (predictions, error) for a reply with one prediction per target year.
+
+    predictions holds the valid entries for the requested years in year order,
+    even when others are invalid or missing; error is None only when every
+    year has a valid prediction.
+    """
+    obj, error = _decode(content)
+    if error is not None:
+        return [], error
+    items = obj.get('predictions') if isinstance(obj, dict) else None
+    if not isinstance(items, list):
+        return [], "missing 'predictions' list"
+    by_year = {}
+    errors = []
+    for item in items:
+        prediction, item_errors = validate_prediction(item)
+        if item_errors:
+            year = item.get('Year') if isinstance(item, dict) else None
+            errors.append(f"prediction for {year}: {'; '.join(item_errors)}")
+        elif prediction['Year'] in years:
+            by_year.setdefault(prediction['Year'], prediction)
+    missing = [year for year in years if year not in by_year]
+    if missing:
+        errors.append(f"no prediction for years {missing}")
+    predictions = [by_year[year] for year in years if year in by_year]
+    return predictions, "; ".join(errors) if errors else None
@@ -0,0 +1,71 @@
+# prompt_tokens.py
+# Measure how many tokens the prediction prompts cost, full vs compact rendering.
+import logging
+import re
+import pandas as pd
+from fetcherv6 import fetch_scope
+from openaicall import create_prompt, prediction_windows
+
+# Rough stand-in for the GPT tokenizers when tiktoken is not installed: words,
+# digits in groups of up to three, single punctuation marks and whitespace runs
+_APPROXIMATE_TOKEN = re.compile(r"[A-Za-z]+|\d{1,3}|\s+|[^\sA-Za-z\d]")
+
+_encodings = {}
+
+
+def _encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model]
+
+
+def count_tokens(text, model="gpt-4-turbo"):
+    """Tokens of `text` for the model's tokenizer; approximate when tiktoken is not installed."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(_APPROXIMATE_TOKEN.findall(text))
+    return len(encoding.encode(text))
+
+
+def compare_prompt_tokens(income_statement, balance_sheet, model="gpt-4-turbo"):
+    """Token counts of one window's prompt in full and compact rendering."""
+    full = count_tokens(create_prompt(income_statement, balance_sheet, compact=False), model)
+    compact = count_tokens(create_prompt(income_statement, balance_sheet, compact=True), model)
+    return {'full_tokens': full, 'compact_tokens': compact, 'saved': 1 - compact / full if full else 0.0}
+
+
+@fetch_scope()
+def measure_prompts(cvm_codes, model="gpt-4-turbo"):
+    """One row per (cvm_code, year) window with its full and compact prompt token counts."""
+    rows = []
+    for cvm_code in cvm_codes:
+        windows = prediction_windows(cvm_code)
+        if isinstance(windows, dict):
+            logging.warning(f"Skipping cvm_code {cvm_code}: {windows['error']}")
+            continue
+        for year, income, balance in windows:
+            rows.append({'cvm_code': cvm_code, 'year': int(year), **compare_prompt_tokens(income, balance, model)})
+    return pd.DataFrame(rows, columns=['cvm_code', 'year', 'full_tokens', 'compact_tokens', 'saved'])
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Report prompt tokens before and after compact rendering.")
+    parser.add_argument('cvm_codes', nargs='+', type=int)
+    parser.add_argument('--model', default="gpt-4-turbo")
+    args = parser.parse_args()
+    if _encoding(args.model) is None:
+        logging.warning("tiktoken is not installed; token counts are approximate")
+    report = measure_prompts(args.cvm_codes, args.model)
+    print(report.to_string(index=False))
+    if not report.empty:
+        print(f"\nMean tokens per prompt: {report['full_tokens'].mean():.0f} -> {report['compact_tokens'].mean():.0f} "
+              f"({report['saved'].mean():.0%} fewer)")
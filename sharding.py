@@ -0,0 +1,148 @@
+# sharding.py
+# Deterministic split of the company universe into N shards, so a pipeline run
+# can be spread over machines with no coordinator: each machine runs
+# `pipeline_runner.py --shard i/N` on the same company table, and merge_runs
+# combines the shard outputs into one result set and metrics report.
+import hashlib
+import heapq
+import json
+import logging
+import os
+import pandas as pd
+import evaluation
+import llm_telemetry
+
+STRATEGIES = ('hash', 'balanced')
+
+
+def parse_shard(value):
+    """(index, count) from "i/N" with 0 <= i < N."""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/N, got {value!r}") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard index must be in [0, {count}), got {value!r}")
+    return index, count
+
+
+def hash_shard(cvm_code, count):
+    # sha256 rather than hash(): the assignment must agree across processes and machines
+    digest = hashlib.sha256(str(int(cvm_code)).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def balanced_shards(weights, count):
+    """Shard of every cvm_code, spreading total weight evenly (heaviest first onto the lightest shard).
+
+    `weights` maps cvm_code to cost; ties are broken by cvm_code and shard
+    index, so every machine computes the same assignment from the same table.
+    """
+    loads = [(0.0, shard) for shard in range(count)]
+    assignment = {}
+    for cvm_code, weight in sorted(weights.items(), key=lambda item: (-item[1], item[0])):
+        load, shard = heapq.heappop(loads)
+        assignment[cvm_code] = shard
+        heapq.heappush(loads, (load + weight, shard))
+    return assignment
+
+
+def shard_companies(companies, index, count, strategy='hash'):
+    """The rows of the company table that belong to shard `index` of `count`.
+
+    'balanced' weighs each company by its available_years (at least 1), the
+    number of statement years and so, roughly, of prediction windows.
+    """
+    if strategy == 'hash':
+        mask = companies['cvm_code'].map(lambda code: hash_shard(code, count) == index)
+    elif strategy == 'balanced':
+        weights = dict(zip(companies['cvm_code'].astype(int), companies['available_years'].clip(lower=1)))
+        assignment = balanced_shards(weights, count)
+        mask = companies['cvm_code'].astype(int).map(assignment) == index
+    else:
+        raise ValueError(f"Unknown shard strategy {strategy!r}; expected one of {STRATEGIES}")
+    return companies[mask.astype(bool)]
+
+
+def _read_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def merge_runs(run_dirs, output_dir, companies=None):
+    """Combine the outputs of shard runs into `output_dir` and return the metrics report.
+
+    Writes earnings_analysis.csv (all rows), metrics.json (overall,
+    per-company and per-sector metrics from evaluation.py, shard coverage and
+    summed stage counts) and a telemetry report over every shard's LLM calls.
+    Companies are told apart by cvm_code (by name for outputs without it).
+    `companies` is the company table sectors are looked up in.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    frames = []
+    calls = []
+    shards = {}
+    stages = {}
+    for run_dir in run_dirs:
+        path = os.path.join(run_dir, 'earnings_analysis.csv')
+        if os.path.exists(path) and os.path.getsize(path) > 1:
+            frames.append(pd.read_csv(path))
+        stats = _read_json(os.path.join(run_dir, 'pipeline_stats.json')) or {}
+        if stats.get('shard'):
+            shards.setdefault(stats['shard']['count'], []).append(stats['shard']['index'])
+        for name, stage in stats.get('stages', {}).items():
+            totals = stages.setdefault(name, {'processed': 0, 'dropped': 0, 'errors': 0, 'seconds': 0.0})
+            for key in ('processed', 'dropped', 'errors'):
+                totals[key] += stage.get(key, 0)
+            totals['seconds'] = max(totals['seconds'], stage.get('seconds', 0.0))
+        calls_path = os.path.join(run_dir, 'telemetry', 'calls.jsonl')
+        if os.path.exists(calls_path) and os.path.getsize(calls_path) > 0:
+            calls.append(pd.read_json(calls_path, lines=True))
+
+    results = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+        columns=['cvm_code', 'Company Name', 'Year', 'Actual Earnings Direction', 'Predicted Earnings Direction'])
+    key = evaluation.company_key(results)
+    duplicated = results.duplicated([key, 'Year'], keep='last')
+    if duplicated.any():
+        logging.warning(f"Dropping {int(duplicated.sum())} rows found in more than one shard")
+        results = results[~duplicated]
+    results = results.sort_values([key, 'Year'], kind='stable').reset_index(drop=True)
+    results.to_csv(os.path.join(output_dir, 'earnings_analysis.csv'), index=False)
+
+    if len(shards) > 1:
+        logging.warning(f"Merging runs sharded into different counts: {sorted(shards)}")
+    missing = {count: sorted(set(range(count)) - set(indexes)) for count, indexes in shards.items()}
+    metrics = evaluation.report_json(evaluation.evaluate(results, companies))
+    report = {
+        'runs': len(run_dirs),
+        'missing_shards': {str(count): indexes for count, indexes in missing.items() if indexes},
+        'companies': int(results[key].nunique()),
+        'overall': metrics['overall'],
+        'by_company': metrics['by_company'],
+        'by_sector': metrics['by_sector'],
+        'calibration': metrics['calibration'],
+        'stages': stages,
+    }
+    for count, indexes in report['missing_shards'].items():
+        logging.warning(f"Shards {indexes} of {count} are missing from the merge")
+    with open(os.path.join(output_dir, 'metrics.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    records = pd.concat(calls, ignore_index=True).to_dict('records') if calls else []
+    llm_telemetry.write_report(llm_telemetry.records_frame(records), os.path.join(output_dir, 'telemetry'))
+    logging.info(f"Merged {len(run_dirs)} runs ({len(results)} rows) into {output_dir}")
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Merge the outputs of sharded pipeline runs.")
+    parser.add_argument('run_dirs', nargs='+')
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--companies', help="Company table for per-sector metrics (e.g. extended_company_data.csv)")
+    args = parser.parse_args()
+    company_table = pd.read_csv(args.companies) if args.companies else None
+    print(json.dumps(merge_runs(args.run_dirs, args.output_dir, company_table)['overall'], indent=2))
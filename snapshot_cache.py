@@ -0,0 +1,208 @@
+# snapshot_cache.py
+import pandas as pd
+import numpy as np
+import logging
+import json
+import os
+import time
+from fetcherv6 import fetch_data, fetch_data_chunks, STATEMENT_DATE_COLUMNS
+
+# Local columnar snapshots of the statement tables
+SNAPSHOT_DIR = os.getenv("FINLLM_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots"))
+
+# High-water mark column of each statement table
+STATEMENT_TABLES = STATEMENT_DATE_COLUMNS
+
+# Filings for past periods keep arriving (late filers, DFP after ITR), so each
+# incremental refresh re-reads this many days below the high-water mark.
+LOOKBACK_DAYS = int(os.getenv("FINLLM_SNAPSHOT_LOOKBACK_DAYS", "180"))
+
+# In-process copies of the snapshots, keyed by table and invalidated by file mtime
+_loaded = {}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise ImportError("Snapshot cache requires pyarrow: pip install pyarrow") from e
+
+
+def snapshot_path(table):
+    return os.path.join(SNAPSHOT_DIR, f"{table}.parquet")
+
+
+def _metadata_path(table):
+    return os.path.join(SNAPSHOT_DIR, f"{table}.json")
+
+
+def _check_table(table):
+    if table not in STATEMENT_TABLES:
+        raise ValueError(f"Unknown statement table: {table}")
+    return STATEMENT_TABLES[table]
+
+
+def read_metadata(table):
+    """Return the high-water mark and refresh info stored next to a snapshot."""
+    path = _metadata_path(table)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_metadata(table, high_water_mark, rows):
+    metadata = {
+        'table': table,
+        'high_water_mark': high_water_mark,
+        'rows': rows,
+        'refreshed_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(f"{_metadata_path(table)}.tmp", 'w') as f:
+        json.dump(metadata, f)
+    os.replace(f"{_metadata_path(table)}.tmp", _metadata_path(table))
+    _loaded.pop(table, None)
+    return metadata
+
+
+def _write_snapshot(table, df, high_water_mark):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path(table)
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return _write_metadata(table, high_water_mark, len(df))
+
+
+def _stream_full_snapshot(table, date_column):
+    """Write the whole table to Parquet chunk by chunk through a server-side cursor."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    query = f"""
+        SELECT *
+        FROM {table}
+        ORDER BY cvm_code ASC, {date_column} ASC
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path(table)
+    tmp_path = f"{path}.tmp"
+    writer = None
+    rows = 0
+    high_water_mark = None
+    try:
+        for chunk in fetch_data_chunks(query):
+            chunk[date_column] = pd.to_datetime(chunk[date_column])
+            if writer is None:
+                # Columns that are all NULL in the first chunk get a numeric type
+                schema = pa.Table.from_pandas(chunk, preserve_index=False).schema
+                schema = pa.schema([field.with_type(pa.float64()) if pa.types.is_null(field.type) else field
+                                    for field in schema])
+                writer = pq.ParquetWriter(tmp_path, schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+            chunk_max = chunk[date_column].max()
+            high_water_mark = chunk_max if high_water_mark is None else max(high_water_mark, chunk_max)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        logging.warning(f"No rows fetched for {table}; snapshot not written.")
+        return {}
+    os.replace(tmp_path, path)
+    return _write_metadata(table, high_water_mark.strftime('%Y-%m-%d'), rows)
+
+
+def refresh_snapshot(table, force=False):
+    """Bring the local snapshot of a statement table up to date.
+
+    Only rows at or past the stored high-water mark (minus LOOKBACK_DAYS) are
+    downloaded; force=True discards the snapshot and streams the whole table
+    into a new one in bounded memory. Returns the snapshot metadata.
+    """
+    _require_pyarrow()
+    date_column = _check_table(table)
+    high_water_mark = None
+    if not force and os.path.exists(snapshot_path(table)):
+        high_water_mark = read_metadata(table).get('high_water_mark')
+
+    if high_water_mark is None:
+        metadata = _stream_full_snapshot(table, date_column)
+        if metadata:
+            logging.info(f"Snapshot of {table} rebuilt: {metadata['rows']} rows stored, "
+                         f"high-water mark {metadata['high_water_mark']}")
+        return metadata
+
+    since = (pd.Timestamp(high_water_mark) - pd.Timedelta(days=LOOKBACK_DAYS)).date()
+    query = f"""
+        SELECT *
+        FROM {table}
+        WHERE {date_column} >= :since
+        ORDER BY cvm_code ASC, {date_column} ASC
+    """
+    new_rows = fetch_data(query, {'since': since})
+    combined = pd.read_parquet(snapshot_path(table))
+    if not new_rows.empty:
+        new_rows[date_column] = pd.to_datetime(new_rows[date_column])
+        combined = pd.concat([combined, new_rows], ignore_index=True)
+    key_columns = [col for col in ('cvm_code', 'statement_type', date_column) if col in combined.columns]
+    combined = combined.drop_duplicates(subset=key_columns, keep='last')
+    combined = combined.sort_values(['cvm_code', date_column], kind='stable').reset_index(drop=True)
+
+    high_water_mark = combined[date_column].max().strftime('%Y-%m-%d')
+    metadata = _write_snapshot(table, combined, high_water_mark)
+    logging.info(f"Snapshot of {table} refreshed: {len(new_rows)} rows fetched, {len(combined)} rows stored, "
+                 f"high-water mark {high_water_mark}")
+    return metadata
+
+
+def refresh_snapshots(force=False):
+    """Refresh the snapshots of all statement tables."""
+    return {table: refresh_snapshot(table, force=force) for table in STATEMENT_TABLES}
+
+
+def _load_table(table):
+    path = snapshot_path(table)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No snapshot for {table} at {path}; run refresh_snapshot('{table}') first.")
+    mtime = os.path.getmtime(path)
+    cached = _loaded.get(table)
+    if cached is None or cached[0] != mtime:
+        _require_pyarrow()
+        df = pd.read_parquet(path)
+        cached = (mtime, df, df['cvm_code'].to_numpy())
+        _loaded[table] = cached
+    return cached[1], cached[2]
+
+
+def load_snapshot(table, cvm_codes=None):
+    """Return the snapshot rows of a statement table, optionally only for some cvm_codes.
+
+    Rows are stored sorted by cvm_code, so each company is a contiguous slice.
+    """
+    date_column = _check_table(table)
+    df, codes = _load_table(table)
+    if cvm_codes is None:
+        return df.copy()
+    slices = []
+    for code in dict.fromkeys(int(c) for c in cvm_codes):
+        start, stop = np.searchsorted(codes, [code, code + 1])
+        if stop > start:
+            slices.append(df.iloc[start:stop])
+    if not slices:
+        return pd.DataFrame(columns=df.columns)
+    rows = pd.concat(slices, ignore_index=True)
+    rows[date_column] = pd.to_datetime(rows[date_column])
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Refresh the local statement snapshots.")
+    parser.add_argument('--force', action='store_true', help="Discard existing snapshots and reload every table")
+    parser.add_argument('--table', choices=sorted(STATEMENT_TABLES), help="Refresh a single table")
+    args = parser.parse_args()
+    if args.table:
+        refresh_snapshot(args.table, force=args.force)
+    else:
+        refresh_snapshots(force=args.force)
@@ -0,0 +1,104 @@
+# statement_schema.py
+# Registry of the accounts each statement table is expected to expose and the subsets some
+# consumers read. Queries given accounts (or all registered ones with FINLLM_PROJECT_COLUMNS=1)
+# project those that exist in the live table, in table order; others select every column.
+
+# Columns every statement query keeps besides the accounts
+KEY_COLUMNS = {
+    'balance_sheet': ['cvm_code', 'reference_date'],
+    'income_statement': ['cvm_code', 'period_end'],
+    'cash_flow': ['cvm_code', 'period_end'],
+}
+
+STATEMENT_ACCOUNTS = {
+    'balance_sheet': [
+        'assets',
+        'current_assets',
+        'cash',
+        'receivables',
+        'inventory',
+        'noncurrent_assets',
+        'fixed_assets',
+        'intangible_assets',
+        'liabilities',
+        'current_liabilities',
+        'short_term_loans',
+        'noncurrent_liabilities',
+        'long_term_loans',
+        'equity',
+    ],
+    'income_statement': [
+        'net_sales',
+        'costs',
+        'gross_income',
+        'operating_expenses',
+        'ebit',
+        'financial_result',
+        'non_operating_income',
+        'income_before_taxes',
+        'taxes',
+        'net_income',
+    ],
+    'cash_flow': [
+        'operating_cash_flow',
+        'investing_cash_flow',
+        'financing_cash_flow',
+        'capex',
+        'dividends_paid',
+        'net_cash_flow',
+    ],
+}
+
+# The full prompt and net_income_direction read every column of the live table
+# (the latter by position), so they are not registered here and fetch unprojected.
+CONSUMER_ACCOUNTS = {
+    # openaicall.render_statement keeps only the accounts that drive the prediction
+    'compact_prompt': {
+        'balance_sheet': ['assets', 'current_assets', 'cash', 'liabilities', 'current_liabilities',
+                          'short_term_loans', 'long_term_loans', 'equity'],
+        'income_statement': ['net_sales', 'gross_income', 'ebit', 'financial_result', 'income_before_taxes',
+                             'net_income'],
+    },
+    # The 'check' row added by fetch_balance_sheet
+    'balance_check': {
+        'balance_sheet': ['assets', 'liabilities'],
+    },
+}
+
+# Accounts a statement's shaping step needs whatever the consumer asks for
+REQUIRED_ACCOUNTS = {
+    'balance_sheet': CONSUMER_ACCOUNTS['balance_check']['balance_sheet'],
+}
+
+
+def accounts_for(table, consumers=None):
+    """Return the accounts of a statement needed by the given consumers, in registry order.
+
+    consumers=None means every registered account of the statement.
+    """
+    if table not in STATEMENT_ACCOUNTS:
+        raise ValueError(f"Unknown statement table: {table}")
+    if consumers is None:
+        wanted = set(STATEMENT_ACCOUNTS[table])
+    else:
+        if isinstance(consumers, str):
+            consumers = [consumers]
+        unknown = [consumer for consumer in consumers if consumer not in CONSUMER_ACCOUNTS]
+        if unknown:
+            raise ValueError(f"Unknown consumers: {unknown}")
+        wanted = {account for consumer in consumers for account in CONSUMER_ACCOUNTS[consumer].get(table, [])}
+    wanted.update(REQUIRED_ACCOUNTS.get(table, []))
+    return [account for account in STATEMENT_ACCOUNTS[table] if account in wanted]
+
+
+def project(table, table_columns, accounts):
+    """Return the key columns plus the requested accounts present in the table, in table order.
+
+    Returns None when none of the accounts exist, so the caller can fall back to SELECT *.
+    """
+    wanted = set(accounts)
+    selected = [col for col in table_columns if col in wanted]
+    if not selected:
+        return None
+    keys = [col for col in KEY_COLUMNS[table] if col in table_columns]
+    return keys + selected
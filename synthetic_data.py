@@ -0,0 +1,212 @@
+# synthetic_data.py
+# Deterministic synthetic company and statement tables with the Supabase layout,
+# for benchmarks and scale tests. The same arguments always give the same frames.
+import logging
+import os
+import numpy as np
+import pandas as pd
+from fetcherv6 import STATEMENT_DATE_COLUMNS
+from statement_schema import STATEMENT_ACCOUNTS
+
+SECTORS = {
+    'Bens Industriais': ['Máquinas e Equipamentos', 'Transporte'],
+    'Consumo Cíclico': ['Comércio', 'Tecidos, Vestuário e Calçados'],
+    'Consumo não Cíclico': ['Alimentos Processados', 'Bebidas'],
+    'Financeiro': ['Intermediários Financeiros', 'Previdência e Seguros'],
+    'Materiais Básicos': ['Mineração', 'Siderurgia e Metalurgia'],
+    'Petróleo, Gás e Biocombustíveis': ['Petróleo, Gás e Biocombustíveis'],
+    'Saúde': ['Serv.Méd.Hospit..Análises e Diagnósticos'],
+    'Tecnologia da Informação': ['Programas e Serviços'],
+    'Utilidade Pública': ['Energia Elétrica', 'Água e Saneamento'],
+}
+
+FREQUENCIES = {'annual': 1, 'quarterly': 4}
+
+
+def _periods(rng, n_companies, n_years, end_year, frequency, ragged):
+    """One row per company and period end, with each company listed from its own first year."""
+    per_year = FREQUENCIES[frequency]
+    first_year = end_year - n_years + 1
+    offsets = rng.integers(0, max(n_years // 2, 1), n_companies) if ragged else np.zeros(n_companies, dtype=int)
+    start_years = first_year + offsets
+    month_ends = pd.date_range(f"{first_year}-01-01", f"{end_year}-12-31", freq='QE' if per_year == 4 else 'YE')
+    codes = np.repeat(np.arange(n_companies), len(month_ends))
+    dates = np.tile(month_ends.values, n_companies)
+    keep = pd.DatetimeIndex(dates).year >= np.repeat(start_years, len(month_ends))
+    return codes[keep], pd.DatetimeIndex(dates[keep])
+
+
+def generate_company_table(n_companies, seed=0):
+    """company table with cvm_code, names, issuer code, B3 sector and segment."""
+    rng = np.random.default_rng(seed)
+    cvm_codes = 1000 + np.arange(n_companies) * 7
+    sectors = list(SECTORS)
+    sector_pos = rng.integers(0, len(sectors), n_companies)
+    letters = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    issuer_codes = [''.join(letters[rng.integers(0, 26, 4)]) for _ in range(n_companies)]
+    rows = []
+    for i, code in enumerate(cvm_codes):
+        sector = sectors[sector_pos[i]]
+        segments = SECTORS[sector]
+        rows.append({
+            'cvm_code': int(code),
+            'trade_name': f"Companhia Sintética {i}",
+            'b3_trade_name': f"SINTETICA{i}",
+            'b3_issuer_code': issuer_codes[i],
+            'b3_segment': segments[i % len(segments)],
+            'b3_sector': sector,
+            'available_years': 0,
+        })
+    return pd.DataFrame(rows)
+
+
+def _balance_sheet(rng, cvm_codes, codes, dates, scale, growth):
+    n = len(codes)
+    assets = scale[codes] * growth * rng.lognormal(0, 0.05, n)
+    current = assets * rng.uniform(0.25, 0.55, n)
+    cash = current * rng.uniform(0.1, 0.4, n)
+    receivables = current * rng.uniform(0.2, 0.4, n)
+    noncurrent = assets - current
+    fixed = noncurrent * rng.uniform(0.4, 0.8, n)
+    current_liabilities = assets * rng.uniform(0.15, 0.35, n)
+    noncurrent_liabilities = assets * rng.uniform(0.15, 0.35, n)
+    liabilities = current_liabilities + noncurrent_liabilities
+    accounts = {
+        'assets': assets,
+        'current_assets': current,
+        'cash': cash,
+        'receivables': receivables,
+        'inventory': current - cash - receivables,
+        'noncurrent_assets': noncurrent,
+        'fixed_assets': fixed,
+        'intangible_assets': noncurrent - fixed,
+        'liabilities': liabilities,
+        'current_liabilities': current_liabilities,
+        'short_term_loans': current_liabilities * rng.uniform(0.2, 0.5, n),
+        'noncurrent_liabilities': noncurrent_liabilities,
+        'long_term_loans': noncurrent_liabilities * rng.uniform(0.4, 0.8, n),
+        'equity': assets - liabilities,
+    }
+    return _statement_frame('balance_sheet', cvm_codes[codes], dates, accounts)
+
+
+def _income_statement(rng, cvm_codes, codes, dates, scale, growth, per_year):
+    n = len(codes)
+    net_sales = scale[codes] * growth * rng.lognormal(-0.3, 0.15, n) / per_year
+    costs = -net_sales * rng.uniform(0.5, 0.8, n)
+    gross_income = net_sales + costs
+    operating_expenses = -net_sales * rng.uniform(0.05, 0.2, n)
+    ebit = gross_income + operating_expenses
+    financial_result = -net_sales * rng.normal(0.03, 0.04, n)
+    non_operating_income = net_sales * rng.normal(0, 0.01, n)
+    income_before_taxes = ebit + financial_result + non_operating_income
+    taxes = -np.maximum(income_before_taxes, 0) * 0.34
+    accounts = {
+        'net_sales': net_sales,
+        'costs': costs,
+        'gross_income': gross_income,
+        'operating_expenses': operating_expenses,
+        'ebit': ebit,
+        'financial_result': financial_result,
+        'non_operating_income': non_operating_income,
+        'income_before_taxes': income_before_taxes,
+        'taxes': taxes,
+        'net_income': income_before_taxes + taxes,
+    }
+    return _statement_frame('income_statement', cvm_codes[codes], dates, accounts)
+
+
+def _cash_flow(rng, cvm_codes, codes, dates, scale, growth, per_year):
+    n = len(codes)
+    size = scale[codes] * growth / per_year
+    operating = size * rng.normal(0.08, 0.05, n)
+    capex = -size * rng.uniform(0.02, 0.08, n)
+    investing = capex - size * rng.uniform(0, 0.02, n)
+    dividends_paid = -np.maximum(operating, 0) * rng.uniform(0, 0.4, n)
+    financing = dividends_paid + size * rng.normal(0, 0.03, n)
+    accounts = {
+        'operating_cash_flow': operating,
+        'investing_cash_flow': investing,
+        'financing_cash_flow': financing,
+        'capex': capex,
+        'dividends_paid': dividends_paid,
+        'net_cash_flow': operating + investing + financing,
+    }
+    return _statement_frame('cash_flow', cvm_codes[codes], dates, accounts)
+
+
+def _statement_frame(table, cvm_codes, dates, accounts):
+    df = pd.DataFrame({'cvm_code': cvm_codes, 'statement_type': 'con', STATEMENT_DATE_COLUMNS[table]: dates})
+    for account in STATEMENT_ACCOUNTS[table]:
+        df[account] = np.round(accounts[account], 2)
+    return df
+
+
+def generate_dataset(n_companies=100, n_years=10, frequency='quarterly', end_year=2023, ragged=True, seed=0):
+    """Return {'company': ..., 'balance_sheet': ..., 'income_statement': ..., 'cash_flow': ...}.
+
+    Each company has a log-normal size and a yearly growth path; accounts add up
+    (assets = current + noncurrent, net_income = income_before_taxes + taxes, ...).
+    With ragged=True companies list in different years, so histories differ in length.
+    Rows are sorted by cvm_code and date, like the server's ORDER BY.
+    """
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Unknown frequency: {frequency}")
+    rng = np.random.default_rng(seed)
+    company = generate_company_table(n_companies, seed)
+    cvm_codes = company['cvm_code'].to_numpy()
+    codes, dates = _periods(rng, n_companies, n_years, end_year, frequency, ragged)
+
+    scale = rng.lognormal(20, 1.5, n_companies)
+    yearly_growth = rng.normal(0.06, 0.04, n_companies)
+    years_elapsed = (dates.year - (end_year - n_years + 1)).to_numpy() + (dates.month.to_numpy() / 12)
+    growth = np.exp(yearly_growth[codes] * years_elapsed)
+
+    per_year = FREQUENCIES[frequency]
+    dataset = {
+        'company': company,
+        'balance_sheet': _balance_sheet(rng, cvm_codes, codes, dates, scale, growth),
+        'income_statement': _income_statement(rng, cvm_codes, codes, dates, scale, growth, per_year),
+        'cash_flow': _cash_flow(rng, cvm_codes, codes, dates, scale, growth, per_year),
+    }
+    company['available_years'] = (
+        dataset['balance_sheet'].groupby('cvm_code')['reference_date'].agg(lambda d: d.dt.year.nunique())
+        .reindex(cvm_codes, fill_value=0).to_numpy()
+    )
+    return dataset
+
+
+def write_dataset(dataset, directory, file_format='parquet'):
+    """Write each table as <directory>/<table>.parquet (or .csv), the layout local_backend reads."""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for table, df in dataset.items():
+        path = os.path.join(directory, f"{table}.{file_format}")
+        if file_format == 'parquet':
+            df.to_parquet(path, index=False)
+        elif file_format == 'csv':
+            df.to_csv(path, index=False)
+        else:
+            raise ValueError(f"Unknown file format: {file_format}")
+        paths[table] = path
+        logging.info(f"Wrote {len(df)} synthetic rows to {path}")
+    return paths
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Generate synthetic company and statement tables.")
+    parser.add_argument('--companies', type=int, default=5000)
+    parser.add_argument('--years', type=int, default=20)
+    parser.add_argument('--frequency', choices=sorted(FREQUENCIES), default='quarterly')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='synthetic', help="Output directory")
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='parquet')
+    parser.add_argument('--db', help="Also build an embedded database at this path (.db or .duckdb)")
+    args = parser.parse_args()
+    dataset = generate_dataset(args.companies, args.years, args.frequency, seed=args.seed)
+    write_dataset(dataset, args.out, args.format)
+    if args.db:
+        from local_backend import build_local_database
+        print(build_local_database(args.db, args.out))
@@ -0,0 +1,121 @@
+import asyncio
+import contextvars
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import pandas as pd
+
+import async_fetcher
+import fetcherv6
+
+
+def statement_rows(query, cvm_code):
+    if 'FROM balance_sheet' in query:
+        return pd.DataFrame({
+            'cvm_code': [cvm_code, cvm_code],
+            'reference_date': ['2020-12-31', '2021-12-31'],
+            'assets': [10.0, 12.0],
+            'liabilities': [5.0, 6.0],
+        })
+    return income_rows(cvm_code)
+
+
+def income_rows(cvm_code):
+    return pd.DataFrame({
+        'cvm_code': [cvm_code, cvm_code],
+        'period_end': ['2020-12-31', '2021-12-31'],
+        'net_income': [1.0, 2.0],
+    })
+
+
+class TestAsyncFetcher(unittest.TestCase):
+    @patch('async_fetcher.async_driver_available', return_value=False)
+    @patch('async_fetcher.MAX_IN_FLIGHT', 3)
+    def test_sync_fallback_is_bounded(self, _mock_driver):
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def slow_fetch(query, params):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.02)
+            with lock:
+                state['running'] -= 1
+            return statement_rows(query, params['cvm_code'])
+
+        with patch('async_fetcher.fetch_data', side_effect=slow_fetch):
+            financials = async_fetcher.fetch_many_financials([1, 2, 3, 4])
+
+        self.assertEqual(sorted(financials), [1, 2, 3, 4])
+        self.assertLessEqual(state['peak'], 3)
+        balance_sheet, income_statement, cash_flow = financials[2]
+        self.assertEqual(income_statement.loc['net_income', 2021], 2.0)
+        self.assertEqual(balance_sheet.loc['check', 2021], 6.0)
+
+    @patch('async_fetcher.async_driver_available', return_value=False)
+    def test_timeout_returns_empty_frame(self, _mock_driver):
+        def hanging_fetch(query, params):
+            time.sleep(0.2)
+            return income_rows(1)
+
+        with patch('async_fetcher.fetch_data', side_effect=hanging_fetch), self.assertLogs(level='ERROR'):
+            df = asyncio.run(async_fetcher.fetch_data_async("SELECT 1", {'cvm_code': 1}, timeout=0.01))
+        self.assertTrue(df.empty)
+
+    @patch('async_fetcher.async_driver_available', return_value=False)
+    @patch('async_fetcher.MAX_IN_FLIGHT', 1)
+    def test_timed_out_worker_keeps_its_slot_until_it_ends(self, _mock_driver):
+        finished = threading.Event()
+
+        def hanging_fetch(query, params):
+            time.sleep(0.2)
+            finished.set()
+            return income_rows(1)
+
+        def quick_fetch(query, params):
+            # The slot is free only once the timed-out query has ended
+            self.assertTrue(finished.is_set())
+            return income_rows(2)
+
+        async def run():
+            with patch('async_fetcher.fetch_data', side_effect=hanging_fetch):
+                timed_out = await async_fetcher.fetch_data_async("SELECT 1", {'cvm_code': 1}, timeout=0.01)
+            with patch('async_fetcher.fetch_data', side_effect=quick_fetch):
+                return timed_out, await async_fetcher.fetch_data_async("SELECT 2", {'cvm_code': 2})
+
+        with self.assertLogs(level='ERROR'):
+            timed_out, df = asyncio.run(run())
+        self.assertTrue(timed_out.empty)
+        self.assertEqual(df['cvm_code'].tolist(), [2, 2])
+
+    @patch('async_fetcher.async_driver_available', return_value=False)
+    def test_async_fetches_match_sync_and_share_the_scope(self, _mock_driver):
+        def fetch(query, params):
+            return income_rows(params['cvm_code']) if 'FROM income_statement' in query else pd.DataFrame()
+
+        async def run():
+            with fetcherv6.fetch_scope() as scope:
+                first, second = await asyncio.gather(async_fetcher.fetch_income_statement_async(1),
+                                                     async_fetcher.fetch_income_statement_async(1))
+                sync = await asyncio.to_thread(contextvars.copy_context().run, fetcherv6.fetch_income_statement, 1)
+            return scope, first, second, sync
+
+        with patch('async_fetcher.fetch_data', side_effect=fetch) as mock_async_fetch, \
+                patch('fetcherv6.fetch_data', side_effect=fetch) as mock_sync_fetch, \
+                patch('fetcherv6.get_numeric_columns', return_value=['net_income']):
+            scope, first, second, sync = asyncio.run(run())
+            with patch('fetcherv6.AGGREGATE_IN_DB', True):
+                asyncio.run(async_fetcher.fetch_income_statement_async(1))
+            self.assertIn('GROUP BY', mock_async_fetch.call_args[0][0])
+
+        self.assertEqual(mock_async_fetch.call_count, 2)
+        mock_sync_fetch.assert_not_called()
+        self.assertEqual((scope.misses, scope.hits), (1, 2))
+        pd.testing.assert_frame_equal(first, sync)
+        pd.testing.assert_frame_equal(second, sync)
+
+
+if __name__ == '__main__':
+    unittest.main()
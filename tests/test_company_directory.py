@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import pandas as pd
+
+from company_directory import CompanyDirectory
+
+
+def company_table():
+    return pd.DataFrame({
+        'cvm_code': [23264, 22470, 19615],
+        'trade_name': ['Ambev', 'Magazine Luiza', 'JSL'],
+        'b3_issuer_code': ['ABEV', 'MGLU', 'JSLG'],
+        'b3_sector': ['Consumo não Cíclico', 'Consumo Cíclico', 'Bens Industriais'],
+    }).set_index('cvm_code')
+
+
+class TestCompanyDirectory(unittest.TestCase):
+    def test_lookups_load_table_once(self):
+        loader = MagicMock(return_value=company_table())
+        directory = CompanyDirectory(loader=loader)
+        self.assertEqual(directory.name('23264'), 'Ambev')
+        self.assertEqual(directory.cvm_code_for_issuer('mglu'), 22470)
+        self.assertEqual(directory.sector('Bens Industriais'), [19615])
+        self.assertEqual(directory.get(19615)['b3_issuer_code'], 'JSLG')
+        self.assertIsNone(directory.get(1))
+        self.assertEqual(loader.call_count, 1)
+
+    def test_unknown_company_raises_key_error(self):
+        directory = CompanyDirectory(loader=MagicMock(return_value=company_table()))
+        with self.assertRaises(KeyError):
+            directory.name(1)
+
+    def test_ttl_and_invalidate_reload(self):
+        loader = MagicMock(return_value=company_table())
+        directory = CompanyDirectory(loader=loader, ttl=60)
+        clock = {'now': 0}
+        with patch('company_directory.time.monotonic', side_effect=lambda: clock['now']):
+            directory.name(23264)
+            clock['now'] = 10
+            directory.name(23264)
+            clock['now'] = 100
+            directory.name(23264)
+        self.assertEqual(loader.call_count, 2)
+        directory.invalidate()
+        directory.name(23264)
+        self.assertEqual(loader.call_count, 3)
+
+    def test_get_company_name_uses_shared_directory(self):
+        import fetcherv6
+        with patch('company_directory.directory', CompanyDirectory(loader=MagicMock(return_value=company_table()))):
+            self.assertEqual(fetcherv6.get_company_name(22470), 'Magazine Luiza')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import evaluation
+
+
+def predictions(name, directions, confidences=None, start=2010):
+    df = pd.DataFrame(directions, columns=['Actual Earnings Direction', 'Predicted Earnings Direction'])
+    df.insert(0, 'Year', range(start, start + len(df)))
+    df.insert(0, 'Company Name', name)
+    if confidences is not None:
+        df['Confidence Score'] = confidences
+    return df
+
+
+def legacy_metrics(df, window=None):
+    """The per-company pandas expanding/rolling computation evaluation.running_metrics replaces."""
+    df = df.copy()
+    actual, predicted = df['Actual Earnings Direction'], df['Predicted Earnings Direction']
+    correct = actual == predicted
+    tp = ((actual == 'increase') & (predicted == 'increase')).astype(int)
+    fp = ((actual == 'decrease') & (predicted == 'increase')).astype(int)
+    fn = ((actual == 'increase') & (predicted == 'decrease')).astype(int)
+    running = (lambda s: s.expanding()) if window is None else (lambda s: s.rolling(window=window, min_periods=1))
+    label = 'Cumulative' if window is None else 'Rolling'
+    df[f'{label} Accuracy'] = running(correct).mean()
+    df[f'{label} Precision'] = running(tp).sum() / (running(tp).sum() + running(fp).sum())
+    df[f'{label} Recall'] = running(tp).sum() / (running(tp).sum() + running(fn).sum())
+    df[f'{label} F1-Score'] = (2 * df[f'{label} Precision'] * df[f'{label} Recall']
+                               / (df[f'{label} Precision'] + df[f'{label} Recall']))
+    return df
+
+
+UP, DOWN = 'increase', 'decrease'
+A = predictions('A', [(UP, UP), (DOWN, UP), (UP, DOWN), (UP, UP), (DOWN, DOWN), (DOWN, UP)],
+                [0.9, 0.8, 0.6, 0.7, 0.55, 0.95])
+B = predictions('B', [(DOWN, DOWN), (DOWN, DOWN), (UP, DOWN), (UP, UP)], [0.6, 0.65, 0.9, 0.8])
+C = predictions('C', [(UP, UP), (UP, UP), (DOWN, UP)], [0.7, 0.75, 0.85])
+SECTORS = pd.DataFrame({'cvm_code': [1, 2, 3], 'trade_name': ['A', 'B', 'C'],
+                        'b3_sector': ['Energy', 'Energy', 'Retail']})
+
+
+class TestRunningMetrics(unittest.TestCase):
+    def test_grouped_pass_matches_per_company_legacy_metrics(self):
+        # Interleave the companies: each group keeps its own year order
+        table = pd.concat([A, B, C]).sort_values(['Year', 'Company Name'], kind='stable')
+        for window in (None, 3):
+            result = evaluation.running_metrics(table.copy(), window=window)
+            label = 'Cumulative' if window is None else 'Rolling'
+            columns = [f'{label} {metric}' for metric in ('Accuracy', 'Precision', 'Recall', 'F1-Score')]
+            for company in (A, B, C):
+                name = company['Company Name'].iloc[0]
+                pd.testing.assert_frame_equal(
+                    result[result['Company Name'] == name][columns].reset_index(drop=True),
+                    legacy_metrics(company, window)[columns].reset_index(drop=True))
+
+    def test_incremental_updates_continue_cumulative_metrics(self):
+        evaluator = evaluation.Evaluator()
+        first = evaluator.update(pd.concat([A.iloc[:4], B.iloc[:2]]))
+        second = evaluator.update(pd.concat([A.iloc[4:], B.iloc[2:], C]))
+        incremental = pd.concat([first, second]).sort_values(['Company Name', 'Year']).reset_index(drop=True)
+        once = evaluation.evaluate(pd.concat([A, B, C]))
+
+        pd.testing.assert_frame_equal(incremental, once['rows'].reset_index(drop=True))
+        pd.testing.assert_frame_equal(evaluator.report()['by_company'], once['by_company'])
+
+
+class TestEvaluate(unittest.TestCase):
+    def setUp(self):
+        self.report = evaluation.evaluate(pd.concat([C, A, B]), SECTORS)
+
+    def test_company_sector_and_global_metrics(self):
+        by_company = self.report['by_company']
+        self.assertEqual(by_company.loc['A', 'predictions'], 6)
+        self.assertAlmostEqual(by_company.loc['A', 'accuracy'], 0.5)
+        self.assertAlmostEqual(by_company.loc['A', 'precision'], 0.5)
+        self.assertAlmostEqual(by_company.loc['A', 'recall'], 2 / 3)
+        self.assertAlmostEqual(by_company.loc['B', 'precision'], 1.0)
+
+        energy = self.report['by_sector'].loc['Energy']
+        self.assertEqual(energy['predictions'], 10)
+        self.assertAlmostEqual(energy['accuracy'], 0.6)
+        self.assertAlmostEqual(energy['precision'], 3 / 5)
+        self.assertAlmostEqual(energy['recall'], 3 / 5)
+
+        overall = self.report['overall']
+        self.assertEqual(overall['predictions'], 13)
+        self.assertAlmostEqual(overall['accuracy'], 8 / 13)
+        self.assertAlmostEqual(overall['precision'], 5 / 8)
+
+    def test_calibration(self):
+        rows = pd.concat([A, B, C])
+        correct = (rows['Actual Earnings Direction'] == rows['Predicted Earnings Direction']).astype(int)
+        confidence = rows['Confidence Score']
+        self.assertAlmostEqual(self.report['overall']['brier'], ((confidence - correct) ** 2).mean())
+
+        bins = np.minimum((confidence * 10).astype(int), 9)
+        gaps = (correct - confidence).groupby(bins).sum().abs().sum()
+        self.assertAlmostEqual(self.report['overall']['ece'], gaps / len(rows))
+        self.assertEqual(self.report['calibration']['predictions'].sum(), 13)
+        self.assertEqual(self.report['calibration'].loc['0.9-1.0', 'predictions'], 3)
+
+    def test_json_report(self):
+        report = evaluation.report_json(evaluation.evaluate(predictions('D', [(DOWN, DOWN)])))
+        self.assertIsNone(report['overall']['precision'])
+        self.assertIsNone(report['overall']['brier'])
+        self.assertEqual(report['by_sector']['unknown']['accuracy'], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,297 @@
+import os
+import contextvars
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+from unittest.mock import patch
+import pandas as pd
+
+import fetcherv6
+
+
+def balance_rows():
+    return pd.DataFrame({
+        'cvm_code': [1, 1, 1, 2, 2],
+        'statement_type': ['con'] * 5,
+        'reference_date': ['2020-12-31', '2021-06-30', '2021-12-31', '2020-12-31', '2021-12-31'],
+        'assets': [100.0, 105.0, 110.0, 200.0, 210.0],
+        'liabilities': [50.0, 52.0, 55.0, 100.0, 105.0],
+    })
+
+
+def income_rows():
+    return pd.DataFrame({
+        'cvm_code': [1, 1, 1, 2, 2],
+        'period_end': ['2020-06-30', '2020-12-31', '2021-12-31', '2020-12-31', '2021-12-31'],
+        'net_sales': [10.0, 20.0, 40.0, 300.0, 310.0],
+        'net_income': [1.0, 2.0, 4.0, 30.0, 31.0],
+    })
+
+
+class TestBulkFetch(unittest.TestCase):
+    @patch('fetcherv6.fetch_data')
+    def test_bulk_balance_sheets_match_single_company_layout(self, mock_fetch_data):
+        rows = balance_rows()
+        mock_fetch_data.return_value = rows.copy()
+        bulk = fetcherv6.fetch_balance_sheets([1, 2])
+
+        query, params = mock_fetch_data.call_args[0]
+        self.assertIn('ANY(:codes)', query)
+        self.assertEqual(params, {'codes': [1, 2]})
+        self.assertEqual(mock_fetch_data.call_count, 1)
+
+        for code in (1, 2):
+            mock_fetch_data.return_value = rows[rows['cvm_code'] == code].reset_index(drop=True)
+            single = fetcherv6.fetch_balance_sheet(code)
+            pd.testing.assert_frame_equal(bulk[code], single)
+        self.assertEqual(list(bulk[1].columns), [2020, 2021])
+        self.assertEqual(bulk[2].loc['check', 2021], 105.0)
+
+    @patch('fetcherv6.fetch_data')
+    def test_bulk_income_statements_match_single_company_layout(self, mock_fetch_data):
+        rows = income_rows()
+        mock_fetch_data.return_value = rows.copy()
+        bulk = fetcherv6.fetch_income_statements([1, 2])
+
+        for code in (1, 2):
+            mock_fetch_data.return_value = rows[rows['cvm_code'] == code].reset_index(drop=True)
+            single = fetcherv6.fetch_income_statement(code)
+            pd.testing.assert_frame_equal(bulk[code], single)
+        self.assertEqual(bulk[1].loc['net_income', 2020], 3.0)
+        self.assertNotIn('cvm_code', bulk[1].index)
+
+    @patch('fetcherv6.fetch_data')
+    def test_missing_companies_get_empty_frames(self, mock_fetch_data):
+        mock_fetch_data.return_value = income_rows()
+        bulk = fetcherv6.fetch_income_statements([1, 2, 3], chunk_size=2)
+        self.assertEqual(mock_fetch_data.call_count, 2)
+        self.assertTrue(bulk[3].empty)
+
+
+class TestAggregateInDb(unittest.TestCase):
+    @patch('fetcherv6.fetch_data')
+    def test_balance_sheet_year_end_filter_runs_on_server(self, mock_fetch_data):
+        rows = balance_rows()
+        rows = rows[rows['cvm_code'] == 1].reset_index(drop=True)
+        mock_fetch_data.return_value = rows.copy()
+        client_side = fetcherv6.fetch_balance_sheet(1)
+
+        year_end_rows = rows[rows['reference_date'].str.endswith('12-31')].reset_index(drop=True)
+        mock_fetch_data.return_value = year_end_rows
+        server_side = fetcherv6.fetch_balance_sheet(1, aggregate_in_db=True)
+        query = mock_fetch_data.call_args[0][0]
+        self.assertIn('EXTRACT(MONTH FROM reference_date) = 12', query)
+        self.assertIn('EXTRACT(DAY FROM reference_date) = 31', query)
+        pd.testing.assert_frame_equal(server_side, client_side)
+
+    @patch('fetcherv6.get_numeric_columns', return_value=['net_sales', 'net_income'])
+    @patch('fetcherv6.fetch_data')
+    def test_income_statement_annual_sums_run_on_server(self, mock_fetch_data, _mock_columns):
+        rows = income_rows()
+        rows = rows[rows['cvm_code'] == 1].reset_index(drop=True)
+        mock_fetch_data.return_value = rows.copy()
+        client_side = fetcherv6.fetch_income_statement(1)
+
+        mock_fetch_data.return_value = pd.DataFrame({
+            'cvm_code': [1, 1],
+            'period_end': ['2020-01-01', '2021-01-01'],
+            'net_sales': [30.0, 40.0],
+            'net_income': [3.0, 4.0],
+        })
+        server_side = fetcherv6.fetch_income_statement(1, aggregate_in_db=True)
+        query = mock_fetch_data.call_args[0][0]
+        self.assertIn("GROUP BY cvm_code, date_trunc('year', period_end)", query)
+        self.assertIn('COALESCE(SUM("net_income"), 0) AS "net_income"', query)
+        pd.testing.assert_frame_equal(server_side, client_side)
+
+    @patch('fetcherv6.get_numeric_columns', return_value=['net_income'])
+    @patch('fetcherv6.fetch_data', return_value=pd.DataFrame())
+    def test_default_comes_from_module_setting(self, mock_fetch_data, _mock_columns):
+        with patch('fetcherv6.AGGREGATE_IN_DB', True):
+            fetcherv6.fetch_income_statements([1, 2])
+        self.assertIn('GROUP BY', mock_fetch_data.call_args[0][0])
+        fetcherv6.fetch_income_statements([1, 2])
+        self.assertNotIn('GROUP BY', mock_fetch_data.call_args[0][0])
+
+
+def table_columns(*names):
+    return [{'name': name, 'type': None} for name in names]
+
+
+class TestColumnProjection(unittest.TestCase):
+    @patch('fetcherv6.get_table_columns')
+    @patch('fetcherv6.fetch_data', return_value=pd.DataFrame())
+    def test_default_fetches_select_every_column(self, mock_fetch_data, mock_columns):
+        fetcherv6.fetch_income_statement(1)
+        fetcherv6.fetch_balance_sheets([1, 2])
+        for call in mock_fetch_data.call_args_list:
+            self.assertIn('SELECT *', call[0][0])
+        mock_columns.assert_not_called()
+
+    @patch('fetcherv6.PROJECT_COLUMNS', True)
+    @patch('fetcherv6.get_table_columns',
+           return_value=table_columns('cvm_code', 'statement_type', 'reference_date', 'liabilities', 'assets',
+                                      'equity', 'unregistered'))
+    @patch('fetcherv6.fetch_data')
+    def test_query_selects_registered_accounts_in_table_order(self, mock_fetch_data, _mock_columns):
+        mock_fetch_data.return_value = balance_rows()[['cvm_code', 'reference_date', 'liabilities', 'assets']]
+        df = fetcherv6.fetch_balance_sheet(1)
+        query = mock_fetch_data.call_args[0][0]
+        self.assertIn('SELECT "cvm_code", "reference_date", "liabilities", "assets", "equity"', query)
+        self.assertNotIn('unregistered', query)
+        self.assertEqual(list(df.index), ['liabilities', 'assets', 'check'])
+
+    @patch('fetcherv6.get_table_columns',
+           return_value=table_columns('cvm_code', 'reference_date', 'assets', 'liabilities', 'equity'))
+    @patch('fetcherv6.fetch_data', return_value=pd.DataFrame())
+    def test_requested_accounts_keep_balance_check_inputs(self, mock_fetch_data, _mock_columns):
+        fetcherv6.fetch_balance_sheets([1, 2], accounts=['equity'])
+        query = mock_fetch_data.call_args[0][0]
+        self.assertIn('SELECT "cvm_code", "reference_date", "assets", "liabilities", "equity"', query)
+
+    @patch('fetcherv6.get_table_columns',
+           return_value=table_columns('cvm_code', 'reference_date', 'assets', 'liabilities', 'loans'))
+    @patch('fetcherv6.fetch_data', return_value=pd.DataFrame())
+    def test_requested_accounts_are_checked_against_the_table(self, mock_fetch_data, _mock_columns):
+        with self.assertLogs(level='WARNING') as logs:
+            fetcherv6.fetch_balance_sheets([1], accounts=['loans', 'short_term_loans'])
+        self.assertIn("['short_term_loans']", logs.output[0])
+        self.assertIn('"assets", "liabilities", "loans"', mock_fetch_data.call_args[0][0])
+
+    @patch('fetcherv6.PROJECT_COLUMNS', True)
+    @patch('fetcherv6.get_table_columns', return_value=table_columns('cvm_code', 'period_end', 'Revenue'))
+    @patch('fetcherv6.fetch_data', return_value=pd.DataFrame())
+    def test_unknown_schema_falls_back_to_select_all(self, mock_fetch_data, _mock_columns):
+        with self.assertLogs(level='WARNING'):
+            fetcherv6.fetch_income_statements([1])
+        self.assertIn('SELECT *', mock_fetch_data.call_args[0][0])
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        from sqlalchemy import create_engine
+        self.engine = create_engine('sqlite://')
+        rows = income_rows()
+        rows = pd.concat([rows, rows.assign(cvm_code=3)], ignore_index=True)
+        rows.to_sql('income_statement', self.engine, index=False)
+        self.engine_patch = patch('fetcherv6.get_engine', return_value=self.engine)
+        self.engine_patch.start()
+        fetcherv6._table_columns.clear()
+
+    def tearDown(self):
+        self.engine_patch.stop()
+        fetcherv6._table_columns.clear()
+
+    def test_chunks_are_bounded(self):
+        chunks = list(fetcherv6.fetch_data_chunks("SELECT * FROM income_statement", chunk_size=4))
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 2])
+
+    def test_groups_are_complete_across_chunk_boundaries(self):
+        groups = list(fetcherv6.iter_statement_rows('income_statement', chunk_size=2))
+        self.assertEqual([code for code, _ in groups], [1, 2, 3])
+        self.assertEqual([len(rows) for _, rows in groups], [3, 2, 5])
+
+    def test_streamed_frames_match_bulk_fetch(self):
+        streamed = dict(fetcherv6.iter_statements('income_statement', chunk_size=3))
+        with patch('fetcherv6.fetch_data', return_value=income_rows()):
+            bulk = fetcherv6.fetch_income_statements([1, 2])
+        pd.testing.assert_frame_equal(streamed[1], bulk[1])
+        pd.testing.assert_frame_equal(streamed[2], bulk[2])
+
+
+class TestFetchScope(unittest.TestCase):
+    def rows_for(self, query, params):
+        rows = balance_rows() if 'FROM balance_sheet' in query else income_rows()
+        return rows[rows['cvm_code'] == int(params['cvm_code'])].reset_index(drop=True)
+
+    @patch('fetcherv6.fetch_data')
+    def test_repeated_fetches_share_one_query(self, mock_fetch_data):
+        mock_fetch_data.side_effect = self.rows_for
+        with fetcherv6.fetch_scope() as scope:
+            fetcherv6.fetch_datx_y(1)
+            fetcherv6.retrieve_income_with_lenght('1')
+            fetcherv6.retrieve_balance_with_lenght(1)
+            fetcherv6.net_income_direction(1)
+        self.assertEqual(mock_fetch_data.call_count, 2)
+        self.assertEqual((scope.misses, scope.hits), (2, 3))
+
+        fetcherv6.fetch_income_statement(1)
+        self.assertEqual(mock_fetch_data.call_count, 3)
+
+    @patch('fetcherv6.fetch_data')
+    def test_callers_get_independent_copies(self, mock_fetch_data):
+        mock_fetch_data.side_effect = self.rows_for
+        with fetcherv6.fetch_scope():
+            first = fetcherv6.fetch_income_statement(1)
+            first.loc['net_income', 2020] = -1.0
+            second = fetcherv6.fetch_income_statement(1)
+        self.assertEqual(second.loc['net_income', 2020], 3.0)
+
+    @patch('fetcherv6.fetch_data')
+    def test_concurrent_callers_are_single_flight(self, mock_fetch_data):
+        def slow_fetch(query, params):
+            time.sleep(0.05)
+            return self.rows_for(query, params)
+
+        mock_fetch_data.side_effect = slow_fetch
+        with fetcherv6.fetch_scope():
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, fetcherv6.fetch_income_statement, 1)
+                           for _ in range(4)]
+                results = [future.result() for future in futures]
+        self.assertEqual(mock_fetch_data.call_count, 1)
+        for result in results[1:]:
+            pd.testing.assert_frame_equal(result, results[0])
+
+    @patch('fetcherv6.fetch_data')
+    def test_failed_fetches_are_retried(self, mock_fetch_data):
+        mock_fetch_data.side_effect = [RuntimeError("connection reset"), income_rows()]
+        with fetcherv6.fetch_scope():
+            with self.assertRaises(RuntimeError):
+                fetcherv6.fetch_income_statement(1)
+            fetcherv6.fetch_income_statement(1)
+        self.assertEqual(mock_fetch_data.call_count, 2)
+
+    @patch('fetcherv6.fetch_data')
+    def test_empty_fetches_are_retried(self, mock_fetch_data):
+        # fetch_data returns an empty frame when the query fails
+        mock_fetch_data.side_effect = [pd.DataFrame(), income_rows()]
+        with fetcherv6.fetch_scope() as scope:
+            self.assertTrue(fetcherv6.fetch_income_statement(1).empty)
+            self.assertFalse(fetcherv6.fetch_income_statement(1).empty)
+            fetcherv6.fetch_income_statement(1)
+        self.assertEqual(mock_fetch_data.call_count, 2)
+        self.assertEqual((scope.misses, scope.hits), (2, 1))
+
+
+class TestLazyEngine(unittest.TestCase):
+    def tearDown(self):
+        fetcherv6._engine = None
+
+    def test_import_needs_no_credentials(self):
+        env = {k: v for k, v in os.environ.items() if not k.startswith('SUPABASE_')}
+        code = ("import sys, openaicall; assert 'sqlalchemy' not in sys.modules; "
+                "assert sys.modules['fetcherv6']._engine is None")
+        result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_missing_credentials_raise_on_first_use(self):
+        with patch.dict(os.environ, {'SUPABASE_USER': ''}):
+            with self.assertRaises(EnvironmentError):
+                fetcherv6.get_engine()
+
+    def test_engine_is_built_once_with_pool_settings(self):
+        env = {'SUPABASE_USER': 'u', 'SUPABASE_PASSWORD': 'secret', 'SUPABASE_HOST': 'localhost',
+               'SUPABASE_PORT': '5432', 'SUPABASE_DBNAME': 'db'}
+        with patch.dict(os.environ, env), self.assertLogs(level='INFO') as logs:
+            engine = fetcherv6.get_engine()
+            self.assertIs(fetcherv6.engine, engine)
+        self.assertEqual(engine.pool.size(), fetcherv6.POOL_SIZE)
+        self.assertFalse(any('secret' in line for line in logs.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+
+import fetcherv6
+from financial_panel import FinancialPanel, build_panels
+
+
+def balance_rows():
+    return pd.DataFrame({
+        'cvm_code': [1, 1, 1, 2, 2],
+        'statement_type': ['con'] * 5,
+        'reference_date': ['2020-12-31', '2021-06-30', '2021-12-31', '2019-12-31', '2021-12-31'],
+        'assets': [100.0, 105.0, 110.0, 200.0, 210.0],
+        'liabilities': [50.0, 52.0, 55.0, 100.0, 105.0],
+    })
+
+
+def income_rows():
+    return pd.DataFrame({
+        'cvm_code': [1, 1, 1, 2, 2],
+        'period_end': ['2020-06-30', '2020-12-31', '2021-12-31', '2020-12-31', '2021-12-31'],
+        'net_sales': [10.0, 20.0, 40.0, 300.0, np.nan],
+        'Net Income': [1.0, 2.0, 4.0, 30.0, 31.0],
+    })
+
+
+class TestFinancialPanel(unittest.TestCase):
+    def test_balance_sheet_panel_matches_fetch_datx_y(self):
+        rows = balance_rows()
+        panel = FinancialPanel.from_rows('balance_sheet', rows)
+        self.assertEqual(panel.values.dtype, np.float64)
+        self.assertEqual(panel.values.shape, (2, 3, 3))
+        self.assertEqual(panel.accounts, ['assets', 'liabilities', 'check'])
+
+        with patch('fetcherv6.fetch_data', return_value=rows[rows['cvm_code'] == 1].reset_index(drop=True)):
+            expected = fetcherv6.fetch_balance_sheet(1).T
+        frame = panel.to_frame(1)
+        np.testing.assert_array_equal(frame.index, expected.index.astype(int))
+        np.testing.assert_array_equal(frame.to_numpy(), expected.to_numpy(dtype=float))
+
+        self.assertTrue(np.isnan(panel.company(2)[0, panel.year_index[2020]]))
+        self.assertFalse(panel.mask[panel.company_index[2], 0, panel.year_index[2020]])
+        self.assertEqual(list(panel.available_years(2)), [2019, 2021])
+
+    def test_income_panel_sums_periods_per_year(self):
+        panel = FinancialPanel.from_rows('income_statement', income_rows())
+        self.assertEqual(panel.accounts, ['net_sales', 'net_income'])
+        self.assertEqual(panel.company(1)[panel.account_index['net_income'], panel.year_index[2020]], 3.0)
+        self.assertTrue(np.isnan(panel.company(2)[panel.account_index['net_sales'], panel.year_index[2021]]))
+        self.assertEqual(panel.account('net_income')[panel.company_index[2], panel.year_index[2021]], 31.0)
+
+    def test_slices_are_views(self):
+        panel = FinancialPanel.from_rows('income_statement', income_rows())
+        window = panel.window(1, 2021, length=5)
+        self.assertEqual(window.shape, (2, 1))
+        self.assertTrue(np.shares_memory(window, panel.values))
+        self.assertTrue(np.shares_memory(panel.account('net_sales'), panel.values))
+
+    @patch('fetcherv6.fetch_data')
+    def test_build_panels_issues_one_query_per_statement(self, mock_fetch_data):
+        mock_fetch_data.side_effect = [balance_rows(), income_rows()]
+        panels = build_panels([1, 2])
+        self.assertEqual(mock_fetch_data.call_count, 2)
+        self.assertEqual(list(panels['income_statement'].cvm_codes), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+import pandas as pd
+
+import llm_batch
+import llm_cache
+
+
+def prediction_json(year):
+    return json.dumps({'Year': int(year), 'earnings direction': 'increase', 'magnitude': 'small',
+                       'confidence score': 0.6, 'summary of rationale': 'Sales keep growing.'})
+
+
+def completion_body(content):
+    return {
+        'id': 'chatcmpl-1', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-4-turbo',
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+    }
+
+
+class BatchStubHandler(BaseHTTPRequestHandler):
+    """Stand-in for the OpenAI files and batches endpoints.
+
+    A batch completes on its second retrieve; each request is answered with a
+    prediction whose Year is taken from the custom_id, and custom_ids listed in
+    server.fail_ids get an error result.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, payload, status=200, raw=None):
+        body = raw if raw is not None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_POST(self):
+        state = self.server.state
+        if self.path == '/v1/files':
+            message = BytesParser(policy=default_policy).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + self._body())
+            content = next(part.get_payload(decode=True) for part in message.iter_parts() if part.get_filename())
+            file_id = f"file-{len(state['files'])}"
+            state['files'][file_id] = content
+            self._send({'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': 0,
+                        'filename': 'requests.jsonl', 'purpose': 'batch', 'status': 'processed'})
+        elif self.path == '/v1/batches':
+            request = json.loads(self._body())
+            batch_id = f"batch-{len(state['batches'])}"
+            state['batches'][batch_id] = {
+                'id': batch_id, 'object': 'batch', 'endpoint': request['endpoint'], 'completion_window': '24h',
+                'input_file_id': request['input_file_id'], 'status': 'validating', 'created_at': 0, 'polls': 0,
+            }
+            self._send(self._public(state['batches'][batch_id]))
+        else:
+            self._send({'error': 'not found'}, 404)
+
+    def do_GET(self):
+        state = self.server.state
+        parts = self.path.strip('/').split('/')
+        if parts[:2] == ['v1', 'batches']:
+            batch = state['batches'][parts[2]]
+            batch['polls'] += 1
+            if batch['polls'] >= 2 and batch['status'] != 'completed':
+                self._complete(batch)
+            elif batch['status'] == 'validating':
+                batch['status'] = 'in_progress'
+            self._send(self._public(batch))
+        elif parts[:2] == ['v1', 'files'] and parts[3:] == ['content']:
+            self._send(None, raw=state['files'][parts[2]])
+        else:
+            self._send({'error': 'not found'}, 404)
+
+    def _public(self, batch):
+        return {key: value for key, value in batch.items() if key != 'polls'}
+
+    def _complete(self, batch):
+        state = self.server.state
+        lines = [json.loads(line) for line in state['files'][batch['input_file_id']].decode().splitlines()]
+        state['submitted'].extend(lines)
+        output, errors = [], []
+        for line in lines:
+            year = line['custom_id'].rsplit('-', 1)[1]
+            if line['custom_id'] in self.server.fail_ids:
+                errors.append({'custom_id': line['custom_id'], 'response': None,
+                               'error': {'code': 'server_error', 'message': 'boom'}})
+            else:
+                output.append({'custom_id': line['custom_id'], 'response': {
+                    'status_code': 200, 'body': completion_body(self.server.replies.get(line['custom_id'], prediction_json(year)))}})
+        for key, rows in (('output_file_id', output), ('error_file_id', errors)):
+            file_id = f"file-{len(state['files'])}"
+            state['files'][file_id] = ''.join(json.dumps(row) + '\n' for row in rows).encode()
+            batch[key] = file_id
+        batch['status'] = 'completed'
+        batch['request_counts'] = {'total': len(lines), 'completed': len(output), 'failed': len(errors)}
+
+
+class TestBatchMode(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), BatchStubHandler)
+        self.server.state = {'files': {}, 'batches': {}, 'submitted': []}
+        self.server.fail_ids = set()
+        self.server.replies = {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        import openai
+        self.client = openai.OpenAI(api_key='test', base_url=f"http://127.0.0.1:{self.server.server_port}/v1")
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = llm_cache.ResponseCache(os.path.join(self.tmp.name, 'responses.db'))
+        patcher = patch('llm_batch.llm_cache.get_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        frame = pd.DataFrame({'net_income': [1.0]})
+        windows = {1: [(2019, frame, frame), (2020, frame, frame)], 2: [(2021, frame, frame)]}
+        patcher = patch('llm_batch.prediction_windows', side_effect=lambda code: windows[code])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def run_batch(self):
+        return llm_batch.get_batch_predictions([1, 2], client=self.client, job_dir=os.path.join(self.tmp.name, 'job'),
+                                               poll_interval=0.01, timeout=5)
+
+    def test_results_map_back_to_company_and_year(self):
+        with patch('llm_batch.create_prompt', side_effect=['p2019', 'p2020', 'p2021']):
+            predictions = self.run_batch()
+        self.assertEqual(list(predictions[1]['Year']), [2019, 2020])
+        self.assertEqual(list(predictions[2]['Year']), [2021])
+        submitted = self.server.state['submitted']
+        self.assertEqual([line['custom_id'] for line in submitted], ['1-2019', '1-2020', '2-2021'])
+        self.assertEqual(submitted[0]['body']['messages'][1]['content'], 'p2019')
+        with open(os.path.join(self.tmp.name, 'job', 'job.json')) as f:
+            self.assertEqual(json.load(f)['status'], 'completed')
+
+    @patch('llm_batch.llm_cache.get_cache', return_value=None)
+    def test_year_comes_from_the_custom_id(self, _mock_cache):
+        results = [{'custom_id': '1-2020', 'response': {'status_code': 200,
+                                                         'body': completion_body(prediction_json(2019))}}]
+        with self.assertLogs(level='WARNING'):
+            predictions = llm_batch.ingest_results(results)
+        self.assertEqual(list(predictions[1]['Year']), [2020])
+
+    def test_failed_requests_are_left_out(self):
+        self.server.fail_ids = {'1-2020'}
+        with patch('llm_batch.create_prompt', side_effect=['p2019', 'p2020', 'p2021']):
+            predictions = self.run_batch()
+        self.assertEqual(list(predictions[1]['Year']), [2019])
+
+    @patch('llm_batch.predict_window')
+    def test_invalid_replies_are_re_asked_individually(self, mock_predict_window):
+        self.server.replies = {'1-2020': 'Sorry, here is my analysis: the company'}
+
+        async def predict_window(request):
+            self.assertIn('could not be used', request['messages'][-1]['content'])
+            return {}, json.loads(prediction_json(2020))
+        mock_predict_window.side_effect = predict_window
+        with patch('llm_batch.create_prompt', side_effect=['p2019', 'p2020', 'p2021']):
+            predictions = self.run_batch()
+        self.assertEqual(mock_predict_window.call_count, 1)
+        self.assertEqual(list(predictions[1]['Year']), [2019, 2020])
+
+    def test_cached_windows_are_not_resubmitted(self):
+        with patch('llm_batch.create_prompt', side_effect=['p2019', 'p2020', 'p2021']):
+            self.run_batch()
+        self.assertEqual(self.cache.stats()['entries'], 3)
+        with patch('llm_batch.create_prompt', side_effect=['p2019', 'p2020', 'p2021']):
+            predictions = self.run_batch()
+        self.assertEqual(len(self.server.state['batches']), 1)
+        self.assertEqual(list(predictions[1]['Year']), [2019, 2020])
+
+
+if __name__ == '__main__':
+    unittest.main()
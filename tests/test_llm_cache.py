@@ -0,0 +1,107 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import llm_cache
+import openaicall
+
+
+def chat_completion(content):
+    return {
+        'id': 'chatcmpl-1', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-4-turbo',
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+        'usage': {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15},
+    }
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = llm_cache.ResponseCache(os.path.join(self.tmp.name, 'responses.db'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_ignores_dict_order_but_not_content(self):
+        request = {'model': 'gpt-4-turbo', 'temperature': 0, 'messages': [{'role': 'user', 'content': 'a'}]}
+        reordered = dict(reversed(list(request.items())))
+        self.assertEqual(llm_cache.cache_key('openai', request), llm_cache.cache_key('openai', reordered))
+        self.assertNotEqual(llm_cache.cache_key('openai', request), llm_cache.cache_key('perplexity', request))
+        self.assertNotEqual(llm_cache.cache_key('openai', request),
+                            llm_cache.cache_key('openai', dict(request, temperature=1)))
+
+    def test_round_trip_and_stats(self):
+        self.assertIsNone(self.cache.get('k'))
+        self.cache.put('k', 'openai', 'gpt-4-turbo', {'answer': 1})
+        self.assertEqual(self.cache.get('k'), {'answer': 1})
+        stats = self.cache.stats()
+        self.assertEqual((stats['entries'], stats['hits'], stats['misses']), (1, 1, 1))
+        self.assertEqual((stats['total_hits'], stats['total_misses']), (1, 1))
+
+    def test_expired_entries_are_misses(self):
+        self.cache.put('k', 'openai', 'gpt-4-turbo', {'answer': 1})
+        self.cache.max_age = 0
+        time.sleep(0.01)
+        self.assertIsNone(self.cache.get('k'))
+        self.assertEqual(self.cache.evict(), 1)
+
+    def test_least_recently_used_entries_are_evicted_above_max_bytes(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.put(key, 'openai', 'm', {'text': 'x' * 100})
+            time.sleep(0.01)
+        self.cache.get('a')
+        self.cache.max_bytes = 250
+        self.cache.evict()
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('c'))
+
+    def test_concurrent_writers(self):
+        def write(offset):
+            for i in range(20):
+                self.cache.put(f"{offset}-{i}", 'openai', 'm', {'i': i})
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.stats()['entries'], 80)
+
+
+class TestCachedPredictions(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        cache = llm_cache.ResponseCache(os.path.join(self.tmp.name, 'responses.db'))
+        self.patcher = patch('openaicall.llm_cache.get_cache', return_value=cache)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmp.cleanup()
+
+    @patch('openaicall.llm_providers.get_provider')
+    def test_repeated_request_is_served_from_cache(self, mock_provider):
+        complete = mock_provider.return_value.complete = AsyncMock(return_value=chat_completion('{"Year": 2020}'))
+        request = openaicall.prediction_request("prompt")
+        first = asyncio.run(openaicall.complete(request))
+        second = asyncio.run(openaicall.complete(request))
+        self.assertEqual(complete.await_count, 1)
+        self.assertEqual(second, first)
+
+    @patch('openaicall.llm_providers.get_provider')
+    def test_providers_have_separate_entries(self, mock_provider):
+        complete = mock_provider.return_value.complete = AsyncMock(return_value=chat_completion('{}'))
+        request = {'model': 'mixtral-8x7b-instruct', 'messages': [{'role': 'user', 'content': 'p'}]}
+        asyncio.run(openaicall.complete(request, 'perplexity'))
+        asyncio.run(openaicall.complete(request, 'perplexity'))
+        asyncio.run(openaicall.complete(request, 'openai'))
+        self.assertEqual(complete.await_count, 2)
+        self.assertEqual([call.args[0] for call in mock_provider.call_args_list], ['perplexity', 'openai'])
+
+
+if __name__ == '__main__':
+    unittest.main()
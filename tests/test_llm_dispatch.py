@@ -0,0 +1,202 @@
+import asyncio
+import json
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+import pandas as pd
+
+import llm_dispatch
+import openaicall
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__("rate limited")
+        self.response = SimpleNamespace(headers={'retry-after': str(retry_after)})
+
+
+def completion(content, total_tokens=10):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                           usage=SimpleNamespace(total_tokens=total_tokens))
+
+
+def prediction(year):
+    return json.dumps({'Year': year, 'earnings direction': 'increase', 'magnitude': 'small',
+                       'confidence score': 0.6, 'summary of rationale': 'Sales keep growing.'})
+
+
+def completion_json(content):
+    return {'choices': [{'message': {'role': 'assistant', 'content': content}}], 'usage': {'total_tokens': 10}}
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_waits_for_refill_once_empty(self):
+        clock = FakeClock()
+        bucket = llm_dispatch.TokenBucket(capacity=60, rate=1, clock=clock)
+        self.assertEqual(bucket.reserve(60), 0.0)
+        self.assertEqual(bucket.reserve(30), 30.0)
+        clock.now = 30.0
+        self.assertEqual(bucket.reserve(1), 1.0)
+
+    def test_refund_returns_unused_tokens(self):
+        bucket = llm_dispatch.TokenBucket(capacity=100, rate=1, clock=FakeClock())
+        bucket.reserve(100)
+        bucket.refund(40)
+        self.assertEqual(bucket.reserve(40), 0.0)
+
+
+class TestDispatch(unittest.TestCase):
+    def test_429_pauses_and_retries(self):
+        limiter = llm_dispatch.RateLimiter(requests_per_minute=6000, tokens_per_minute=10**6)
+        call = AsyncMock(side_effect=[RateLimited(0.05), completion('ok')])
+        start = time.monotonic()
+        response = asyncio.run(llm_dispatch.dispatch(call, {'messages': []}, rate_limiter=limiter))
+        self.assertEqual(response.choices[0].message.content, 'ok')
+        self.assertEqual(call.await_count, 2)
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_failed_attempts_refund_their_tokens(self):
+        limiter = llm_dispatch.RateLimiter(requests_per_minute=6000, tokens_per_minute=1000,
+                                           clock=FakeClock())
+        call = AsyncMock(side_effect=[RateLimited(0), RateLimited(0), completion('ok', total_tokens=400)])
+        asyncio.run(llm_dispatch.dispatch(call, {'messages': []}, tokens=400, rate_limiter=limiter))
+        self.assertEqual(call.await_count, 3)
+        # Only the successful attempt's 400 tokens are spent
+        self.assertEqual(limiter.tokens.reserve(600), 0.0)
+
+    def test_other_errors_propagate(self):
+        call = AsyncMock(side_effect=ValueError("bad request"))
+        with self.assertRaises(ValueError):
+            asyncio.run(llm_dispatch.dispatch(call, {'messages': []}))
+        self.assertEqual(call.await_count, 1)
+
+    def test_tokens_per_minute_quota_spaces_requests(self):
+        # 600 tokens per minute refill at 10 per second; the second request waits ~0.1s
+        limiter = llm_dispatch.RateLimiter(requests_per_minute=6000, tokens_per_minute=600)
+        call = AsyncMock(return_value=completion('ok', total_tokens=None))
+        start = time.monotonic()
+        requests_ = [{'messages': [], 'max_tokens': 600}, {'messages': [], 'max_tokens': 1}]
+        asyncio.run(llm_dispatch.dispatch_all(call, requests_, rate_limiter=limiter))
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+
+@patch('openaicall.llm_cache.get_cache', return_value=None)
+class TestConcurrentPredictions(unittest.TestCase):
+    def windows(self):
+        frame = pd.DataFrame({'net_income': [1.0]})
+        return [(year, frame, frame) for year in range(2015, 2025)]
+
+    @patch('openaicall.llm_providers.get_provider')
+    @patch('openaicall.prediction_windows')
+    def test_windows_are_dispatched_concurrently_in_order(self, mock_windows, mock_provider, _mock_cache):
+        mock_windows.return_value = self.windows()
+
+        async def complete(request, stream=False, record=None):
+            await asyncio.sleep(0.1)
+            year = request['messages'][1]['content']
+            return completion_json(prediction(year))
+
+        mock_provider.return_value.complete = complete
+        created = []
+
+        def prompt(income, balance):
+            created.append(1)
+            return str(2014 + len(created))
+
+        with patch('openaicall.create_prompt', side_effect=prompt):
+            start = time.monotonic()
+            predictions = openaicall.get_predictions(1)
+            elapsed = time.monotonic() - start
+
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(list(predictions['Year']), list(range(2015, 2025)))
+
+    @patch('openaicall.llm_providers.get_provider')
+    @patch('openaicall.prediction_windows')
+    def test_many_companies_share_one_loop(self, mock_windows, mock_provider, _mock_cache):
+        mock_windows.side_effect = lambda code: self.windows()[:2] if code == 1 else {"error": "inconsistent"}
+        mock_provider.return_value.complete = AsyncMock(return_value=completion_json(prediction(2020)))
+        predictions = openaicall.get_many_predictions([1, 2])
+        self.assertEqual(len(predictions[1]), 2)
+        self.assertEqual(predictions[2], {"error": "inconsistent"})
+
+
+class TestHedgedRequests(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.cancelled = []
+        self.delays = {'openai': 0.0, 'perplexity': 0.0}
+        self.queued = {'openai': 0.0, 'perplexity': 0.0}
+        self.replies = {}
+
+        async def complete(request, provider='openai'):
+            self.calls.append((provider, request['model']))
+            try:
+                # Waiting on the rate limits, then sent as llm_dispatch.dispatch marks it
+                await asyncio.sleep(self.queued[provider])
+                openaicall.llm_telemetry.CallRecord(provider, request).sent()
+                await asyncio.sleep(self.delays[provider])
+            except asyncio.CancelledError:
+                self.cancelled.append(provider)
+                raise
+            return completion_json(self.replies.get(request['model'], prediction(2020)))
+        patcher = patch('openaicall.complete', side_effect=complete)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def predict(self, hedge='perplexity', delay=0.05):
+        with patch('openaicall.hedge_delay', return_value=delay):
+            return asyncio.run(openaicall.hedged_predict_window(openaicall.prediction_request('p'), hedge=hedge))
+
+    def test_slow_primary_is_hedged_and_cancelled(self):
+        self.delays['openai'] = 5
+        start = time.monotonic()
+        _, prediction_, served_by = self.predict()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual((prediction_['Year'], served_by), (2020, 'perplexity'))
+        self.assertEqual(self.calls, [('openai', 'gpt-4-turbo'), ('perplexity', 'mixtral-8x7b-instruct')])
+        self.assertEqual(self.cancelled, ['openai'])
+
+    def test_fast_primary_is_not_hedged(self):
+        self.assertEqual(self.predict()[2], 'openai')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_queueing_before_the_send_is_not_hedged(self):
+        self.queued['openai'] = 0.3
+        self.assertEqual(self.predict()[2], 'openai')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_invalid_primary_is_hedged_without_waiting(self):
+        self.replies['gpt-4-turbo'] = "no idea"
+        start = time.monotonic()
+        _, _, served_by = self.predict('openai:gpt-4o', delay=5)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(served_by, 'openai:gpt-4o')
+        self.assertEqual(self.calls[-1], ('openai', 'gpt-4o'))
+
+    def test_delay_follows_the_service_time_percentile(self):
+        telemetry = openaicall.llm_telemetry.Telemetry()
+        with patch('openaicall.llm_telemetry.telemetry', telemetry):
+            self.assertEqual(openaicall.hedge_delay('openai', 'gpt-4-turbo'), openaicall.HEDGE_DELAY)
+            for seconds in range(1, 101):
+                record = openaicall.llm_telemetry.CallRecord('openai', {'model': 'gpt-4-turbo'})
+                # Time spent queued before the send is left out
+                record.latency = seconds / 10 + 60
+                record.service_time = seconds / 10
+                telemetry.add(record)
+            self.assertAlmostEqual(openaicall.hedge_delay('openai', 'gpt-4-turbo'), 9.505)
+
+
+if __name__ == '__main__':
+    unittest.main()
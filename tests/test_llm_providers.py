@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import llm_dispatch
+import llm_providers
+import llm_telemetry
+
+
+class ChatStubHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions stand-in answering with server.statuses in turn (then 200)."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.requests.append((self.client_address[1], self.headers.get('authorization'), request))
+            status = server.statuses.pop(0) if server.statuses else 200
+        if request.get('stream'):
+            return self._stream(server.stream_chunks)
+        if status == 200:
+            body = {'choices': [{'message': {'role': 'assistant', 'content': request['messages'][-1]['content']}}],
+                    'usage': {'total_tokens': 5}}
+        else:
+            body = {'error': {'message': f"status {status}"}}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if status == 429:
+            self.send_header('retry-after-ms', '10')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, chunks):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        events = [{'id': 'chatcmpl-1', 'model': 'm', 'choices': [{'index': 0, 'delta': {'content': content}}]}
+                  for content in chunks]
+        for data in [f"data: {json.dumps(event)}\n\n".encode() for event in events] + [b"data: [DONE]\n\n"]:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class TestProvider(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ChatStubHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.statuses = []
+        self.server.stream_chunks = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.provider = llm_providers.Provider(
+            'stub', f"http://127.0.0.1:{self.server.server_port}/v1", 'STUB_API_KEY',
+            rate_limiter=llm_dispatch.RateLimiter(requests_per_minute=60000, tokens_per_minute=10**7))
+        patcher = patch.dict(os.environ, {'STUB_API_KEY': 'secret'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('llm_dispatch._backoff', return_value=0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.provider.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, content='hi'):
+        return {'model': 'm', 'messages': [{'role': 'user', 'content': content}]}
+
+    def test_credentials_come_from_the_environment_and_connections_are_reused(self):
+        for i in range(3):
+            response = self.provider.complete_sync(self.request(str(i)))
+            self.assertEqual(response['choices'][0]['message']['content'], str(i))
+        ports = {port for port, _, _ in self.server.requests}
+        self.assertEqual(len(ports), 1)
+        self.assertEqual({auth for _, auth, _ in self.server.requests}, {'Bearer secret'})
+
+    def test_transient_failures_are_retried(self):
+        self.server.statuses = [503, 429]
+        response = self.provider.complete_sync(self.request())
+        self.assertEqual(response['choices'][0]['message']['content'], 'hi')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        import requests
+        self.server.statuses = [400]
+        with self.assertRaises(requests.HTTPError):
+            self.provider.complete_sync(self.request())
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stream_stops_once_the_json_object_is_complete(self):
+        self.server.stream_chunks = ['Here you go: {"Year": 20', '21, "note": "a } in a string"}', ' I hope', ' this helps']
+        record = llm_telemetry.CallRecord('stub', self.request())
+        response = llm_dispatch.run(self.provider.complete(self.request(), stream=True, record=record))
+        self.assertEqual(response['choices'][0]['message']['content'],
+                         'Here you go: {"Year": 2021, "note": "a } in a string"}')
+        self.assertEqual(response['choices'][0]['finish_reason'], 'stop')
+        self.assertIsNotNone(record.time_to_first_token)
+
+    def test_stopped_streams_leave_the_connection_reusable(self):
+        self.server.stream_chunks = ['{"Year": 2021}', ' and some', ' trailing commentary']
+        for _ in range(3):
+            self.provider.complete_sync(self.request(), stream=True)
+        self.assertEqual(len({port for port, _, _ in self.server.requests}), 1)
+
+    def test_missing_credentials_fail_without_a_request(self):
+        with patch.dict(os.environ, {'STUB_API_KEY': ''}):
+            with self.assertRaises(EnvironmentError):
+                self.provider.complete_sync(self.request())
+        self.assertEqual(self.server.requests, [])
+
+    def test_connection_errors_are_retried(self):
+        import requests
+        provider = llm_providers.Provider('down', 'http://127.0.0.1:9', 'STUB_API_KEY', timeout=(0.2, 0.2),
+                                          rate_limiter=self.provider.rate_limiter)
+        with patch('llm_dispatch.MAX_RETRIES', 2), patch.object(provider, 'post', wraps=provider.post) as post:
+            with self.assertRaises(requests.ConnectionError):
+                asyncio.run(provider.complete(self.request()))
+        self.assertEqual(post.call_count, 3)
+
+
+class TestRegistry(unittest.TestCase):
+    def test_builtin_and_custom_providers(self):
+        self.assertEqual(llm_providers.get_provider('perplexity').api_key_env, 'PERPLEXITY_API_KEY')
+        provider = llm_providers.register_provider('local', 'http://localhost:8000/v1/', 'LOCAL_KEY')
+        self.addCleanup(llm_providers._providers.pop, 'local')
+        self.assertIs(llm_providers.get_provider('local'), provider)
+        self.assertEqual(provider.base_url, 'http://localhost:8000/v1')
+        with self.assertRaises(ValueError):
+            llm_providers.get_provider('nope')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import llm_dispatch
+import llm_telemetry
+import openaicall
+
+PREDICTION = {'Year': 2021, 'earnings direction': 'increase', 'magnitude': 'small',
+              'confidence score': 0.7, 'summary of rationale': 'Margins widen.'}
+
+
+def completion(content, usage=None):
+    return {'choices': [{'message': {'role': 'assistant', 'content': content}}], 'usage': usage}
+
+
+class RateLimited(Exception):
+    status_code = 429
+    response = SimpleNamespace(headers={'retry-after-ms': '1'})
+
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.telemetry = llm_telemetry.Telemetry()
+        patcher = patch('llm_telemetry.telemetry', self.telemetry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, model='gpt-4-turbo'):
+        return {'model': model, 'messages': [{'role': 'user', 'content': 'x' * 400}]}
+
+    def test_calls_record_usage_cost_and_tags(self):
+        with llm_telemetry.tags(cvm_code=906, year=2021):
+            with llm_telemetry.track('openai', self.request()) as record:
+                record.response = completion('{}', {'prompt_tokens': 1000, 'completion_tokens': 100})
+        with llm_telemetry.track('openai', self.request()) as record:
+            record.cache_hit = True
+            record.response = completion('{}', {'prompt_tokens': 1000, 'completion_tokens': 100})
+        with self.assertRaises(RateLimited):
+            with llm_telemetry.track('openai', self.request()):
+                raise RateLimited()
+
+        frame = self.telemetry.frame()
+        self.assertEqual(frame.loc[0, 'cvm_code'], 906)
+        self.assertEqual(frame.loc[0, 'year'], 2021)
+        self.assertAlmostEqual(frame.loc[0, 'cost_usd'], 0.013)
+        self.assertEqual(frame.loc[1, 'cost_usd'], 0.0)
+        self.assertEqual(frame.loc[2, 'error'], 'RateLimited')
+
+        summary = self.telemetry.summary()
+        self.assertEqual((summary['calls'], summary['cache_hits'], summary['errors']), (3, 1, 1))
+        self.assertEqual(summary['prompt_tokens'], 1000)
+        self.assertEqual(summary['by_company'][0]['cvm_code'], 906)
+
+    def test_missing_usage_is_estimated(self):
+        with llm_telemetry.track('perplexity', self.request('mixtral-8x7b-instruct')) as record:
+            record.response = completion('y' * 40)
+        self.assertEqual((record.prompt_tokens, record.completion_tokens), (104, 10))
+        self.assertTrue(record.tokens_estimated)
+
+    def test_openmetrics_histograms_are_cumulative(self):
+        for latency in (0.3, 1.5, 45):
+            record = llm_telemetry.CallRecord('openai', self.request())
+            record.finish(completion('{}', {'prompt_tokens': 600, 'completion_tokens': 50}))
+            record.latency = latency
+            self.telemetry.add(record)
+        text = self.telemetry.openmetrics()
+        labels = 'provider="openai",model="gpt-4-turbo"'
+        self.assertIn(f'finllm_llm_request_duration_seconds_bucket{{{labels},le="0.5"}} 1', text)
+        self.assertIn(f'finllm_llm_request_duration_seconds_bucket{{{labels},le="2"}} 2', text)
+        self.assertIn(f'finllm_llm_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3', text)
+        self.assertIn(f'finllm_llm_tokens_total{{{labels},kind="prompt"}} 1800', text)
+        self.assertIn(f'finllm_llm_requests_total{{{labels},cache="miss",outcome="ok"}} 3', text)
+        self.assertTrue(text.endswith("# EOF\n"))
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.telemetry.write_report(directory)
+            self.assertEqual(sorted(os.listdir(directory)), ['calls.jsonl', 'metrics.prom', 'summary.json'])
+            with open(os.path.join(directory, 'summary.json')) as f:
+                self.assertEqual(json.load(f)['latency_seconds']['max'], 45)
+
+    @patch('openaicall.llm_cache.get_cache', return_value=None)
+    @patch('openaicall.llm_providers.get_provider')
+    def test_prediction_windows_are_tagged_and_retries_counted(self, mock_get_provider, _mock_cache):
+        attempts = {}
+
+        async def call(**request):
+            year = request['messages'][-1]['content']
+            attempts[year] = attempts.get(year, 0) + 1
+            if year == '2021' and attempts[year] == 1:
+                raise RateLimited()
+            return completion(json.dumps(dict(PREDICTION, Year=int(year))))
+
+        async def complete(request, stream=False, record=None):
+            return await llm_dispatch.dispatch(call, request, rate_limiter=llm_dispatch.RateLimiter(), record=record)
+        mock_get_provider.return_value.complete = complete
+
+        windows = [(2020, None, None), (2021, None, None)]
+        with patch('openaicall.prediction_windows', return_value=windows), \
+                patch('openaicall.create_prompt', side_effect=['2020', '2021']):
+            asyncio.run(openaicall.get_predictions_async(906))
+
+        frame = self.telemetry.frame().sort_values('year')
+        self.assertEqual(frame['cvm_code'].tolist(), [906, 906])
+        self.assertEqual(frame['year'].tolist(), [2020, 2021])
+        self.assertEqual(frame['retries'].tolist(), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
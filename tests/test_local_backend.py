@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+
+import fetcherv6
+import local_backend
+from tests.test_fetcherv6 import balance_rows, income_rows
+
+
+class TestLocalBackend(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        source_dir = self.tmp.name
+        balance_rows().to_csv(os.path.join(source_dir, 'balance_sheet.csv'), index=False)
+        income_rows().to_csv(os.path.join(source_dir, 'income_statement.csv'), index=False)
+        pd.DataFrame({'cvm_code': [1, 2], 'name': ['Alpha SA', 'Beta SA']}).to_csv(
+            os.path.join(source_dir, 'company.csv'), index=False)
+        self.path = os.path.join(source_dir, 'finllm.db')
+        local_backend.build_local_database(self.path, source_dir)
+        local_backend.use_local_backend(self.path)
+
+    def tearDown(self):
+        fetcherv6.set_database_url(None)
+        self.tmp.cleanup()
+
+    def test_statements_match_client_side_shaping(self):
+        with patch('fetcherv6.fetch_data', return_value=balance_rows()[lambda df: df['cvm_code'] == 1]):
+            expected = fetcherv6.fetch_balance_sheet(1)
+        pd.testing.assert_frame_equal(fetcherv6.fetch_balance_sheet(1), expected, check_dtype=False)
+
+    def test_bulk_fetch_expands_code_list(self):
+        statements = fetcherv6.fetch_income_statements([1, 2])
+        self.assertEqual(statements[1].loc['net_sales', 2020], 30.0)
+        self.assertEqual(statements[2].loc['net_income', 2021], 31.0)
+
+    def test_aggregation_runs_in_sqlite(self):
+        for cvm_code in (1, 2):
+            pd.testing.assert_frame_equal(
+                fetcherv6.fetch_income_statement(cvm_code, aggregate_in_db=True),
+                fetcherv6.fetch_income_statement(cvm_code, aggregate_in_db=False),
+                check_dtype=False,
+            )
+            pd.testing.assert_frame_equal(
+                fetcherv6.fetch_balance_sheet(cvm_code, aggregate_in_db=True),
+                fetcherv6.fetch_balance_sheet(cvm_code, aggregate_in_db=False),
+            )
+
+    def test_company_table_is_loaded(self):
+        self.assertEqual(fetcherv6.fetch_company_data().loc[2, 'name'], 'Beta SA')
+
+    def test_missing_database_is_reported(self):
+        with self.assertRaises(FileNotFoundError):
+            local_backend.use_local_backend(os.path.join(self.tmp.name, 'missing.db'))
+
+
+if __name__ == '__main__':
+    unittest.main()
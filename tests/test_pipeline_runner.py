@@ -0,0 +1,80 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+
+import pipeline_runner
+
+
+def fake_fetch(cvm_code):
+    if cvm_code == 3:
+        raise ConnectionError("database unavailable")
+    if cvm_code == 4:
+        return None
+    income = pd.DataFrame({'net_income': range(10)}, index=range(2011, 2021))
+    windows = [(year, income.loc[year - 5:year - 1], income.loc[year - 5:year - 1]) for year in (2019, 2020)]
+    return {'cvm_code': cvm_code, 'name': f"Company {cvm_code}", 'windows': windows,
+            'actual': pd.Series({2019: 1.0, 2020: -1.0})}
+
+
+async def slow_complete(request, provider='openai'):
+    await asyncio.sleep(0.05)
+    year = int(request['messages'][1]['content'])
+    content = json.dumps({'Year': year, 'earnings direction': 'increase', 'magnitude': 'small',
+                          'confidence score': 0.5, 'summary of rationale': 'Steady.'})
+    return {'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+
+
+@patch('pipeline_runner.llm_telemetry.telemetry.write_report')
+@patch('pipeline_runner.fetch_company', side_effect=fake_fetch)
+@patch('openaicall.complete', side_effect=slow_complete)
+@patch('openaicall.create_prompt', side_effect=lambda income, balance: str(income.index[-1] + 1))
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_companies_flow_through_every_stage(self, _prompt, _complete, _fetch, _report):
+        results, stats = pipeline_runner.analyze_universe([1, 2, 3, 4, 5], output_dir=self.tmp.name,
+                                                          workers={'predict': 2})
+
+        self.assertEqual(sorted(results['Company Name'].unique()), ['Company 1', 'Company 2', 'Company 5'])
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results.loc[results['Year'] == 2020, 'Actual Earnings Direction'].unique().tolist(),
+                         ['decrease'])
+        self.assertEqual(sorted(results['cvm_code'].unique()), [1, 2, 5])
+        self.assertIn('5_Company_5_earnings_analysis.csv', os.listdir(self.tmp.name))
+        with open(os.path.join(self.tmp.name, 'metrics.json')) as f:
+            self.assertEqual(json.load(f)['by_company']['5']['Company Name'], 'Company 5')
+        fetch = stats['stages']['fetch']
+        self.assertEqual((fetch['processed'], fetch['errors'], fetch['dropped']), (3, 1, 1))
+        self.assertEqual(stats['stages']['persist']['processed'], 3)
+        with open(os.path.join(self.tmp.name, 'pipeline_stats.json')) as f:
+            self.assertEqual(json.load(f)['companies'], 5)
+
+    def test_slow_predictions_do_not_hold_back_fetching(self, _prompt, _complete, _fetch, _report):
+        start = time.monotonic()
+        _, stats = pipeline_runner.analyze_universe(list(range(10, 30)), output_dir=self.tmp.name, queue_size=4,
+                                                    workers={'predict': 1})
+        stages = stats['stages']
+        # 20 companies, one at a time, two 50ms windows each in parallel
+        self.assertGreaterEqual(time.monotonic() - start, 1.0)
+        self.assertLess(stages['fetch']['seconds'], stages['predict']['seconds'])
+        self.assertLessEqual(stages['render']['queue_max'], 5)
+        self.assertEqual(stages['persist']['processed'], 20)
+
+    def test_select_companies_filters_the_table(self, *_mocks):
+        path = os.path.join(self.tmp.name, 'companies.csv')
+        pd.DataFrame({'cvm_code': [1, 2, 3], 'b3_sector': ['Energia', 'Saúde', 'Energia'],
+                      'available_years': [10, 12, 3]}).to_csv(path, index=False)
+        self.assertEqual(pipeline_runner.select_companies(path, min_years=5, sectors=['Energia']), [1])
+        self.assertEqual(pipeline_runner.select_companies(path, limit=2), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
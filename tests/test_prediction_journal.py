@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+
+import openaicall
+import prediction_journal
+
+PREDICTION = {'Year': 2021, 'earnings direction': 'increase', 'magnitude': 'small',
+              'confidence score': 0.7, 'summary of rationale': 'Margins widen.'}
+
+
+def reply(content):
+    return {'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+
+
+class TestPredictionJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'journal', 'predictions.jsonl')
+
+    def test_entries_survive_a_restart_and_a_torn_last_line(self):
+        journal = prediction_journal.PredictionJournal(self.path)
+        with patch('prediction_journal.os.fsync') as mock_fsync:
+            journal.append(906, 2021, 'gpt-4-turbo', 'window', 'openai', PREDICTION)
+        mock_fsync.assert_called_once()
+        with open(self.path, 'a') as f:
+            f.write('{"cvm_code": 906, "year": 20')
+
+        restarted = prediction_journal.PredictionJournal(self.path)
+        self.assertEqual(list(restarted.completed(906, 'gpt-4-turbo', 'window')), [2021])
+        self.assertEqual(restarted.completed(906, 'gpt-4-turbo', 'history'), {})
+        restarted.append(906, 2022, 'gpt-4-turbo', 'window', 'openai', dict(PREDICTION, Year=2022))
+
+        frame = prediction_journal.PredictionJournal(self.path).frame()
+        self.assertEqual(frame['year'].tolist(), [2021, 2022])
+
+
+@patch('openaicall.llm_cache.get_cache', return_value=None)
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        path = os.path.join(self.tmp.name, 'predictions.jsonl')
+        patcher = patch('prediction_journal.JOURNAL_PATH', path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.journal = prediction_journal.get_journal()
+        self.windows = [(year, pd.DataFrame({'net_income': [1.0]}), pd.DataFrame({'net_income': [1.0]}))
+                        for year in (2020, 2021, 2022)]
+
+    @patch('openaicall.complete')
+    def test_journaled_windows_are_not_requested_again(self, mock_complete, _mock_cache):
+        self.journal.append(906, 2021, 'gpt-4-turbo', 'window', 'openai', dict(PREDICTION, Year=2021))
+        mock_complete.side_effect = lambda request, provider: reply(
+            json.dumps(dict(PREDICTION, Year=int(request['messages'][1]['content']))))
+
+        with patch('openaicall.prediction_windows', return_value=self.windows), \
+                patch('openaicall.create_prompt', side_effect=['2020', '2021', '2022']):
+            predictions = openaicall.get_predictions(906)
+
+        self.assertEqual(predictions['Year'].tolist(), [2020, 2021, 2022])
+        self.assertEqual(mock_complete.call_count, 2)
+        self.assertEqual(sorted(self.journal.completed(906, 'gpt-4-turbo', 'window')), [2020, 2021, 2022])
+
+    def test_hedged_answers_are_journaled_under_the_serving_model(self, _mock_cache):
+        async def hedged(request, provider, parse=None):
+            year = int(request['messages'][1]['content'])
+            return None, dict(PREDICTION, Year=year), 'openai:gpt-4o' if year == 2021 else provider
+
+        with patch('openaicall.prediction_windows', return_value=self.windows), \
+                patch('openaicall.create_prompt', side_effect=['2020', '2021', '2022']), \
+                patch('openaicall.hedged_predict_window', side_effect=hedged):
+            openaicall.get_predictions(906)
+
+        self.assertEqual(sorted(self.journal.completed(906, 'gpt-4-turbo', 'window')), [2020, 2022])
+        self.assertEqual(self.journal.completed(906, 'gpt-4o', 'window')[2021]['provider'], 'openai:gpt-4o')
+
+    @patch('openaicall.complete')
+    def test_history_mode_asks_only_for_missing_years(self, mock_complete, _mock_cache):
+        self.journal.append(906, 2020, 'gpt-4-turbo', 'history', 'openai', dict(PREDICTION, Year=2020))
+        items = [dict(PREDICTION, Year=year) for year in (2021, 2022)]
+        mock_complete.return_value = reply(json.dumps({'predictions': items}))
+
+        with patch('openaicall.prediction_windows', return_value=self.windows):
+            predictions = openaicall.get_predictions(906, mode='history')
+
+        self.assertEqual(predictions['Year'].tolist(), [2020, 2021, 2022])
+        self.assertNotIn('provider', predictions)
+        self.assertIn("target years 2021, 2022", mock_complete.call_args.args[0]['messages'][1]['content'])
+        self.assertEqual(sorted(self.journal.completed(906, 'gpt-4-turbo', 'history')), [2020, 2021, 2022])
+
+
+if __name__ == '__main__':
+    unittest.main()
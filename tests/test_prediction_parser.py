@@ -0,0 +1,169 @@
+import asyncio
+import json
+import re
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+
+import openaicall
+from prediction_parser import JSONObjectScanner, parse_history_text, parse_prediction_text, repair_json
+
+PREDICTION = {'Year': 2021, 'earnings direction': 'increase', 'magnitude': 'small',
+              'confidence score': 0.7, 'summary of rationale': 'Margins widen.'}
+
+
+def reply(content):
+    return {'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+
+
+class TestParser(unittest.TestCase):
+    def test_fenced_reply_with_prose(self):
+        content = f"Sure!\n```json\n{json.dumps(PREDICTION, indent=2)}\n```\nLet me know."
+        self.assertEqual(parse_prediction_text(content), (PREDICTION, None))
+
+    def test_values_are_normalised(self):
+        raw = dict(PREDICTION, Year="2021", **{'earnings direction': 'Increase', 'confidence score': "0.7"})
+        prediction, error = parse_prediction_text(json.dumps(raw))
+        self.assertIsNone(error)
+        self.assertEqual(prediction, PREDICTION)
+
+    def test_common_defects_are_repaired(self):
+        content = ('{"Year": 2021, "earnings direction": "increase", "magnitude": "small", '
+                   '"confidence score": 0.7, "summary of rationale": “Margins\nwiden.”,}')
+        prediction, error = parse_prediction_text(content)
+        self.assertIsNone(error)
+        self.assertEqual(prediction['summary of rationale'], 'Margins widen.')
+
+    def test_truncated_reply_is_closed(self):
+        content = json.dumps(PREDICTION)[:-10]
+        prediction, error = parse_prediction_text(content)
+        self.assertEqual(prediction['Year'], 2021)
+        self.assertIsNone(error)
+
+    def test_schema_violations_are_reported(self):
+        prediction, error = parse_prediction_text('{"Year": 2021, "earnings direction": "sideways"}')
+        self.assertIn("missing 'magnitude'", error)
+        self.assertIn("'earnings direction' must be one of", error)
+        self.assertEqual(parse_prediction_text("I cannot predict that."), (None, "reply contains no JSON object"))
+
+    def test_scanner_completes_on_the_closing_brace(self):
+        scanner = JSONObjectScanner()
+        self.assertFalse(scanner.feed('x {"a": "}\\"{", "b": {'))
+        self.assertTrue(scanner.feed('"c": 1}} trailing'))
+        self.assertEqual(scanner.text, '{"a": "}\\"{", "b": {"c": 1}}')
+        self.assertEqual(repair_json('{"a": [1, 2,], }'), '{"a": [1, 2]}')
+
+    def test_history_reply_keeps_valid_years_in_order(self):
+        items = [dict(PREDICTION, Year=2022), dict(PREDICTION, Year=2021, magnitude='huge'), dict(PREDICTION, Year=2020)]
+        predictions, error = parse_history_text(json.dumps({'predictions': items}), [2020, 2021, 2022])
+        self.assertEqual([prediction['Year'] for prediction in predictions], [2020, 2022])
+        self.assertIn("prediction for 2021", error)
+        self.assertIn("no prediction for years [2021]", error)
+
+
+@patch('openaicall.llm_cache.get_cache', return_value=None)
+class TestReask(unittest.TestCase):
+    @patch('openaicall.complete')
+    def test_only_invalid_replies_are_re_asked(self, mock_complete, _mock_cache):
+        mock_complete.side_effect = [reply('The company looks healthy.'), reply(json.dumps(PREDICTION))]
+        request = openaicall.prediction_request('prompt')
+        response, prediction = asyncio.run(openaicall.predict_window(request))
+        self.assertEqual(prediction, PREDICTION)
+        reask = mock_complete.call_args_list[1].args[0]
+        self.assertEqual([message['role'] for message in reask['messages']], ['system', 'user', 'assistant', 'user'])
+        self.assertEqual(reask['response_format'], request['response_format'])
+
+    @patch('openaicall.complete')
+    def test_valid_reply_is_not_re_asked(self, mock_complete, _mock_cache):
+        mock_complete.return_value = reply(json.dumps(PREDICTION))
+        asyncio.run(openaicall.predict_window(openaicall.prediction_request('prompt')))
+        self.assertEqual(mock_complete.call_count, 1)
+
+    def test_response_format_follows_the_model(self, _mock_cache):
+        # gpt-4-turbo rejects json_schema: it gets JSON mode
+        self.assertEqual(openaicall.prediction_request('p')['response_format'], {'type': 'json_object'})
+        self.assertEqual(openaicall.history_request('p', [2020, 2021])['response_format'], {'type': 'json_object'})
+        self.assertNotIn('response_format', openaicall.prediction_request('p', 'perplexity'))
+
+    def test_every_configured_model_gets_a_format_it_supports(self, _mock_cache):
+        for provider, settings in openaicall.PREDICTION_SETTINGS.items():
+            model = settings['params']['model']
+            kind = openaicall.RESPONSE_FORMAT_TYPES.get(model)
+            for request in (openaicall.prediction_request('p', provider),
+                            openaicall.history_request('p', [2020, 2021], provider)):
+                with self.subTest(model=model):
+                    self.assertEqual(request.get('response_format', {}).get('type'), kind)
+
+    def test_schema_only_for_models_with_structured_outputs(self, _mock_cache):
+        with patch.dict(openaicall.PREDICTION_SETTINGS['openai']['params'], model='gpt-4o-2024-08-06'):
+            request = openaicall.prediction_request('p')
+            history = openaicall.history_request('p', [2020, 2021])
+        self.assertEqual(request['response_format']['json_schema']['name'], 'earnings_prediction')
+        self.assertEqual(history['response_format']['json_schema']['name'], 'earnings_predictions')
+        self.assertEqual(openaicall.hedge_request(request, 'openai', 'gpt-4o-mini')['response_format'],
+                         request['response_format'])
+        self.assertEqual(openaicall.hedge_request(request, 'openai')['response_format'], {'type': 'json_object'})
+        self.assertNotIn('response_format', openaicall.hedge_request(request, 'perplexity'))
+
+
+@patch('openaicall.llm_cache.get_cache', return_value=None)
+class TestHistoryMode(unittest.TestCase):
+    def windows(self):
+        income = pd.DataFrame({'net_income': range(10)}, index=range(2010, 2020))
+        return [(year, income.loc[year - 5:year - 1], income.loc[year - 5:year - 1]) for year in range(2015, 2020)]
+
+    @patch('openaicall.complete')
+    @patch('openaicall.prediction_windows')
+    def test_history_is_sent_once_and_split_per_year(self, mock_windows, mock_complete, _mock_cache):
+        mock_windows.return_value = self.windows()
+        items = [dict(PREDICTION, Year=year) for year in range(2015, 2020)]
+        mock_complete.return_value = reply(json.dumps({'predictions': items}))
+
+        predictions = openaicall.get_predictions(906, mode='history')
+
+        self.assertEqual(predictions['Year'].tolist(), list(range(2015, 2020)))
+        self.assertEqual(mock_complete.call_count, 1)
+        request = mock_complete.call_args.args[0]
+        prompt = request['messages'][1]['content']
+        # Every historical year appears once per statement; the last target year only in the target list
+        self.assertEqual(prompt.count('2014'), 2)
+        self.assertEqual(prompt.count('2019'), 1)
+        self.assertEqual(request['max_tokens'], 2500)
+        self.assertEqual(request['response_format'], {'type': 'json_object'})
+
+    @patch('openaicall.complete')
+    @patch('openaicall.prediction_windows')
+    def test_long_histories_are_split_within_the_output_limit(self, mock_windows, mock_complete, _mock_cache):
+        income = pd.DataFrame({'net_income': range(15)}, index=range(2005, 2020))
+        mock_windows.return_value = [(year, income.loc[year - 5:year - 1], income.loc[year - 5:year - 1])
+                                     for year in range(2010, 2020)]
+
+        def answer(request, *args, **kwargs):
+            targets = re.search(r"target years ([\d, ]+),", request['messages'][1]['content']).group(1)
+            items = [dict(PREDICTION, Year=int(year)) for year in targets.split(', ')]
+            return reply(json.dumps({'predictions': items}))
+        mock_complete.side_effect = answer
+
+        predictions = openaicall.get_predictions(906, mode='history')
+
+        self.assertEqual(predictions['Year'].tolist(), list(range(2010, 2020)))
+        requests_ = sorted((call.args[0] for call in mock_complete.call_args_list), key=lambda r: -r['max_tokens'])
+        self.assertEqual([request['max_tokens'] for request in requests_], [4000, 1000])
+        self.assertNotIn('2005', requests_[1]['messages'][1]['content'])
+
+    @patch('openaicall.complete')
+    @patch('openaicall.prediction_windows')
+    def test_incomplete_history_keeps_answered_years(self, mock_windows, mock_complete, _mock_cache):
+        mock_windows.return_value = self.windows()
+        partial = reply(json.dumps({'predictions': [dict(PREDICTION, Year=2016)]}))
+        mock_complete.return_value = partial
+
+        predictions = openaicall.get_predictions(906, mode='history')
+
+        self.assertEqual(predictions['Year'].tolist(), [2016])
+        self.assertEqual(mock_complete.call_count, 1 + openaicall.REASK_ATTEMPTS)
+
+
+if __name__ == '__main__':
+    unittest.main()
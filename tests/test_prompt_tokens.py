@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import patch
+import pandas as pd
+
+import fetcherv6
+import openaicall
+import prompt_tokens
+from synthetic_data import generate_dataset
+
+
+def window(table, date_column):
+    rows = generate_dataset(n_companies=1, n_years=5, frequency='annual', ragged=False)[table]
+    rows.index = pd.to_datetime(rows.pop(date_column)).dt.year
+    return rows.drop(columns=['cvm_code', 'statement_type'])
+
+
+class TestCompactPrompt(unittest.TestCase):
+    def setUp(self):
+        self.income = window('income_statement', 'period_end')
+        self.balance = window('balance_sheet', 'reference_date')
+        self.balance['check'] = self.balance['assets'] - self.balance['liabilities']
+
+    def test_statement_is_tsv_in_millions(self):
+        income = pd.DataFrame({'net_sales': [1234567890.0, 2e9], 'costs': [-1.0, -2.0], 'net_income': [-98765432.1, None]},
+                              index=[2020, 2021])
+        self.assertEqual(openaicall.render_statement(income, 'income_statement'),
+                         "account\t2020\t2021\nnet_sales\t1235\t2000\nnet_income\t-98.77\t")
+
+    def test_unregistered_accounts_are_rendered_in_full(self):
+        income = pd.DataFrame({'Revenue': [1e9, 2e9], 'Profit': [1e8, None]}, index=[2020, 2021])
+        with self.assertLogs(level='WARNING'):
+            rendered = openaicall.render_statement(income, 'income_statement')
+        self.assertEqual(rendered, "account\t2020\t2021\nRevenue\t1000\t2000\nProfit\t100\t")
+
+    def test_unregistered_balance_sheet_accounts_are_rendered_in_full(self):
+        # Shaped like fetch_datx_y's balance sheet: transposed, so every column is object dtype
+        rows = pd.DataFrame({'cvm_code': [1, 1], 'statement_type': ['con', 'con'],
+                             'reference_date': ['2020-12-31', '2021-12-31'],
+                             'assets': [1e9, 2e9], 'liabilities': [4e8, 5e8], 'loans': [1e8, None]})
+        balance = fetcherv6._shape_balance_sheet(rows).T
+        self.assertTrue((balance.dtypes == object).all())
+        with patch.dict(openaicall.CONSUMER_ACCOUNTS['compact_prompt'], balance_sheet=['equity']), \
+                self.assertLogs(level='WARNING'):
+            rendered = openaicall.render_statement(balance, 'balance_sheet')
+        self.assertEqual(rendered, "account\t2020\t2021\nassets\t1000\t2000\nliabilities\t400\t500\n"
+                                   "loans\t100\t\ncheck\t600\t1500")
+
+    def test_compact_prompt_keeps_instructions_and_drops_padding(self):
+        prompt = openaicall.create_prompt(self.income, self.balance, compact=True)
+        self.assertIn('"earnings direction"', prompt)
+        self.assertIn("(R$ millions)", prompt)
+        self.assertIn("\nassets\t", prompt)
+        self.assertNotIn("check", prompt)
+
+    def test_compact_prompt_uses_fewer_tokens(self):
+        counts = prompt_tokens.compare_prompt_tokens(self.income, self.balance)
+        self.assertLess(counts['compact_tokens'], counts['full_tokens'])
+        self.assertGreater(counts['saved'], 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+import sharding
+
+
+def companies(n=40):
+    return pd.DataFrame({'cvm_code': range(1000, 1000 + n), 'available_years': [(i * 7) % 13 for i in range(n)]})
+
+
+class TestSharding(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(sharding.parse_shard('2/4'), (2, 4))
+        for value in ('4/4', '-1/4', '1', 'a/b', '0/0'):
+            with self.assertRaises(ValueError):
+                sharding.parse_shard(value)
+
+    def test_shards_partition_the_universe(self):
+        table = companies()
+        for strategy in sharding.STRATEGIES:
+            parts = [sharding.shard_companies(table, i, 3, strategy) for i in range(3)]
+            codes = pd.concat(parts)['cvm_code']
+            self.assertEqual(sorted(codes), sorted(table['cvm_code']), strategy)
+            # The same table gives the same assignment, whatever its row order
+            shuffled = sharding.shard_companies(table.sample(frac=1, random_state=1), 1, 3, strategy)
+            self.assertEqual(sorted(shuffled['cvm_code']), sorted(parts[1]['cvm_code']), strategy)
+
+    def test_balanced_shards_even_out_the_weight(self):
+        table = companies()
+        loads = [sharding.shard_companies(table, i, 3, 'balanced')['available_years'].clip(lower=1).sum()
+                 for i in range(3)]
+        self.assertLessEqual(max(loads) - min(loads), table['available_years'].max())
+
+    def test_merge_combines_shard_outputs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            rows = {
+                0: [(1, 'A', 2020, 'increase', 'increase'), (1, 'A', 2021, 'decrease', 'increase')],
+                # Another company trading under the same name, and a row repeated from shard 0
+                1: [(2, 'A', 2020, 'increase', 'decrease'), (2, 'A', 2021, 'decrease', 'decrease'),
+                    (1, 'A', 2021, 'decrease', 'increase')],
+            }
+            run_dirs = []
+            for index, shard_rows in rows.items():
+                run_dir = os.path.join(tmp, f"shard-{index}")
+                os.makedirs(os.path.join(run_dir, 'telemetry'))
+                pd.DataFrame(shard_rows, columns=['cvm_code', 'Company Name', 'Year', 'Actual Earnings Direction',
+                                                  'Predicted Earnings Direction']
+                             ).to_csv(os.path.join(run_dir, 'earnings_analysis.csv'), index=False)
+                with open(os.path.join(run_dir, 'pipeline_stats.json'), 'w') as f:
+                    json.dump({'shard': {'index': index, 'count': 3},
+                               'stages': {'predict': {'processed': 1, 'errors': index, 'seconds': 2.0 + index}}}, f)
+                pd.DataFrame([{'cvm_code': index, 'provider': 'openai', 'model': 'gpt-4-turbo', 'cache_hit': False,
+                               'latency': 1.0, 'retries': 0, 'prompt_tokens': 10, 'completion_tokens': 5}]
+                             ).to_json(os.path.join(run_dir, 'telemetry', 'calls.jsonl'), orient='records', lines=True)
+                run_dirs.append(run_dir)
+
+            output = os.path.join(tmp, 'merged')
+            companies = pd.DataFrame({'cvm_code': [1, 2], 'trade_name': ['A', 'A'], 'b3_sector': ['Energy', 'Retail']})
+            with self.assertLogs(level='WARNING'):
+                report = sharding.merge_runs(run_dirs, output, companies)
+
+            merged = pd.read_csv(os.path.join(output, 'earnings_analysis.csv'))
+            self.assertEqual(merged[['cvm_code', 'Year']].values.tolist(), [[1, 2020], [1, 2021], [2, 2020], [2, 2021]])
+            self.assertEqual(report['companies'], 2)
+            self.assertEqual(report['missing_shards'], {'3': [2]})
+            self.assertEqual(report['overall']['accuracy'], 0.5)
+            self.assertEqual(report['by_company'][1]['precision'], 0.5)
+            self.assertEqual(report['by_company'][2]['Company Name'], 'A')
+            self.assertEqual(report['by_sector']['Retail']['accuracy'], 0.5)
+            self.assertEqual(report['stages']['predict'], {'processed': 2, 'dropped': 0, 'errors': 1, 'seconds': 3.0})
+            with open(os.path.join(output, 'telemetry', 'summary.json')) as f:
+                self.assertEqual(json.load(f)['calls'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
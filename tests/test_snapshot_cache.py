@@ -0,0 +1,98 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+import pandas as pd
+
+import fetcherv6
+import snapshot_cache
+
+
+def income_rows(dates, values, cvm_code=1):
+    return pd.DataFrame({
+        'cvm_code': [cvm_code] * len(dates),
+        'period_end': dates,
+        'net_income': values,
+    })
+
+
+class TestSnapshotCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir_patch = patch.object(snapshot_cache, 'SNAPSHOT_DIR', self.tmpdir.name)
+        self.dir_patch.start()
+        snapshot_cache._loaded.clear()
+
+    def tearDown(self):
+        self.dir_patch.stop()
+        self.tmpdir.cleanup()
+        fetcherv6.set_data_source("remote")
+
+    @patch('snapshot_cache.fetch_data')
+    @patch('snapshot_cache.fetch_data_chunks')
+    def test_incremental_refresh_uses_high_water_mark(self, mock_chunks, mock_fetch_data):
+        mock_chunks.return_value = iter([
+            income_rows(['2020-12-31', '2021-12-31'], [1.0, 2.0]),
+            income_rows(['2021-12-31'], [10.0], cvm_code=2),
+        ])
+        metadata = snapshot_cache.refresh_snapshot('income_statement')
+        self.assertEqual(metadata['rows'], 3)
+        self.assertEqual(snapshot_cache.read_metadata('income_statement')['high_water_mark'], '2021-12-31')
+        mock_fetch_data.assert_not_called()
+
+        # A restated 2021 figure plus a new 2022 filing
+        mock_fetch_data.return_value = income_rows(['2021-12-31', '2022-12-31'], [2.5, 3.0])
+        metadata = snapshot_cache.refresh_snapshot('income_statement')
+        query, params = mock_fetch_data.call_args[0]
+        self.assertIn('period_end >= :since', query)
+        self.assertEqual(str(params['since']), '2021-07-04')
+        self.assertEqual(metadata['rows'], 4)
+        self.assertEqual(snapshot_cache.read_metadata('income_statement')['high_water_mark'], '2022-12-31')
+
+        rows = snapshot_cache.load_snapshot('income_statement', [1])
+        self.assertEqual(rows['net_income'].tolist(), [1.0, 2.5, 3.0])
+        self.assertTrue(snapshot_cache.load_snapshot('income_statement', [3]).empty)
+
+    @patch('snapshot_cache.fetch_data_chunks')
+    def test_force_refresh_streams_whole_table(self, mock_chunks):
+        mock_chunks.return_value = iter([income_rows(['2020-12-31'], [1.0])])
+        snapshot_cache.refresh_snapshot('income_statement')
+        chunk = income_rows(['2019-12-31'], [None])
+        mock_chunks.return_value = iter([chunk, income_rows(['2019-12-31'], [0.5], cvm_code=2)])
+        metadata = snapshot_cache.refresh_snapshot('income_statement', force=True)
+        self.assertEqual(metadata['high_water_mark'], '2019-12-31')
+        rows = snapshot_cache.load_snapshot('income_statement')
+        self.assertEqual(rows['cvm_code'].tolist(), [1, 2])
+        self.assertEqual(rows['net_income'].tolist()[1], 0.5)
+
+    @patch('fetcherv6.fetch_data')
+    @patch('snapshot_cache.fetch_data_chunks')
+    def test_fetch_functions_served_from_snapshot(self, mock_chunks, mock_remote_fetch):
+        rows = income_rows(['2020-06-30', '2020-12-31', '2021-12-31'], [1.0, 2.0, 4.0])
+        mock_chunks.return_value = iter([rows.copy()])
+        snapshot_cache.refresh_snapshot('income_statement')
+
+        mock_remote_fetch.return_value = rows.copy()
+        remote = fetcherv6.fetch_income_statement(1)
+
+        fetcherv6.set_data_source("snapshot")
+        mock_remote_fetch.reset_mock()
+        local = fetcherv6.fetch_income_statement(1)
+        mock_remote_fetch.assert_not_called()
+        pd.testing.assert_frame_equal(local, remote)
+
+    @patch('fetcherv6.get_engine', side_effect=EnvironmentError("Missing environment variables"))
+    @patch('snapshot_cache.fetch_data_chunks')
+    def test_snapshot_aggregates_in_pandas_without_the_database(self, mock_chunks, _mock_engine):
+        mock_chunks.return_value = iter([income_rows(['2020-06-30', '2020-12-31', '2021-12-31'], [1.0, None, 4.0])])
+        snapshot_cache.refresh_snapshot('income_statement')
+        fetcherv6.set_data_source("snapshot")
+
+        aggregated = fetcherv6.fetch_income_statement(1, aggregate_in_db=True)
+        with patch('fetcherv6.AGGREGATE_IN_DB', True):
+            bulk = fetcherv6.fetch_income_statements([1])[1]
+        pd.testing.assert_frame_equal(aggregated, fetcherv6.fetch_income_statement(1, aggregate_in_db=False))
+        pd.testing.assert_frame_equal(bulk, aggregated)
+        self.assertEqual(aggregated.loc['net_income', 2020], 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
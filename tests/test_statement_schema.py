@@ -0,0 +1,30 @@
+import unittest
+
+from statement_schema import accounts_for, project, STATEMENT_ACCOUNTS
+
+
+class TestStatementSchema(unittest.TestCase):
+    def test_consumer_accounts(self):
+        self.assertEqual(accounts_for('balance_sheet', 'balance_check'), ['assets', 'liabilities'])
+        self.assertIn('net_income', accounts_for('income_statement', 'compact_prompt'))
+        self.assertEqual(accounts_for('cash_flow', 'compact_prompt'), [])
+        self.assertEqual(accounts_for('income_statement'), STATEMENT_ACCOUNTS['income_statement'])
+
+    def test_balance_check_inputs_are_always_included(self):
+        self.assertEqual(accounts_for('balance_sheet', []), ['assets', 'liabilities'])
+
+    def test_unknown_names_raise(self):
+        with self.assertRaises(ValueError):
+            accounts_for('income_statement', 'prompt')
+        with self.assertRaises(ValueError):
+            accounts_for('statement_of_changes')
+
+    def test_project_keeps_table_order(self):
+        columns = ['cvm_code', 'period_end', 'net_income', 'net_sales', 'other']
+        self.assertEqual(project('income_statement', columns, ['net_sales', 'net_income']),
+                         ['cvm_code', 'period_end', 'net_income', 'net_sales'])
+        self.assertIsNone(project('income_statement', columns, ['ebit']))
+
+
+if __name__ == '__main__':
+    unittest.main()
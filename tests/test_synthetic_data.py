@@ -0,0 +1,40 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+import synthetic_data
+from benchmarks.bench_data_layer import compare, run_benchmarks
+from statement_schema import STATEMENT_ACCOUNTS
+
+
+class TestSyntheticData(unittest.TestCase):
+    def test_same_seed_gives_same_tables(self):
+        first = synthetic_data.generate_dataset(20, 5, seed=3)
+        second = synthetic_data.generate_dataset(20, 5, seed=3)
+        for table in first:
+            pd.testing.assert_frame_equal(first[table], second[table])
+        other = synthetic_data.generate_dataset(20, 5, seed=4)
+        self.assertFalse(first['income_statement']['net_sales'].equals(other['income_statement']['net_sales']))
+
+    def test_tables_have_the_statement_layout(self):
+        dataset = synthetic_data.generate_dataset(10, 4, frequency='quarterly', ragged=False)
+        self.assertEqual(len(dataset['balance_sheet']), 10 * 4 * 4)
+        self.assertEqual(list(dataset['income_statement'].columns),
+                         ['cvm_code', 'statement_type', 'period_end'] + STATEMENT_ACCOUNTS['income_statement'])
+        self.assertTrue((dataset['company']['available_years'] == 4).all())
+        balance = dataset['balance_sheet']
+        np.testing.assert_allclose(balance['assets'], balance['current_assets'] + balance['noncurrent_assets'], atol=0.02)
+        income = dataset['income_statement']
+        np.testing.assert_allclose(income['net_income'], income['income_before_taxes'] + income['taxes'], atol=0.02)
+
+    def test_benchmarks_run_on_a_small_dataset(self):
+        results = run_benchmarks(n_companies=5, n_years=3, sample=2, repeat=1,
+                                 only=['fetch_balance_sheet', 'fetch_balance_sheets'])
+        self.assertEqual(set(results), {'fetch_balance_sheet', 'fetch_balance_sheets'})
+        self.assertGreater(results['fetch_balance_sheets']['throughput'], 0)
+        slower = {name: dict(result, throughput=result['throughput'] / 2) for name, result in results.items()}
+        self.assertEqual(set(compare(slower, results, tolerance=0.25)), set(results))
+
+
+if __name__ == '__main__':
+    unittest.main()